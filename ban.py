@@ -1,5 +1,7 @@
 from config import bot, MODERATOR_ID
 from db_manager import db_manager
+from player_cache import player_cache
+from leaderboard import leaderboard
 
 
 def setup(bot):
@@ -31,6 +33,8 @@ def setup(bot):
             db_manager.execute(
                 "players", "DELETE FROM players WHERE playername = ?", (nickname,)
             )
+            player_cache.invalidate(playername=nickname)
+            leaderboard.remove(nickname)
 
             await ctx.send(f"✅ Игрок {nickname} полностью удален из системы")
             print(f"[DELETE] Игрок {nickname} удален модератором {ctx.author.name}")
@@ -59,6 +63,7 @@ def setup(bot):
                 "UPDATE players SET isbanned = 1 WHERE playername = ?",
                 (nickname,),
             )
+            player_cache.update(playername=nickname, isbanned=1)
             await ctx.send(f"✅ Игрок {nickname} успешно забанен")
             print(f"[BAN] Игрок {nickname} забанен модератором {ctx.author.name}")
         except Exception as e:
@@ -86,6 +91,7 @@ def setup(bot):
                 "UPDATE players SET isbanned = 0 WHERE playername = ?",
                 (nickname,),
             )
+            player_cache.update(playername=nickname, isbanned=0)
             await ctx.send(f"✅ Игрок {nickname} успешно разбанен")
             print(f"[UNBAN] Игрок {nickname} разбанен модератором {ctx.author.name}")
         except Exception as e:
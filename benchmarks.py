@@ -0,0 +1,840 @@
+"""Нагрузочные замеры для компонентов бота.
+
+Запуск: ``python benchmarks.py <имя>`` (без аргумента - список замеров).
+Замеры используют временные базы и не трогают рабочие файлы бота.
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from db_manager import DBManager, AsyncDBManager, HOT_QUERIES, MIGRATIONS
+from player_cache import PlayerCache
+from matchmaker import (
+    ModeQueue,
+    RatingWindow,
+    MatchmakingStats,
+    take_greedy_pairs,
+    pair_batch,
+    nearest_in_queues,
+)
+from scheduler import DeadlineScheduler
+from dispatcher import OutboundDispatcher
+from user_cache import UserResolver
+from elo_replay import replay_ratings, replay_from_db, diff_ratings, load_history
+from leaderboard import Leaderboard, RenderCache, LEADERBOARD_COLUMNS
+
+
+def _temp_db_files(tmpdir):
+    return {
+        "players": os.path.join(tmpdir, "players.db"),
+        "matches": os.path.join(tmpdir, "matches.db"),
+        "tournaments": os.path.join(tmpdir, "tournaments.db"),
+    }
+
+
+async def _measure_loop_lag(workload, interval=0.005):
+    """Запускает workload и параллельно меряет задержку event loop"""
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(time.perf_counter() - started - interval)
+
+    ticker_task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await workload()
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticker_task
+
+    lags.sort()
+    return {
+        "elapsed": elapsed,
+        "max_lag_ms": lags[-1] * 1000 if lags else 0.0,
+        "p99_lag_ms": lags[int(len(lags) * 0.99)] * 1000 if lags else 0.0,
+        "mean_lag_ms": sum(lags) / len(lags) * 1000 if lags else 0.0,
+    }
+
+
+def bench_db_loop_lag(writes=3000, burst=50):
+    """Задержка event loop при интенсивной записи: синхронный vs асинхронный API"""
+    # Записи идут пачками по burst штук, как при массовом обновлении рейтингов
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manager = DBManager(_temp_db_files(tmpdir))
+        adb = AsyncDBManager(manager)
+
+        manager.executemany(
+            "players",
+            "INSERT INTO players (playername, discordid) VALUES (?, ?)",
+            [(f"player{i}", str(i)) for i in range(1000)],
+        )
+
+        query = "UPDATE players SET in_queue = 1 - in_queue WHERE playername = ?"
+
+        async def sync_writes():
+            for i in range(writes):
+                manager.execute("players", query, (f"player{i % 1000}",))
+                if i % burst == 0:
+                    await asyncio.sleep(0)
+
+        async def async_writes():
+            for i in range(writes):
+                await adb.execute("players", query, (f"player{i % 1000}",))
+
+        sync_result = asyncio.run(_measure_loop_lag(sync_writes))
+        async_result = asyncio.run(_measure_loop_lag(async_writes))
+        manager.close_all()
+        adb.close()
+
+    for name, result in (("sync", sync_result), ("async", async_result)):
+        print(
+            f"{name:>5}: {writes} записей за {result['elapsed']:.2f} c, "
+            f"лаг loop: max {result['max_lag_ms']:.1f} мс, "
+            f"p99 {result['p99_lag_ms']:.1f} мс, "
+            f"среднее {result['mean_lag_ms']:.2f} мс"
+        )
+
+
+def bench_query_plans(history=200000, players=5000, lookups=2000):
+    """Горячие запросы на большой истории матчей: планы и время с индексами и без"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manager = DBManager(_temp_db_files(tmpdir))
+        manager.executemany(
+            "players",
+            "INSERT INTO players (playername, discordid, in_queue) VALUES (?, ?, ?)",
+            [(f"player{i}", str(i), int(i % 100 == 0)) for i in range(players)],
+        )
+        # Примерно 1% матчей активны - как в рабочей базе с длинной историей
+        manager.executemany(
+            "matches",
+            """
+            INSERT INTO matches (mode, player1, player2, isover, start_time, matchtype, tournament_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    1,
+                    f"player{random.randrange(players)}",
+                    f"player{random.randrange(players)}",
+                    int(i < history * 0.99),
+                    "2024-01-01 00:00:00",
+                    1 if i % 10 else 2,
+                    str(i % 50) if i % 10 == 0 else "0",
+                )
+                for i in range(history)
+            ],
+        )
+        # Статистика устаревает по мере роста истории, её обновляет PRAGMA optimize
+        manager.execute("matches", "ANALYZE")
+        manager.execute("players", "ANALYZE")
+
+        lookup = (
+            "SELECT matchid FROM matches "
+            "WHERE ((player1 = ? AND isover = 0) OR (player2 = ? AND isover = 0)) "
+            "AND matchtype = 1"
+        )
+        names = [f"player{random.randrange(players)}" for _ in range(lookups)]
+
+        def timed():
+            started = time.perf_counter()
+            for name in names:
+                manager.fetchone("matches", lookup, (name, name))
+            return (time.perf_counter() - started) / lookups * 1e6
+
+        problems = manager.check_query_plans()
+        with_indexes = timed()
+
+        for db_type in ("players", "matches"):
+            for row in manager.fetchall(
+                db_type,
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'",
+            ):
+                manager.execute(db_type, f"DROP INDEX {row[0]}")
+        # Новые соединения - иначе EXPLAIN вернет закешированный старый план
+        manager.close_all()
+        without_indexes = timed()
+        problems_without = manager.check_query_plans()
+        manager.close_all()
+
+    print(f"история: {history} матчей, игроков: {players}")
+    print(f"запросов с полным проходом: {len(problems)} из {len(HOT_QUERIES)} (без индексов: {len(problems_without)})")
+    for query, plan in problems:
+        print(f"  {query}\n    {plan}")
+    print(f"поиск активного матча игрока: {with_indexes:.1f} мкс с индексами, {without_indexes:.1f} мкс без")
+    print(f"версии схемы: " + ", ".join(f"{t} v{len(m)}" for t, m in MIGRATIONS.items()))
+    if problems:
+        sys.exit(1)
+
+
+def bench_player_cache(players=5000, lookups=100000):
+    """Поиск игрока по discordid: запрос к SQLite vs PlayerCache"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manager = DBManager(_temp_db_files(tmpdir))
+        manager.executemany(
+            "players",
+            "INSERT INTO players (playername, discordid) VALUES (?, ?)",
+            [(f"player{i}", str(i)) for i in range(players)],
+        )
+        cache = PlayerCache(manager)
+        ids = [random.randrange(players) for _ in range(lookups)]
+
+        started = time.perf_counter()
+        for discord_id in ids:
+            manager.fetchone(
+                "players",
+                "SELECT isbanned FROM players WHERE discordid = ?",
+                (str(discord_id),),
+            )
+        sql_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for discord_id in ids:
+            cache.by_discordid(discord_id)
+        cache_time = time.perf_counter() - started
+        manager.close_all()
+
+    stats = cache.stats()
+    print(f"SQLite: {sql_time / lookups * 1e6:.2f} мкс на поиск")
+    print(
+        f"кеш:    {cache_time / lookups * 1e6:.2f} мкс на поиск "
+        f"(попаданий {stats['hits']}, промахов {stats['misses']})"
+    )
+
+
+def _queued_players(count, seed=1):
+    rng = random.Random(seed)
+    started = datetime.now() - timedelta(hours=1)
+    return [
+        {
+            "discord_id": i,
+            "nickname": f"player{i}",
+            "rating": int(rng.gauss(1000, 200)),
+            "channel_id": 0,
+            "join_time": started + timedelta(milliseconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+def bench_queue_index(players=10000, lookups=2000, pairings=500):
+    """Очередь из 10k игроков: список с линейным поиском vs ModeQueue"""
+    queued = _queued_players(players)
+    rng = random.Random(2)
+    ratings = [rng.randint(400, 1600) for _ in range(lookups)]
+    leaving = rng.sample(queued, lookups)
+    results = {}
+
+    # Старая схема: список, линейный поиск, пересборка при выходе
+    queue = list(queued)
+    started = time.perf_counter()
+    for rating in ratings:
+        min(queue, key=lambda p: abs(rating - p["rating"]))
+    results["nearest", "list"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for player in leaving:
+        queue = [p for p in queue if p["discord_id"] != player["discord_id"]]
+    results["leave", "list"] = time.perf_counter() - started
+
+    queue = list(queued)
+    started = time.perf_counter()
+    for _ in range(pairings):
+        queue.sort(key=lambda x: x["join_time"])
+        player1 = queue.pop(0)
+        player2 = min(queue, key=lambda p: abs(player1["rating"] - p["rating"]))
+        queue.remove(player2)
+    results["pairing", "list"] = time.perf_counter() - started
+
+    # ModeQueue
+    queue = ModeQueue(queued)
+    started = time.perf_counter()
+    for rating in ratings:
+        queue.nearest(rating)
+    results["nearest", "index"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for player in leaving:
+        queue.discard(player["discord_id"])
+    results["leave", "index"] = time.perf_counter() - started
+
+    queue = ModeQueue(queued)
+    started = time.perf_counter()
+    for _ in range(pairings):
+        player1 = queue.oldest()
+        player2 = queue.nearest(player1["rating"], lambda p: p is player1)
+        queue.remove(player1)
+        queue.remove(player2)
+    results["pairing", "index"] = time.perf_counter() - started
+
+    print(f"игроков в очереди: {players}")
+    for operation, count in (
+        ("nearest", lookups),
+        ("leave", lookups),
+        ("pairing", pairings),
+    ):
+        old = results[operation, "list"] / count * 1e6
+        new = results[operation, "index"] / count * 1e6
+        print(
+            f"{operation:>8}: список {old:9.1f} мкс, ModeQueue {new:7.1f} мкс "
+            f"(x{old / new:.0f})"
+        )
+
+
+def _simulate_matchmaking(pairing, arrivals, duration, tick, stats=None):
+    """Прогоняет поток игроков через очередь с проходами матчмейкера раз в tick секунд"""
+    start = datetime(2024, 1, 1)
+    queue = ModeQueue()
+    gaps, waits = [], []
+    pending = iter(arrivals)
+    upcoming = next(pending, None)
+    pairing_time = 0.0
+
+    for second in range(0, duration + tick, tick):
+        now = start + timedelta(seconds=second)
+        while upcoming is not None and upcoming["join_time"] <= now:
+            queue.append(upcoming)
+            upcoming = next(pending, None)
+
+        started = time.perf_counter()
+        pairs = pairing(queue, now)
+        pairing_time += time.perf_counter() - started
+        for player1, player2 in pairs:
+            gaps.append(abs(player1["rating"] - player2["rating"]))
+            if stats is not None:
+                stats.record(1, player1, player2, now)
+            waits.extend(
+                (now - p["join_time"]).total_seconds() for p in (player1, player2)
+            )
+
+    gaps.sort()
+    return {
+        "matches": len(gaps),
+        "gap_mean": sum(gaps) / len(gaps) if gaps else 0.0,
+        "gap_p90": gaps[int(len(gaps) * 0.9)] if gaps else 0,
+        "wait_mean": sum(waits) / len(waits) if waits else 0.0,
+        "left": len(queue),
+        "pairing_ms": pairing_time * 1000,
+    }
+
+
+def _arrivals(duration, rate, burst, burst_every):
+    """Поток игроков: пуассоновские приходы плюс периодические всплески"""
+    rng = random.Random(3)
+    start = datetime(2024, 1, 1)
+    arrivals = []
+    second = 0.0
+    while second < duration:
+        second += rng.expovariate(rate)
+        arrivals.append(second)
+    # Всплески - например, после окончания раунда турнира
+    for burst_start in range(burst_every, duration, burst_every):
+        arrivals.extend(burst_start + rng.random() * 30 for _ in range(burst))
+    arrivals.sort()
+    return [
+        {
+            "discord_id": i,
+            "nickname": f"player{i}",
+            "rating": int(rng.gauss(1000, 250)),
+            "channel_id": 0,
+            "join_time": start + timedelta(seconds=at),
+        }
+        for i, at in enumerate(arrivals)
+    ]
+
+
+def bench_batch_pairing(
+    duration=4 * 3600, rate=0.03, tick=15, burst=32, burst_every=1800
+):
+    """Симуляция: жадный vs пакетный подбор (разница рейтингов и ожидание)"""
+    players = _arrivals(duration, rate, burst, burst_every)
+
+    def greedy(queue, now):
+        return take_greedy_pairs(queue)
+
+    def batch(queue, now):
+        pairs = pair_batch(list(queue), now)
+        if pairs is None:
+            return take_greedy_pairs(queue)
+        for player1, player2 in pairs:
+            queue.remove(player1)
+            queue.remove(player2)
+        return pairs
+
+    print(
+        f"{len(players)} игроков за {duration // 3600} ч, проход раз в {tick} с, "
+        f"всплески по {burst} игроков раз в {burst_every // 60} мин"
+    )
+    for name, pairing in (("greedy", greedy), ("batch", batch)):
+        result = _simulate_matchmaking(pairing, players, duration, tick)
+        print(
+            f"{name:>6}: матчей {result['matches']}, разница рейтингов "
+            f"средн. {result['gap_mean']:.0f} / p90 {result['gap_p90']}, "
+            f"ожидание средн. {result['wait_mean']:.0f} с, "
+            f"осталось в очереди {result['left']}, "
+            f"расчет {result['pairing_ms']:.0f} мс"
+        )
+
+
+def bench_rating_window(
+    duration=4 * 3600, rate=0.01, tick=15, burst=16, burst_every=3600
+):
+    """Симуляция при малом онлайне: подбор без окна vs расширяющееся окно рейтинга"""
+    players = _arrivals(duration, rate, burst, burst_every)
+    window = RatingWindow(start=100, per_second=3)
+
+    strategies = (
+        ("без окна", lambda queue, now: take_greedy_pairs(queue)),
+        ("окно", lambda queue, now: take_greedy_pairs(queue, window=window, now=now)),
+    )
+    print(f"{len(players)} игроков за {duration // 3600} ч, окно 100 + 3/с")
+    for name, pairing in strategies:
+        stats = MatchmakingStats()
+        result = _simulate_matchmaking(pairing, players, duration, tick, stats)
+        print(
+            f"{name:>9}: матчей {result['matches']}, разница рейтингов "
+            f"средн. {result['gap_mean']:.0f} / p90 {result['gap_p90']}, "
+            f"ожидание средн. {result['wait_mean']:.0f} с"
+        )
+        for label, matches, gap_mean in stats.summary(1)["by_wait"]:
+            print(f"{'':>11}ожидание {label}: {matches} матчей, разница {gap_mean:.0f}")
+
+
+def bench_any_queue(trials=500, queued=30, tick=15, limit=1800):
+    """Игрок "Any" против очередей режимов: поиск по суммарному ELO vs по рейтингу режима"""
+    rng = random.Random(9)
+    start = datetime(2024, 1, 1)
+    modes = (1, 2, 3)
+    windows = {mode: RatingWindow(start=100, per_second=3) for mode in modes}
+    keys = {
+        "суммарный ELO": lambda ratings: {mode: sum(ratings.values()) for mode in modes},
+        "ELO режима": lambda ratings: ratings,
+    }
+    results = {name: ([], []) for name in keys}
+    for trial in range(trials):
+        queues = {
+            mode: ModeQueue(
+                {
+                    "discord_id": mode * 1000 + i,
+                    "nickname": f"p{i}",
+                    "rating": rng.randint(800, 1200),
+                    "join_time": start,
+                }
+                for i in range(queued)
+            )
+            for mode in modes
+        }
+        ratings = {mode: rng.randint(800, 1200) for mode in modes}
+        player = {
+            "discord_id": 0,
+            "nickname": "any",
+            "rating": sum(ratings.values()),
+            "join_time": start,
+        }
+        for name, key in keys.items():
+            waits, gaps = results[name]
+            for second in range(0, limit + tick, tick):
+                now = start + timedelta(seconds=second)
+                found = nearest_in_queues(player, key(ratings), queues, windows, now)
+                if found:
+                    mode, opponent, _ = found
+                    waits.append(second)
+                    gaps.append(abs(ratings[mode] - opponent["rating"]))
+                    break
+
+    print(f"{trials} игроков Any, очереди режимов по {queued} игроков, окно 100 + 3/с")
+    for name, (waits, gaps) in results.items():
+        waits.sort()
+        print(
+            f"{name:>14}: подобрано {len(waits)}, ожидание средн. "
+            f"{sum(waits) / max(len(waits), 1):.0f} с / p90 "
+            f"{waits[int(len(waits) * 0.9)] if waits else 0} с, разница "
+            f"рейтингов режима средн. {sum(gaps) / max(len(gaps), 1):.0f}"
+        )
+
+
+def bench_deadline_scheduler(matches=100000, spread=3.0, cluster=500, sweep=300):
+    """Дедлайны матчей: точность срабатывания и стоимость операций DeadlineScheduler"""
+    now = datetime.now()
+    scheduler = DeadlineScheduler(None)
+    start = time.perf_counter()
+    for match_id in range(matches):
+        scheduler.schedule(match_id, now + timedelta(seconds=random.uniform(0, 3600)))
+    for match_id in range(0, matches, 2):  # половина матчей завершается с результатом
+        scheduler.cancel(match_id)
+    fired = len(scheduler.pop_due(now + timedelta(hours=2)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{matches} schedule + {matches // 2} cancel + pop_due ({fired} дедлайнов): "
+        f"{elapsed * 1000:.0f} мс"
+    )
+
+    async def run():
+        lateness = []
+        batches = []
+
+        async def callback(keys):
+            fired_at = datetime.now()
+            batches.append(len(keys))
+            lateness.extend((fired_at - deadlines[key]).total_seconds() for key in keys)
+
+        scheduler = DeadlineScheduler(callback)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0)
+        base = datetime.now()
+        deadlines = {}
+        for key in range(200):
+            deadlines[key] = base + timedelta(seconds=random.uniform(0.1, spread))
+        # Пачка матчей, созданных одновременно (например, старт турнира)
+        for key in range(200, 200 + cluster):
+            deadlines[key] = base + timedelta(seconds=spread / 2)
+        for key, deadline in deadlines.items():
+            scheduler.schedule(key, deadline)
+        await asyncio.sleep(spread + 1.5)
+        task.cancel()
+        return lateness, batches
+
+    lateness, batches = asyncio.run(run())
+    lateness.sort()
+    print(
+        f"{len(lateness)} дедлайнов за {spread:.0f} с: {len(batches)} вызовов callback "
+        f"(крупнейшая пачка {max(batches)}), опоздание средн. "
+        f"{sum(lateness) / len(lateness) * 1000:.1f} мс, max {lateness[-1] * 1000:.1f} мс"
+    )
+    print(f"опрос раз в {sweep} с: опоздание средн. {sweep / 2:.0f} с, max {sweep} с")
+
+
+class _FakeTarget:
+    """Адресат с задержкой отправки и лимитом Discord (5 сообщений за 5 с)"""
+
+    def __init__(self, latency, log):
+        self.latency = latency
+        self.log = log
+        self.sent = []
+
+    async def send(self, content=None, embed=None, embeds=None):
+        now = time.perf_counter()
+        recent = [t for t in self.sent if now - t < 5.0]
+        await asyncio.sleep(self.latency)
+        if len(recent) >= 5:
+            # discord.py сам ждет retry_after при 429
+            await asyncio.sleep(5.0 - (now - recent[0]))
+        self.sent.append(time.perf_counter())
+        self.log.append(time.perf_counter())
+
+
+class _FakeBot:
+    def __init__(self, latency):
+        self.latency = latency
+        self.log = []
+        self.targets = {}
+
+    def get_user(self, user_id):
+        return self.targets.setdefault(user_id, _FakeTarget(self.latency, self.log))
+
+    get_channel = get_user
+
+
+def bench_dispatcher(players=32, latency=0.05):
+    """Старт турнирного тура: ЛС по очереди в обработчике vs OutboundDispatcher"""
+
+    async def inline():
+        bot = _FakeBot(latency)
+        start = time.perf_counter()
+        for user_id in range(players):
+            # embed и инструкция - два сообщения
+            await bot.get_user(user_id).send(embed="match")
+            await bot.get_user(user_id).send("instruction")
+        return time.perf_counter() - start, time.perf_counter() - start, len(bot.log)
+
+    async def dispatched():
+        bot = _FakeBot(latency)
+        dispatcher = OutboundDispatcher()
+        dispatcher.start(bot)
+        start = time.perf_counter()
+        for user_id in range(players):
+            dispatcher.send_user(user_id, embed="match")
+            dispatcher.send_user(user_id, "instruction")
+        returned = time.perf_counter() - start
+        await dispatcher.join()
+        return returned, time.perf_counter() - start, len(bot.log)
+
+    print(f"{players} игроков, по 2 ЛС каждому, задержка API {latency * 1000:.0f} мс")
+    for name, run in (("inline", inline), ("dispatcher", dispatched)):
+        returned, done, requests = asyncio.run(run())
+        print(
+            f"{name:>10}: обработчик свободен через {returned * 1000:.1f} мс, "
+            f"все доставлено за {done * 1000:.0f} мс, запросов к API {requests}"
+        )
+
+
+def bench_user_resolver(matches=200, players=100, latency=0.05):
+    """Создание матчей: fetch_user на каждое обращение vs UserResolver"""
+
+    class Bot:
+        def __init__(self):
+            self.requests = 0
+
+        def get_user(self, user_id):
+            return None  # без общих серверов gateway-кеш пуст
+
+        async def fetch_user(self, user_id):
+            self.requests += 1
+            await asyncio.sleep(latency)
+            return user_id
+
+    async def create_matches(fetch):
+        # Как create_match: каждому игроку - он сам и соперник, обе стороны параллельно
+        rng = random.Random(1)
+        start = time.perf_counter()
+        for _ in range(matches):
+            p1, p2 = rng.sample(range(players), 2)
+            await asyncio.gather(
+                *(fetch(user_id) for user_id in (p1, p2, p2, p1))
+            )
+        return (time.perf_counter() - start) / matches
+
+    async def run():
+        bot = Bot()
+        per_match = await create_matches(bot.fetch_user)
+        print(
+            f"fetch_user: {per_match * 1000:.0f} мс на матч, запросов к API {bot.requests}"
+        )
+        bot = Bot()
+        resolver = UserResolver()
+        resolver.attach(bot)
+        per_match = await create_matches(resolver.fetch)
+        stats = resolver.stats()
+        print(
+            f"UserResolver: {per_match * 1000:.0f} мс на матч, запросов к API "
+            f"{bot.requests}, склеено {stats['deduplicated']}, без API {stats['hit_rate']:.1%}"
+        )
+
+    print(f"{matches} матчей среди {players} игроков, задержка API {latency * 1000:.0f} мс")
+    asyncio.run(run())
+
+
+def bench_elo_replay(matches=1000000, players=5000):
+    """Пересчет рейтингов по истории из 1M матчей за один проход"""
+    rng = random.Random(7)
+    names = [f"player{i}" for i in range(players)]
+
+    def history():
+        for _ in range(matches):
+            player1, player2 = rng.sample(names, 2)
+            score1, score2 = rng.choice(((5, 3), (3, 5), (0, 0), (1, 0), (0, 1)))
+            yield (rng.randint(1, 3), player1, player2, 1, score1, score2, 1, 1)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manager = DBManager(_temp_db_files(tmpdir))
+        start = time.perf_counter()
+        manager.executemany(
+            "matches",
+            """
+            INSERT INTO matches (mode, player1, player2, isover, player1score,
+                                 player2score, isverified, matchtype)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            history(),
+        )
+        manager.executemany(
+            "players",
+            "INSERT INTO players (playername, discordid) VALUES (?, ?)",
+            [(name, str(i)) for i, name in enumerate(names)],
+        )
+        print(f"история: {matches} матчей, {players} игроков ({time.perf_counter() - start:.1f} с на запись)")
+
+        start = time.perf_counter()
+        rows = load_history(manager)
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        replay_ratings(rows)
+        print(f"в памяти: чтение {load:.2f} с, пересчет {time.perf_counter() - start:.2f} с")
+        del rows
+
+        start = time.perf_counter()
+        ratings = replay_from_db(manager)
+        elapsed = time.perf_counter() - start
+        print(
+            f"replay_from_db (чтение и пересчет): {elapsed:.2f} с, "
+            f"{matches / elapsed / 1e6:.2f}M матчей/с, рейтингов {len(ratings)}"
+        )
+        diffs = diff_ratings(ratings, manager)
+        print(f"расхождений с players (у всех 1000): {len(diffs)}")
+        manager.close_all()
+
+
+def bench_elo_batch(matches=1000000, players=5000, sweep=(24, 32, 40)):
+    """Векторный пересчет истории волнами (NumPy) против replay_ratings"""
+    import elo_batch
+
+    if elo_batch.np is None:
+        print("NumPy не установлен, замер пропущен")
+        return
+    rng = random.Random(7)
+    names = [f"player{i}" for i in range(players)]
+    rows = []
+    for match_id in range(matches):
+        player1, player2 = rng.sample(names, 2)
+        score1, score2 = rng.choice(((5, 3), (3, 5), (0, 0), (1, 0), (0, 1)))
+        rows.append((match_id, player1, player2, rng.randint(1, 3), score1, score2))
+
+    class Rows:
+        # Без rating_events: матчи идут в порядке matchid
+        def fetchall(self, db_type, query):
+            return list(rows) if db_type == "matches" else []
+
+    start = time.perf_counter()
+    arrays = elo_batch.load_matches(Rows())
+    print(f"{matches} матчей, {players} игроков; загрузка в массивы {time.perf_counter() - start:.2f} с")
+    for K in sweep:
+        start = time.perf_counter()
+        ratings = elo_batch.replay_all(*arrays, K=K)
+        elapsed = time.perf_counter() - start
+        print(f"K={K}: волнами {elapsed:.2f} с ({matches / elapsed / 1e6:.2f}M матчей/с)")
+
+    start = time.perf_counter()
+    expected = replay_ratings(row[1:] for row in rows)
+    print(f"replay_ratings (K=40, по одному матчу): {time.perf_counter() - start:.2f} с")
+    print(f"совпадает с replay_ratings: {elo_batch.replay_all(*arrays) == expected}")
+
+
+def bench_leaderboard(players=20000, updates=100000, lookups=2000):
+    """Лидерборд в памяти против ORDER BY/COUNT по таблице players"""
+    rng = random.Random(11)
+    names = [f"player{i}" for i in range(players)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manager = DBManager(_temp_db_files(tmpdir))
+        manager.executemany(
+            "players",
+            """
+            INSERT INTO players (playername, discordid, currentelo, elo_station5f, elo_mots, elo_12min)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (name, str(i), 0, rng.randint(600, 1800), rng.randint(600, 1800), rng.randint(600, 1800))
+                for i, name in enumerate(names)
+            ],
+        )
+        manager.execute("players", "UPDATE players SET currentelo = elo_station5f + elo_mots + elo_12min")
+        board = Leaderboard(manager, LEADERBOARD_COLUMNS)
+
+        start = time.perf_counter()
+        board.load_all()
+        print(f"{players} игроков: загрузка {(time.perf_counter() - start) * 1000:.0f} мс")
+
+        start = time.perf_counter()
+        for _ in range(updates):
+            board.update(rng.choice(names), elo_mots=rng.randint(600, 1800))
+        elapsed = time.perf_counter() - start
+        print(f"обновлений: {updates}, {elapsed / updates * 1e6:.1f} мкс на обновление")
+
+        sample = rng.sample(names, lookups)
+        start = time.perf_counter()
+        for name in sample:
+            board.rank("mots", name)
+            board.page("mots", rng.randrange(board.pages("mots")))
+            board.around("mots", name)
+        memory = (time.perf_counter() - start) / lookups
+
+        # Для сравнения - место и страница запросами к базе
+        ratings = dict(manager.fetchall("players", "SELECT playername, elo_mots FROM players"))
+        for name in names:
+            board.update(name, elo_mots=ratings[name])
+        start = time.perf_counter()
+        for name in sample[:200]:
+            manager.fetchone(
+                "players",
+                "SELECT COUNT(*) FROM players WHERE elo_mots > ? OR (elo_mots = ? AND playername < ?)",
+                (ratings[name], ratings[name], name),
+            )
+            manager.fetchall(
+                "players",
+                "SELECT playername, elo_mots FROM players ORDER BY elo_mots DESC, playername LIMIT 10 OFFSET ?",
+                (rng.randrange(players // 10) * 10,),
+            )
+        sql = (time.perf_counter() - start) / 200
+        print(f"место + страница + соседи: в памяти {memory * 1e6:.1f} мкс, SQL (место + страница) {sql * 1e6:.0f} мкс")
+
+        expected = sorted(ratings, key=lambda name: (-ratings[name], name))
+        got = [name for _, name, _ in board.page("mots", 0, players)]
+        print(f"порядок совпадает с полной сортировкой: {got == expected}")
+        manager.close_all()
+
+
+def bench_leaderboard_render(players=20000, clicks=20000, writes_every=200):
+    """Кеш отрисованных страниц лидерборда при частых нажатиях кнопок"""
+    rng = random.Random(13)
+    names = [f"player{i}" for i in range(players)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manager = DBManager(_temp_db_files(tmpdir))
+        manager.executemany(
+            "players",
+            "INSERT INTO players (playername, discordid, elo_mots) VALUES (?, ?, ?)",
+            [(name, str(i), rng.randint(600, 1800)) for i, name in enumerate(names)],
+        )
+        board = Leaderboard(manager, LEADERBOARD_COLUMNS)
+        board.load_all()
+        cache = RenderCache(board)
+        modes = list(LEADERBOARD_COLUMNS)
+
+        def render(mode, page):
+            # Как render_leaderboard: страница из памяти + статистика одним запросом
+            leaders = board.page(mode, page)
+            names_on_page = [name for _, name, _ in leaders]
+            return manager.fetchall(
+                "players",
+                f"SELECT playername, wins, losses, ties FROM players WHERE playername IN ({', '.join('?' * len(names_on_page))})",
+                tuple(names_on_page),
+            )
+
+        requests = [(rng.choice(modes), rng.randrange(3)) for _ in range(clicks)]
+        for cached in (False, True):
+            start = time.perf_counter()
+            for i, (mode, page) in enumerate(requests):
+                if i % writes_every == 0:
+                    board.update(rng.choice(names), elo_mots=rng.randint(600, 1800))
+                if cached:
+                    cache.get((mode, page), lambda: render(mode, page))
+                else:
+                    render(mode, page)
+            elapsed = time.perf_counter() - start
+            label = "с кешем" if cached else "без кеша"
+            print(f"{label}: {clicks} нажатий за {elapsed * 1000:.0f} мс ({elapsed / clicks * 1e6:.1f} мкс)")
+        stats = cache.stats()
+        print(f"отрисовок {stats['misses']}, из кеша {stats['hits']} ({stats['hit_rate']:.1%}), запись рейтинга раз в {writes_every} нажатий")
+        manager.close_all()
+
+
+BENCHMARKS = {
+    "db_loop_lag": bench_db_loop_lag,
+    "query_plans": bench_query_plans,
+    "player_cache": bench_player_cache,
+    "queue_index": bench_queue_index,
+    "batch_pairing": bench_batch_pairing,
+    "rating_window": bench_rating_window,
+    "any_queue": bench_any_queue,
+    "deadline_scheduler": bench_deadline_scheduler,
+    "dispatcher": bench_dispatcher,
+    "user_resolver": bench_user_resolver,
+    "elo_replay": bench_elo_replay,
+    "elo_batch": bench_elo_batch,
+    "leaderboard": bench_leaderboard,
+    "leaderboard_render": bench_leaderboard_render,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("Доступные замеры:")
+        for name, func in BENCHMARKS.items():
+            print(f"  {name} - {func.__doc__}")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]]()
@@ -0,0 +1,120 @@
+"""Реестр текстовых каналов серверов: поиск канала по имени за O(1)."""
+
+import logging
+
+import discord
+
+from config import (
+    VERIFY_CHANNEL_NAME,
+    VERIFICATION_LOGS_CHANNEL_NAME,
+    QUEUE_CHANNEL_NAME,
+    MATCH_RESULTS_CHANNEL_NAME,
+)
+
+logger = logging.getLogger("channel_registry")
+
+# Логические каналы бота -> имена каналов на сервере
+CHANNELS = {
+    "verify": VERIFY_CHANNEL_NAME,
+    "logs": VERIFICATION_LOGS_CHANNEL_NAME,
+    "queue": QUEUE_CHANNEL_NAME,
+    "results": MATCH_RESULTS_CHANNEL_NAME,
+}
+
+
+class ChannelRegistry:
+    """ID текстовых каналов по (сервер, имя канала).
+
+    Строится при on_ready и обновляется событиями создания, удаления
+    и переименования каналов, так что поиск не перебирает guild.text_channels.
+    Хранятся ID, сам канал берется через bot.get_channel().
+    """
+
+    def __init__(self, names):
+        self._names = names
+        self._bot = None
+        self._ids = {}  # (guild_id, имя) -> {channel_id: None} в порядке позиций
+        self._guilds = {}  # имя -> {guild_id: None} - серверы, где есть канал
+
+    def attach(self, bot):
+        self._bot = bot
+        bot.add_listener(self.on_ready, "on_ready")
+        bot.add_listener(self.on_guild_join, "on_guild_join")
+        bot.add_listener(self.on_guild_remove, "on_guild_remove")
+        bot.add_listener(self.on_guild_channel_create, "on_guild_channel_create")
+        bot.add_listener(self.on_guild_channel_delete, "on_guild_channel_delete")
+        bot.add_listener(self.on_guild_channel_update, "on_guild_channel_update")
+
+    def rebuild(self):
+        self._ids.clear()
+        self._guilds.clear()
+        for guild in self._bot.guilds:
+            self._add_guild(guild)
+        logger.info(f"Channel registry built: {len(self._ids)} channel names")
+
+    def _add_guild(self, guild):
+        for channel in sorted(guild.text_channels, key=lambda c: c.position):
+            self._add(channel)
+
+    def _add(self, channel):
+        if not isinstance(channel, discord.TextChannel):
+            return
+        key = (channel.guild.id, channel.name)
+        self._ids.setdefault(key, {})[channel.id] = None
+        self._guilds.setdefault(channel.name, {})[channel.guild.id] = None
+
+    def _remove(self, channel):
+        name = channel.name
+        key = (channel.guild.id, name)
+        ids = self._ids.get(key)
+        if ids is None:
+            return
+        ids.pop(channel.id, None)
+        if not ids:
+            del self._ids[key]
+            guilds = self._guilds.get(name, {})
+            guilds.pop(channel.guild.id, None)
+            if not guilds:
+                self._guilds.pop(name, None)
+
+    def by_name(self, name, guild=None):
+        """Канал с именем name на сервере guild (None - на первом сервере, где он есть)"""
+        if guild is None:
+            guild_id = next(iter(self._guilds.get(name, ())), None)
+            if guild_id is None:
+                return None
+        else:
+            guild_id = guild.id
+        for channel_id in self._ids.get((guild_id, name), ()):
+            channel = self._bot.get_channel(channel_id)
+            if channel is not None:
+                return channel
+        return None
+
+    def get(self, logical, guild=None):
+        """Канал бота ("results", "queue", "logs", "verify") на сервере guild"""
+        return self.by_name(self._names[logical], guild)
+
+    async def on_ready(self):
+        self.rebuild()
+
+    async def on_guild_join(self, guild):
+        self._add_guild(guild)
+
+    async def on_guild_remove(self, guild):
+        for channel in guild.text_channels:
+            self._remove(channel)
+
+    async def on_guild_channel_create(self, channel):
+        self._add(channel)
+
+    async def on_guild_channel_delete(self, channel):
+        self._remove(channel)
+
+    async def on_guild_channel_update(self, before, after):
+        if before.name != after.name:
+            self._remove(before)
+            self._add(after)
+
+
+channel_registry = ChannelRegistry(CHANNELS)
@@ -19,6 +19,34 @@ DEFAULT_ELO = 1000
 MODES = {"any": 0, "station5f": 1, "mots": 2, "12min": 3}
 MODE_NAMES = {0: "Any", 1: "Station 5 flags", 2: "MotS Solo", 3: "12min"}
 
+# Матчмейкер подбирает пары сразу при изменении очереди; раз в
+# MATCHMAKING_TICK секунд дополнительно проверяет все очереди
+MATCHMAKING_TICK = 15
+
+# Алгоритм подбора: "greedy" - дольше всех ждущий + ближайший по рейтингу,
+# "batch" - пары с минимальной суммарной стоимостью по всей очереди
+MATCHMAKING_MODE = "greedy"
+MATCHMAKING_BATCH = {
+    "unpaired_cost": 300,  # стоимость оставить игрока ждать еще один проход
+    "wait_weight": 5.0,  # + за каждую секунду ожидания
+    "neighbors": 8,  # с каким числом соседей по рейтингу пробовать пару
+    "time_budget": 0.05,  # секунд на расчет, иначе жадный подбор
+}
+
+# Окно допустимой разницы ELO по режимам: start + per_second * секунды
+# ожидания, но не больше limit (None - со временем подберется любой соперник)
+RATING_WINDOWS = {
+    MODES["any"]: {"start": 150, "per_second": 4, "limit": None},
+    MODES["station5f"]: {"start": 100, "per_second": 3, "limit": None},
+    MODES["mots"]: {"start": 100, "per_second": 3, "limit": None},
+    MODES["12min"]: {"start": 100, "per_second": 3, "limit": None},
+}
+
+# Через сколько секунд обычный матч без результата завершается ничьей
+MATCH_TIMEOUT = 3600
+# Сколько секунд у соперника на подтверждение результата
+RESULT_CONFIRMATION_TIMEOUT = 3600
+
 LEADERBOARD_MODES = {
     "overall": ("currentelo", "wins", "losses", "ties"),
     "station5flags": (
@@ -37,9 +65,12 @@ intents.message_content = True
 intents.members = True
 intents.dm_messages = True
 
+# Участники серверов не грузятся целиком при старте: нужных игроков
+# подгружает startup.py (query_members) перед задачами, которым они нужны
 bot = commands.Bot(
     intents=intents,
     command_prefix=".",
+    chunk_guilds_at_startup=False,
 )
 
 # Удалил старую инициализацию бд, добавил её в db_manager
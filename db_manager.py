@@ -1,7 +1,12 @@
+import os
 import sqlite3
 import threading
 import logging
-from functools import wraps
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial, wraps
 
 # Настройка логгера
 logger = logging.getLogger("db_manager")
@@ -13,183 +18,572 @@ handler.setFormatter(
 logger.addHandler(handler)
 
 
+DEFAULT_DB_FILES = {
+    "players": "elobotplayers.db",
+    "matches": "elobotmatches.db",
+    "tournaments": "elotournaments.db",
+}
+
+# Режим хранения: "split" - три файла (по умолчанию), "single" - одна база
+# со всеми таблицами, где изменения игроков, матчей и турниров коммитятся вместе
+STORAGE_MODE = os.getenv("ELOBOT_DB_MODE", "split")
+SINGLE_DB_FILE = os.getenv("ELOBOT_DB_FILE", "elobot.db")
+
+# Схема таблиц по типам баз
+SCHEMAS = {
+    "players": [
+        """
+        CREATE TABLE IF NOT EXISTS players (
+            playerid INTEGER PRIMARY KEY AUTOINCREMENT,
+            playername TEXT NOT NULL UNIQUE,
+            discordid TEXT NOT NULL UNIQUE,
+            currentelo INTEGER DEFAULT 1000,
+            elo_station5f INTEGER DEFAULT 1000,
+            elo_mots INTEGER DEFAULT 1000,
+            elo_12min INTEGER DEFAULT 1000,
+            wins INTEGER DEFAULT 0,
+            losses INTEGER DEFAULT 0,
+            ties INTEGER DEFAULT 0,
+            wins_station5f INTEGER DEFAULT 0,
+            losses_station5f INTEGER DEFAULT 0,
+            ties_station5f INTEGER DEFAULT 0,
+            wins_mots INTEGER DEFAULT 0,
+            losses_mots INTEGER DEFAULT 0,
+            ties_mots INTEGER DEFAULT 0,
+            wins_12min INTEGER DEFAULT 0,
+            losses_12min INTEGER DEFAULT 0,
+            ties_12min INTEGER DEFAULT 0,
+            currentmatches INTEGER DEFAULT 0,
+            in_queue INTEGER DEFAULT 0,
+            isbanned BOOLEAN DEFAULT 0,
+            isblacklisted BOOLEAN DEFAULT 0
+        )
+        """,
+    ],
+    "matches": [
+        """
+        CREATE TABLE IF NOT EXISTS matches (
+            matchid INTEGER PRIMARY KEY AUTOINCREMENT,
+            mode INTEGER NOT NULL,
+            player1 TEXT NOT NULL,
+            player2 TEXT NOT NULL,
+            isover INTEGER DEFAULT 0,
+            player1score INTEGER,
+            player2score INTEGER,
+            isverified INTEGER DEFAULT 0,
+            map TEXT,
+            start_time DATETIME,
+            matchtype INTEGER DEFAULT 1,
+            tournament_id TEXT DEFAULT 0
+        )
+        """,
+    ],
+    "tournaments": [
+        """
+        CREATE TABLE IF NOT EXISTS tournaments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            slots INTEGER NOT NULL,
+            started BOOLEAN DEFAULT 0,
+            currenttour INTEGER DEFAULT 1,
+            isover BOOLEAN DEFAULT 0,
+            currentplayers TEXT DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            current_round INTEGER DEFAULT 1,
+            participants TEXT DEFAULT '[]',
+            winners TEXT DEFAULT '[]',
+            matches TEXT DEFAULT '[]'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS tournament_participants (
+            tournament_id INTEGER,
+            user_id TEXT NOT NULL,
+            player_name TEXT NOT NULL,
+            FOREIGN KEY(tournament_id) REFERENCES tournaments(id),
+            PRIMARY KEY(tournament_id, user_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS tournament_bans (
+            tournament_id INTEGER,
+            user_id TEXT NOT NULL,
+            FOREIGN KEY(tournament_id) REFERENCES tournaments(id),
+            PRIMARY KEY(tournament_id, user_id)
+        )
+        """,
+    ],
+}
+
+def _migrate_active_tours(conn):
+    """Переносит JSON-состояние турниров из старой таблицы active_tours в сетку"""
+    legacy = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'active_tours'"
+    ).fetchone()
+    if not legacy:
+        return
+    rows = conn.execute(
+        "SELECT tournament_id, current_round, participants, winners, matches FROM active_tours"
+    ).fetchall()
+    for tournament_id, current_round, participants, winners, matches in rows:
+        slots = json.loads(participants)
+        winners = json.loads(winners)
+        matches = json.loads(matches)
+
+        def position(player):
+            if player not in slots:
+                slots.append(player)
+            return slots.index(player)
+
+        match_rows = [
+            (
+                m["id"],
+                tournament_id,
+                current_round,
+                position(m["player1"]),
+                position(m["player2"]),
+                None if m["winner"] is None else position(m["winner"]),
+                int(bool(m["is_finished"])),
+            )
+            for m in matches
+        ]
+        match_winners = [m["winner"] for m in matches if m["winner"]]
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO bracket_slots
+            (tournament_id, round, position, user_id, name, mention, bye)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    tournament_id,
+                    current_round,
+                    i,
+                    p["id"],
+                    p["name"],
+                    p.get("mention"),
+                    int(p in winners and p not in match_winners),
+                )
+                for i, p in enumerate(slots)
+            ],
+        )
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO bracket_matches
+            (match_id, tournament_id, round, player1_position, player2_position,
+             winner_position, is_finished)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            match_rows,
+        )
+        conn.execute(
+            "UPDATE tournaments SET current_round = ? WHERE id = ?",
+            (current_round, tournament_id),
+        )
+    conn.execute("DROP TABLE active_tours")
+
+
+# Версионные миграции схемы по типам баз: (версия, описание, шаги).
+# Шаг - SQL-строка или функция, принимающая соединение. Новые миграции
+# добавляются в конец списка со следующим номером версии.
+MIGRATIONS = {
+    "players": [
+        (
+            1,
+            "indexes for queue, blacklist and leaderboards",
+            [
+                "CREATE INDEX IF NOT EXISTS idx_players_in_queue ON players(in_queue) WHERE in_queue = 1",
+                "CREATE INDEX IF NOT EXISTS idx_players_blacklisted ON players(isblacklisted) WHERE isblacklisted = 1",
+                "CREATE INDEX IF NOT EXISTS idx_players_currentelo ON players(currentelo DESC)",
+                "CREATE INDEX IF NOT EXISTS idx_players_elo_station5f ON players(elo_station5f DESC)",
+                "CREATE INDEX IF NOT EXISTS idx_players_elo_mots ON players(elo_mots DESC)",
+                "CREATE INDEX IF NOT EXISTS idx_players_elo_12min ON players(elo_12min DESC)",
+                "ANALYZE players",
+            ],
+        ),
+        (
+            2,
+            "queue entries table instead of in_queue flag",
+            [
+                """
+                CREATE TABLE IF NOT EXISTS queue_entries (
+                    discordid TEXT PRIMARY KEY,
+                    mode INTEGER NOT NULL,
+                    playername TEXT NOT NULL,
+                    rating INTEGER,
+                    channel_id INTEGER,
+                    join_time TEXT NOT NULL
+                )
+                """,
+                # Флаг in_queue больше не пишется, колонка остается для старых баз
+                "DROP INDEX IF EXISTS idx_players_in_queue",
+                "UPDATE players SET in_queue = 0 WHERE in_queue != 0",
+            ],
+        ),
+        (
+            3,
+            "append-only rating history",
+            [
+                """
+                CREATE TABLE IF NOT EXISTS rating_events (
+                    eventid INTEGER PRIMARY KEY AUTOINCREMENT,
+                    playername TEXT NOT NULL,
+                    mode INTEGER NOT NULL,
+                    old_rating INTEGER,
+                    new_rating INTEGER NOT NULL,
+                    match_id INTEGER,
+                    reason TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+                """,
+                "CREATE INDEX IF NOT EXISTS idx_rating_events_player ON rating_events(playername, mode, eventid)",
+                "CREATE INDEX IF NOT EXISTS idx_rating_events_match ON rating_events(match_id)",
+                # История только дописывается
+                """
+                CREATE TRIGGER IF NOT EXISTS rating_events_no_update
+                BEFORE UPDATE ON rating_events
+                BEGIN
+                    SELECT RAISE(ABORT, 'rating_events is append-only');
+                END
+                """,
+                """
+                CREATE TRIGGER IF NOT EXISTS rating_events_no_delete
+                BEFORE DELETE ON rating_events
+                BEGIN
+                    SELECT RAISE(ABORT, 'rating_events is append-only');
+                END
+                """,
+            ],
+        ),
+    ],
+    "matches": [
+        (
+            1,
+            "indexes for active matches lookups",
+            [
+                "CREATE INDEX IF NOT EXISTS idx_matches_active ON matches(isover, matchtype, start_time)",
+                "CREATE INDEX IF NOT EXISTS idx_matches_player1_active ON matches(player1) WHERE isover = 0",
+                "CREATE INDEX IF NOT EXISTS idx_matches_player2_active ON matches(player2) WHERE isover = 0",
+                "CREATE INDEX IF NOT EXISTS idx_matches_tournament ON matches(tournament_id, isover)",
+                # Без статистики планировщик не выбирает частичные индексы
+                "ANALYZE matches",
+            ],
+        ),
+        (
+            2,
+            "channel where the match was created",
+            ["ALTER TABLE matches ADD COLUMN channel_id INTEGER"],
+        ),
+    ],
+    "tournaments": [
+        (
+            1,
+            "bracket tables instead of active_tours JSON",
+            [
+                # Участники тура по позициям; bye - прошел дальше без соперника
+                """
+                CREATE TABLE IF NOT EXISTS bracket_slots (
+                    tournament_id INTEGER NOT NULL,
+                    round INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    mention TEXT,
+                    bye INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (tournament_id, round, position)
+                )
+                """,
+                # Матчи тура; игроки и победитель - позиции в bracket_slots
+                """
+                CREATE TABLE IF NOT EXISTS bracket_matches (
+                    match_id INTEGER PRIMARY KEY,
+                    tournament_id INTEGER NOT NULL,
+                    round INTEGER NOT NULL,
+                    player1_position INTEGER NOT NULL,
+                    player2_position INTEGER NOT NULL,
+                    winner_position INTEGER,
+                    is_finished INTEGER NOT NULL DEFAULT 0
+                )
+                """,
+                "CREATE INDEX IF NOT EXISTS idx_bracket_matches_round ON bracket_matches(tournament_id, round)",
+                _migrate_active_tours,
+            ],
+        ),
+    ],
+}
+
+# Горячие запросы, которые не должны превращаться в полный проход по таблице.
+# Проверяются через EXPLAIN QUERY PLAN при старте (check_query_plans).
+# Поиск активного матча игрока пишется как (player1 = ? AND isover = 0) OR
+# (player2 = ? AND isover = 0) - только так планировщик берет частичные индексы
+
+HOT_QUERIES = [
+    ("players", "SELECT discordid FROM players WHERE isblacklisted = 1"),
+    ("players", "SELECT playername FROM players WHERE discordid = ?"),
+    ("players", "SELECT discordid FROM players WHERE playername = ?"),
+    ("players", "SELECT playername, wins, losses, ties FROM players WHERE playername IN (?, ?, ?)"),
+    ("matches", "SELECT player1, player2 FROM matches WHERE isover = 0 AND matchtype = ?"),
+    ("matches", "SELECT matchid, start_time FROM matches WHERE isover = 0 AND matchtype = 1"),
+    (
+        "matches",
+        "SELECT matchid FROM matches WHERE ((player1 = ? AND isover = 0) OR (player2 = ? AND isover = 0)) AND matchtype = 1",
+    ),
+    (
+        "matches",
+        "SELECT 1 FROM matches WHERE ((player1 = ? AND isover = 0) OR (player2 = ? AND isover = 0)) AND matchtype = 2",
+    ),
+    (
+        "matches",
+        "SELECT matchid, player1, player2, mode FROM matches WHERE (player1 = ? AND isover = 0) OR (player2 = ? AND isover = 0)",
+    ),
+    (
+        "matches",
+        """
+        SELECT COUNT(DISTINCT player) FROM (
+            SELECT player1 AS player FROM matches WHERE isover = 0
+            UNION ALL
+            SELECT player2 AS player FROM matches WHERE isover = 0
+        )
+        """,
+    ),
+    ("matches", "SELECT matchid FROM matches WHERE tournament_id = ? AND isover = 0"),
+    ("tournaments", "SELECT match_id FROM bracket_matches WHERE tournament_id = ? AND round = ?"),
+    ("tournaments", "SELECT user_id FROM bracket_slots WHERE tournament_id = ? AND round = ?"),
+]
+
+
 class DBManager:
-    def __init__(self):
+    def __init__(self, db_files=None, storage=None):
         self._connections = {}
-        self._lock = threading.Lock()
-        self._db_files = {
-            "players": "elobotplayers.db",
-            "matches": "elobotmatches.db",
-            "tournaments": "elotournaments.db",
-        }
+        self._lock = threading.RLock()
+        storage = storage or STORAGE_MODE
+        if db_files is None:
+            if storage == "single":
+                db_files = {db_type: SINGLE_DB_FILE for db_type in DEFAULT_DB_FILES}
+            else:
+                db_files = DEFAULT_DB_FILES
+        elif isinstance(db_files, str):
+            # Один путь - все типы баз в одном файле
+            db_files = {db_type: db_files for db_type in DEFAULT_DB_FILES}
+        self._db_files = dict(db_files)
+        # Глубина открытых транзакций по каждому файлу базы
+        self._tx_depth = {}
+        # Вызываются с db_type после отката транзакции (сброс кешей в памяти)
+        self._rollback_listeners = []
+        self._after_commit = {}  # файл базы -> [callback] до коммита транзакции
 
         # Инициализация таблиц при первом запуске
         self._initialize_databases()
+        # Предупреждает в логе, если горячий запрос пошел полным проходом
+        self.check_query_plans()
+
+    @property
+    def is_single_file(self):
+        """Все таблицы лежат в одном файле (одна транзакция на все сущности)"""
+        return len(set(self._db_files.values())) == 1
 
     def _initialize_databases(self):
         """Создает таблицы если они не существуют и добавляет недостающие колонки"""
         with self._lock:
-            # Инициализация базы игроков
-            conn = sqlite3.connect(self._db_files["players"])
-            try:
-                conn.execute(
-                    """
-                CREATE TABLE IF NOT EXISTS players (
-                    playerid INTEGER PRIMARY KEY AUTOINCREMENT,
-                    playername TEXT NOT NULL UNIQUE,
-                    discordid TEXT NOT NULL UNIQUE,
-                    currentelo INTEGER DEFAULT 1000,
-                    elo_station5f INTEGER DEFAULT 1000,
-                    elo_mots INTEGER DEFAULT 1000,
-                    elo_12min INTEGER DEFAULT 1000,
-                    wins INTEGER DEFAULT 0,
-                    losses INTEGER DEFAULT 0,
-                    ties INTEGER DEFAULT 0,
-                    wins_station5f INTEGER DEFAULT 0,
-                    losses_station5f INTEGER DEFAULT 0,
-                    ties_station5f INTEGER DEFAULT 0,
-                    wins_mots INTEGER DEFAULT 0,
-                    losses_mots INTEGER DEFAULT 0,
-                    ties_mots INTEGER DEFAULT 0,
-                    wins_12min INTEGER DEFAULT 0,
-                    losses_12min INTEGER DEFAULT 0,
-                    ties_12min INTEGER DEFAULT 0,
-                    currentmatches INTEGER DEFAULT 0,
-                    in_queue INTEGER DEFAULT 0,
-                    isbanned BOOLEAN DEFAULT 0,
-                    isblacklisted BOOLEAN DEFAULT 0
-                )
-                """
-                )
-                conn.commit()
-                logger.info("Players database initialized")
-            except Exception as e:
-                logger.error(f"Error initializing players database: {e}")
-                raise
-            finally:
-                conn.close()
+            for db_type, statements in SCHEMAS.items():
+                conn = sqlite3.connect(self._db_files[db_type])
+                try:
+                    for statement in statements:
+                        conn.execute(statement)
+                    conn.commit()
+                    self._apply_migrations(conn, db_type)
+                    logger.info(f"{db_type.capitalize()} database initialized")
+                except Exception as e:
+                    logger.error(f"Error initializing {db_type} database: {e}")
+                    raise
+                finally:
+                    conn.close()
+
+    def _apply_migrations(self, conn, db_type):
+        """Применяет миграции, которых ещё нет в schema_version.
+
+        Каждая миграция выполняется в своей транзакции вместе с записью
+        о версии, так что прерванный запуск повторит её целиком.
+        """
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                db_type TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY(db_type, version)
+            )
+            """
+        )
+        conn.commit()
+        current = conn.execute(
+            "SELECT COALESCE(MAX(version), 0) FROM schema_version WHERE db_type = ?",
+            (db_type,),
+        ).fetchone()[0]
 
-            # Инициализация базы матчей
-            conn = sqlite3.connect(self._db_files["matches"])
+        for version, description, steps in MIGRATIONS.get(db_type, []):
+            if version <= current:
+                continue
             try:
+                conn.execute("BEGIN")
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
                 conn.execute(
-                    """
-                CREATE TABLE IF NOT EXISTS matches (
-                    matchid INTEGER PRIMARY KEY AUTOINCREMENT,
-                    mode INTEGER NOT NULL,
-                    player1 TEXT NOT NULL,
-                    player2 TEXT NOT NULL,
-                    isover INTEGER DEFAULT 0,
-                    player1score INTEGER,
-                    player2score INTEGER,
-                    isverified INTEGER DEFAULT 0,
-                    map TEXT,
-                    start_time DATETIME,
-                    matchtype INTEGER DEFAULT 1,
-                    tournament_id TEXT DEFAULT 0
-                )
-                """
+                    "INSERT INTO schema_version (db_type, version, description) VALUES (?, ?, ?)",
+                    (db_type, version, description),
                 )
                 conn.commit()
-                logger.info("Matches database initialized")
             except Exception as e:
-                logger.error(f"Error initializing matches database: {e}")
+                conn.rollback()
+                logger.error(f"Migration {db_type} v{version} failed: {e}")
                 raise
-            finally:
-                conn.close()
+            logger.info(f"Applied migration {db_type} v{version}: {description}")
 
-            # Инициализация базы турниров
-            conn = sqlite3.connect(self._db_files["tournaments"])
-            try:
-                conn.execute(
-                    """
-                CREATE TABLE IF NOT EXISTS tournaments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE NOT NULL,
-                    slots INTEGER NOT NULL,
-                    started BOOLEAN DEFAULT 0,
-                    currenttour INTEGER DEFAULT 1,
-                    isover BOOLEAN DEFAULT 0,
-                    currentplayers TEXT DEFAULT '',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    current_round INTEGER DEFAULT 1,
-                    participants TEXT DEFAULT '[]',
-                    winners TEXT DEFAULT '[]',
-                    matches TEXT DEFAULT '[]'
-                )
-                """
-                )
+    def schema_version(self, db_type):
+        """Возвращает текущую версию схемы базы"""
+        row = self.fetchone(
+            db_type,
+            "SELECT COALESCE(MAX(version), 0) FROM schema_version WHERE db_type = ?",
+            (db_type,),
+        )
+        return row[0]
 
-                conn.execute(
-                    """
-                CREATE TABLE IF NOT EXISTS tournament_participants (
-                    tournament_id INTEGER,
-                    user_id TEXT NOT NULL,
-                    player_name TEXT NOT NULL,
-                    FOREIGN KEY(tournament_id) REFERENCES tournaments(id),
-                    PRIMARY KEY(tournament_id, user_id)
-                )
-                """
-                )
+    def check_query_plans(self, queries=None):
+        """Проверяет через EXPLAIN QUERY PLAN, что горячие запросы идут по индексам.
 
-                conn.execute(
-                    """
-                CREATE TABLE IF NOT EXISTS tournament_bans (
-                    tournament_id INTEGER,
-                    user_id TEXT NOT NULL,
-                    FOREIGN KEY(tournament_id) REFERENCES tournaments(id),
-                    PRIMARY KEY(tournament_id, user_id)
-                )
-                """
+        Возвращает список (запрос, план) для запросов с полным проходом
+        по таблице и пишет по ним предупреждение в лог.
+        """
+        problems = []
+        for db_type, query in queries or HOT_QUERIES:
+            params = (None,) * query.count("?")
+            plan = [
+                row[3]
+                for row in self.fetchall(db_type, f"EXPLAIN QUERY PLAN {query}", params)
+            ]
+            full_scans = [
+                step
+                for step in plan
+                if step.startswith("SCAN ")
+                and "USING" not in step
+                and "subquery" not in step
+            ]
+            if full_scans:
+                problems.append((" ".join(query.split()), plan))
+                logger.warning(
+                    f"Full table scan in hot query: {' '.join(query.split())} -> {full_scans}"
                 )
-                conn.commit()
-                logger.info("Tournaments database initialized")
-            except Exception as e:
-                logger.error(f"Error initializing tournaments database: {e}")
-                raise
-            finally:
-                conn.close()
+        return problems
 
     def get_connection(self, db_type):
-        """Получает соединение с базой (создает при необходимости)"""
+        """Получает соединение с базой (создает при необходимости).
+
+        Типы баз, лежащие в одном файле, используют одно соединение.
+        """
         with self._lock:
             if db_type not in self._db_files:
                 raise ValueError(f"Unknown database type: {db_type}")
 
             db_file = self._db_files[db_type]
 
-            if db_type not in self._connections or self._connections[db_type] is None:
-                self._connections[db_type] = sqlite3.connect(db_file)
-                # Оптимизации для SQLite
-                self._connections[db_type].execute("PRAGMA journal_mode=WAL")
-                self._connections[db_type].execute("PRAGMA synchronous=NORMAL")
-                self._connections[db_type].execute("PRAGMA foreign_keys=ON")
+            if self._connections.get(db_file) is None:
+                self._connections[db_file] = self._open_connection(db_file)
                 logger.info(f"Created new connection for {db_type}")
 
-            return self._connections[db_type]
+            return self._connections[db_file]
+
+    def _open_connection(self, db_file, check_same_thread=True):
+        """Открывает новое соединение с базой и применяет настройки SQLite"""
+        conn = sqlite3.connect(db_file, check_same_thread=check_same_thread)
+        # Оптимизации для SQLite
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def get_db_file(self, db_type):
+        """Возвращает путь к файлу базы"""
+        if db_type not in self._db_files:
+            raise ValueError(f"Unknown database type: {db_type}")
+        return self._db_files[db_type]
 
     def reconnect(self, db_type):
         """Переподключается к базе"""
         with self._lock:
-            if db_type in self._connections:
+            db_file = self.get_db_file(db_type)
+            if self._connections.get(db_file) is not None:
                 try:
-                    self._connections[db_type].close()
+                    self._connections[db_file].close()
                 except Exception as e:
                     logger.error(f"Error closing connection: {e}")
 
-            self._connections[db_type] = None
+            self._connections[db_file] = None
             return self.get_connection(db_type)
 
+    def in_transaction(self, db_type):
+        """Проверяет, открыта ли транзакция для базы"""
+        return self._tx_depth.get(self._db_files.get(db_type), 0) > 0
+
+    def add_rollback_listener(self, callback):
+        """Регистрирует callback(db_type), вызываемый после отката транзакции"""
+        self._rollback_listeners.append(callback)
+
+    def after_commit(self, db_type, callback):
+        """Вызывает callback() после коммита текущей транзакции db_type.
+
+        Вне транзакции callback вызывается сразу, при откате - не вызывается.
+        """
+        if not self.in_transaction(db_type):
+            callback()
+            return
+        self._after_commit.setdefault(self._db_files[db_type], []).append(callback)
+
+    @contextmanager
+    def transaction(self, db_type):
+        """Группирует запросы в одну транзакцию с одним коммитом.
+
+        Внутри блока execute/executemany не коммитят; при исключении все
+        изменения откатываются. Вложенные блоки присоединяются к внешнему.
+        Внутри блока не должно быть await - иначе в транзакцию попадут
+        запросы других корутин.
+        """
+        conn = self.get_connection(db_type)
+        key = self._db_files[db_type]
+        depth = self._tx_depth.get(key, 0)
+        self._tx_depth[key] = depth + 1
+        try:
+            yield conn
+        except Exception:
+            self._tx_depth[key] = depth
+            if depth == 0:
+                conn.rollback()
+                self._after_commit.pop(key, None)
+                logger.warning(f"Transaction on {db_type} rolled back")
+                for callback in self._rollback_listeners:
+                    callback(db_type)
+            raise
+        else:
+            self._tx_depth[key] = depth
+            if depth == 0:
+                conn.commit()
+                for callback in self._after_commit.pop(key, ()):
+                    callback()
+
     def execute(self, db_type, query, params=(), retry=True):
         """Выполняет SQL-запрос с обработкой ошибок соединения"""
         try:
             conn = self.get_connection(db_type)
             cursor = conn.cursor()
             cursor.execute(query, params)
-            conn.commit()
+            if not self.in_transaction(db_type):
+                conn.commit()
             return cursor
         except (sqlite3.ProgrammingError, sqlite3.OperationalError) as e:
-            if "closed" in str(e) and retry:
+            if "closed" in str(e) and retry and not self.in_transaction(db_type):
                 logger.warning(f"Connection closed, reconnecting... (Error: {e})")
                 conn = self.reconnect(db_type)
                 return self.execute(db_type, query, params, retry=False)
@@ -198,6 +592,26 @@ class DBManager:
             logger.error(f"Database error: {e}")
             raise
 
+    def executemany(self, db_type, query, seq_of_params, retry=True):
+        """Выполняет один запрос для набора параметров одним коммитом"""
+        seq_of_params = list(seq_of_params)
+        try:
+            conn = self.get_connection(db_type)
+            cursor = conn.cursor()
+            cursor.executemany(query, seq_of_params)
+            if not self.in_transaction(db_type):
+                conn.commit()
+            return cursor
+        except (sqlite3.ProgrammingError, sqlite3.OperationalError) as e:
+            if "closed" in str(e) and retry and not self.in_transaction(db_type):
+                logger.warning(f"Connection closed, reconnecting... (Error: {e})")
+                self.reconnect(db_type)
+                return self.executemany(db_type, query, seq_of_params, retry=False)
+            raise
+        except Exception as e:
+            logger.error(f"Database error: {e}")
+            raise
+
     def fetchall(self, db_type, query, params=()):
         """Выполняет запрос и возвращает все строки"""
         cursor = self.execute(db_type, query, params)
@@ -211,15 +625,17 @@ class DBManager:
     def close_all(self):
         """Закрывает все соединения"""
         with self._lock:
-            for db_type, conn in list(self._connections.items()):
+            for db_file, conn in list(self._connections.items()):
                 try:
                     if conn:
+                        # Обновляет статистику индексов, если она устарела
+                        conn.execute("PRAGMA optimize")
                         conn.close()
-                        logger.info(f"Closed connection for {db_type}")
+                        logger.info(f"Closed connection for {db_file}")
                 except Exception as e:
-                    logger.error(f"Error closing connection for {db_type}: {e}")
+                    logger.error(f"Error closing connection for {db_file}: {e}")
                 finally:
-                    self._connections[db_type] = None
+                    self._connections[db_file] = None
 
     def get_lastrowid(self, db_type):
         """Возвращает ID последней вставленной записи"""
@@ -238,8 +654,267 @@ class DBManager:
             return False
 
 
+# Таблицы, которые есть в каждом исходном файле: строки, которых нет в одном
+# из них, принадлежат другим файлам и при синхронизации не удаляются
+SHARED_TABLES = {"schema_version"}
+
+
+def _sync_table(conn, table):
+    """Приводит main.table к legacy.table; возвращает число записанных строк.
+
+    Строки, которых нет в источнике, удаляются, остальные копируются через
+    upsert по первичному ключу - обновляются только действительно
+    изменившиеся (rating_events запрещает UPDATE, его строки не меняются).
+    Таблица без первичного ключа только дополняется (INSERT OR IGNORE).
+    """
+    target_columns = {
+        row[1] for row in conn.execute(f'PRAGMA main.table_info("{table}")')
+    }
+    source_info = [
+        row
+        for row in conn.execute(f'PRAGMA legacy.table_info("{table}")')
+        if row[1] in target_columns
+    ]
+    columns = [row[1] for row in source_info]
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    # row[5] - номер колонки в первичном ключе (0 - не входит)
+    key = [row[1] for row in sorted(source_info, key=lambda row: row[5]) if row[5]]
+    if not key:
+        cursor = conn.execute(
+            f'INSERT OR IGNORE INTO main."{table}" ({column_list}) '
+            f'SELECT {column_list} FROM legacy."{table}"'
+        )
+        return cursor.rowcount
+
+    key_list = ", ".join(f'"{column}"' for column in key)
+    if table not in SHARED_TABLES:
+        conn.execute(
+            f'DELETE FROM main."{table}" WHERE ({key_list}) NOT IN '
+            f'(SELECT {key_list} FROM legacy."{table}")'
+        )
+    updated = [column for column in columns if column not in key]
+    if updated:
+        action = (
+            "DO UPDATE SET "
+            + ", ".join(f'"{column}" = excluded."{column}"' for column in updated)
+            + " WHERE "
+            + " OR ".join(
+                f'"{table}"."{column}" IS NOT excluded."{column}"' for column in updated
+            )
+        )
+    else:
+        action = "DO NOTHING"
+    # WHERE true нужен парсеру: без него ON CONFLICT читается как часть SELECT
+    cursor = conn.execute(
+        f'INSERT INTO main."{table}" ({column_list}) '
+        f'SELECT {column_list} FROM legacy."{table}" WHERE true '
+        f"ON CONFLICT ({key_list}) {action}"
+    )
+    return cursor.rowcount
+
+
+def migrate_to_single_file(target=SINGLE_DB_FILE, source_files=None):
+    """Переносит данные из раздельных баз в одну общую.
+
+    Исходные файлы подключаются через ATTACH и только читаются, поэтому
+    перенос можно запускать на работающем боте. Таблицы синхронизируются
+    по первичному ключу (см. _sync_table): повторный запуск обновляет
+    измененные строки и удаляет исчезнувшие, так что после остановки бота
+    еще один запуск доводит общую базу до его последнего состояния.
+    Возвращает {таблица: число записанных строк}.
+    """
+    source_files = source_files or DEFAULT_DB_FILES
+    target_manager = DBManager(db_files=target)
+    conn = target_manager.get_connection("players")
+    copied = {}
+
+    try:
+        for db_type, source in source_files.items():
+            if not os.path.exists(source):
+                logger.warning(f"Source database {source} not found, skipping")
+                continue
+
+            conn.execute("ATTACH DATABASE ? AS legacy", (source,))
+            try:
+                tables = conn.execute(
+                    """
+                    SELECT name, sql FROM legacy.sqlite_master
+                    WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+                    """
+                ).fetchall()
+
+                with target_manager.transaction(db_type):
+                    for table, sql in tables:
+                        # Таблицы, которых нет в общей схеме, переносим как есть
+                        exists = conn.execute(
+                            "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                            (table,),
+                        ).fetchone()
+                        if not exists:
+                            conn.execute(sql)
+
+                        written = _sync_table(conn, table)
+                        copied[table] = copied.get(table, 0) + written
+                        logger.info(f"Migrated {written} rows of {table} from {source}")
+            finally:
+                conn.execute("DETACH DATABASE legacy")
+    finally:
+        target_manager.close_all()
+
+    return copied
+
+
+class DBResult:
+    """Результат запроса, выполненного в потоке БД (строки уже прочитаны)"""
+
+    __slots__ = ("rows", "lastrowid", "rowcount")
+
+    def __init__(self, rows, lastrowid, rowcount):
+        self.rows = rows
+        self.lastrowid = lastrowid
+        self.rowcount = rowcount
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class AsyncDBManager:
+    """Асинхронная обёртка над DBManager.
+
+    Запросы выполняются вне event loop: все записи идут через один поток-писатель,
+    чтения - через небольшой пул потоков. У каждого потока свои соединения,
+    WAL позволяет читать параллельно с записью. Синхронный API DBManager
+    продолжает работать, модули можно переводить постепенно:
+    ``db_manager.execute(...)`` -> ``await async_db.execute(...)``.
+    """
+
+    def __init__(self, manager, readers=2):
+        self._manager = manager
+        self._readers_count = readers
+        self._writer = None
+        self._readers = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = []
+        self._generation = 0
+
+    def _executors(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="db-writer"
+                )
+                self._readers = ThreadPoolExecutor(
+                    max_workers=self._readers_count, thread_name_prefix="db-reader"
+                )
+            return self._writer, self._readers
+
+    def _thread_connection(self, db_type):
+        """Соединение текущего потока (создается при первом обращении)"""
+        connections = getattr(self._local, "connections", None)
+        if connections is None or self._local.generation != self._generation:
+            connections = self._local.connections = {}
+            self._local.generation = self._generation
+
+        db_file = self._manager.get_db_file(db_type)
+        conn = connections.get(db_file)
+        if conn is None:
+            conn = self._manager._open_connection(db_file, check_same_thread=False)
+            connections[db_file] = conn
+            with self._lock:
+                self._opened.append(conn)
+        return conn
+
+    def _run(self, db_type, query, params, many=False):
+        conn = self._thread_connection(db_type)
+        try:
+            cursor = conn.cursor()
+            if many:
+                cursor.executemany(query, params)
+            else:
+                cursor.execute(query, params)
+            rows = cursor.fetchall() if cursor.description else []
+            conn.commit()
+            return DBResult(rows, cursor.lastrowid, cursor.rowcount)
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Async database error: {e}")
+            raise
+
+    async def _submit(self, executor, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(self._run, *args))
+
+    async def execute(self, db_type, query, params=()):
+        """Выполняет запрос в потоке-писателе и возвращает DBResult"""
+        writer, _ = self._executors()
+        return await self._submit(writer, db_type, query, params)
+
+    async def executemany(self, db_type, query, seq_of_params):
+        """Выполняет пакет запросов одним коммитом в потоке-писателе"""
+        writer, _ = self._executors()
+        return await self._submit(writer, db_type, query, list(seq_of_params), True)
+
+    def _run_transaction(self, db_type, func):
+        conn = self._thread_connection(db_type)
+        try:
+            result = func(conn)
+            conn.commit()
+            return result
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Async transaction error: {e}")
+            raise
+
+    async def run_in_transaction(self, db_type, func):
+        """Вызывает func(conn) в потоке-писателе и коммитит один раз в конце"""
+        writer, _ = self._executors()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            writer, partial(self._run_transaction, db_type, func)
+        )
+
+    async def fetchall(self, db_type, query, params=()):
+        """Выполняет запрос на чтение в пуле читателей"""
+        _, readers = self._executors()
+        result = await self._submit(readers, db_type, query, params)
+        return result.rows
+
+    async def fetchone(self, db_type, query, params=()):
+        """Выполняет запрос на чтение и возвращает одну строку"""
+        _, readers = self._executors()
+        result = await self._submit(readers, db_type, query, params)
+        return result.fetchone()
+
+    def close(self):
+        """Закрывает соединения потоков (они будут открыты заново при следующем запросе)"""
+        with self._lock:
+            self._generation += 1
+            opened, self._opened = self._opened, []
+        for conn in opened:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"Error closing async connection: {e}")
+
+    def shutdown(self):
+        """Дожидается запросов в потоках и закрывает соединения (при остановке бота)"""
+        with self._lock:
+            executors = (self._writer, self._readers)
+            self._writer = self._readers = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self.close()
+
+
 # Глобальный экземпляр менеджера БД
 db_manager = DBManager()
+# Асинхронный доступ к тем же базам
+async_db = AsyncDBManager(db_manager)
 
 
 # Декоратор для автоматического управления соединениями
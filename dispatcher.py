@@ -0,0 +1,223 @@
+"""Очередь исходящих сообщений (ЛС и каналы) с учетом лимитов Discord."""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger("dispatcher")
+
+# Ограничения Discord на одно сообщение
+MAX_CONTENT = 2000
+MAX_EMBEDS = 10
+
+
+class TokenBucket:
+    """Не больше capacity отправок за per секунд"""
+
+    __slots__ = ("capacity", "per", "tokens", "updated")
+
+    def __init__(self, capacity, per):
+        self.capacity = capacity
+        self.per = per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Забирает токен; возвращает 0 или сколько секунд ждать до следующего"""
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.capacity / self.per
+        )
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) * self.per / self.capacity
+
+    async def acquire(self):
+        while True:
+            delay = self.take()
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+
+class OutboundDispatcher:
+    """Отправляет сообщения в фоне, не блокируя вызывающий код.
+
+    send_user()/send_channel() только ставят сообщение в очередь своего
+    адресата (маршрута) и сразу возвращаются. Воркеры обходят маршруты по
+    очереди, соблюдая лимит маршрута и общий лимит бота; подряд идущие
+    сообщения одному адресату склеиваются в одно (текст при этом
+    отображается над embed'ами). Сетевые ошибки и 5xx повторяются с
+    экспоненциальной задержкой, 403/404 (закрытые ЛС, удаленный канал) - нет.
+    Всего в очереди не больше maxsize сообщений, лишние отбрасываются.
+    """
+
+    def __init__(
+        self,
+        maxsize=2000,
+        workers=4,
+        route_rate=(5, 5.0),
+        global_rate=(40, 1.0),
+        retries=3,
+        backoff=1.0,
+    ):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.route_rate = route_rate
+        self.retries = retries
+        self.backoff = backoff
+        self._global_bucket = TokenBucket(*global_rate)
+        self._buckets = {}  # маршрут -> TokenBucket
+        self._routes = {}  # маршрут -> deque сообщений
+        self._scheduled = set()  # маршруты в _ready или у воркера
+        self._pending = 0
+        self._bot = None
+        self._users = None
+        # Создаются в start(), когда event loop уже запущен
+        self._ready = None
+        self._tasks = []
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self, bot, users=None):
+        """Запускает воркеры (вызывается из setup_hook).
+
+        users - объект с async fetch(user_id) (UserResolver); без него
+        пользователи берутся через get_user/fetch_user бота.
+        """
+        self._bot = bot
+        self._users = users
+        self._ready = asyncio.Queue()
+        for route in self._routes:
+            self._scheduled.add(route)
+            self._ready.put_nowait(route)
+        self._tasks = [
+            asyncio.get_running_loop().create_task(self._worker())
+            for _ in range(self.workers)
+        ]
+
+    def send_user(self, user_id, content=None, embed=None):
+        """Ставит в очередь ЛС пользователю; False - очередь переполнена"""
+        return self._enqueue(("user", int(user_id)), content, embed)
+
+    def send_channel(self, channel, content=None, embed=None):
+        """Ставит в очередь сообщение в канал (объект канала или его ID)"""
+        return self._enqueue(("channel", int(getattr(channel, "id", channel))), content, embed)
+
+    def _enqueue(self, route, content, embed):
+        if self._pending >= self.maxsize:
+            self.dropped += 1
+            logger.warning(f"Outbound queue is full, dropped message to {route}")
+            return False
+        self._routes.setdefault(route, deque()).append(
+            {"content": content, "embeds": [embed] if embed else [], "attempts": 0}
+        )
+        self._pending += 1
+        if route not in self._scheduled and self._ready is not None:
+            self._scheduled.add(route)
+            self._ready.put_nowait(route)
+        return True
+
+    def pending(self):
+        return self._pending
+
+    async def join(self):
+        """Ждет, пока все поставленные сообщения не будут обработаны"""
+        while self._pending:
+            await asyncio.sleep(0.05)
+
+    def stats(self):
+        return {
+            "pending": self._pending,
+            "routes": len(self._routes),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    async def _worker(self):
+        while True:
+            route = await self._ready.get()
+            try:
+                await self._send_next(route)
+            except Exception as e:
+                logger.error(f"Dispatcher worker error on {route}: {e}")
+            finally:
+                if self._routes.get(route):
+                    # Возвращаем маршрут в конец - адресаты обслуживаются по кругу
+                    self._ready.put_nowait(route)
+                else:
+                    self._routes.pop(route, None)
+                    self._scheduled.discard(route)
+
+    def _take(self, queue):
+        """Снимает с маршрута сообщения, которые помещаются в одно"""
+        batch = [queue.popleft()]
+        content = batch[0]["content"] or ""
+        embeds = list(batch[0]["embeds"])
+        while queue:
+            message = queue[0]
+            merged = "\n\n".join(part for part in (content, message["content"]) if part)
+            if len(merged) > MAX_CONTENT or len(embeds) + len(message["embeds"]) > MAX_EMBEDS:
+                break
+            batch.append(queue.popleft())
+            content = merged
+            embeds.extend(message["embeds"])
+        return batch, content, embeds
+
+    async def _send_next(self, route):
+        queue = self._routes[route]
+        batch, content, embeds = self._take(queue)
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = TokenBucket(*self.route_rate)
+        await bucket.acquire()
+        await self._global_bucket.acquire()
+
+        try:
+            target = await self._resolve(route)
+            await target.send(content=content or None, embeds=embeds)
+        except Exception as e:
+            attempts = batch[0]["attempts"] + 1
+            if attempts > self.retries or not self._retriable(e):
+                self._pending -= len(batch)
+                self.failed += len(batch)
+                logger.warning(f"Failed to send {len(batch)} message(s) to {route}: {e}")
+                return
+            self.retried += 1
+            for message in batch:
+                message["attempts"] = attempts
+            # Маршрут занят этим воркером, поэтому порядок сообщений сохраняется
+            queue.extendleft(reversed(batch))
+            await asyncio.sleep(self.backoff * 2 ** (attempts - 1))
+            return
+
+        self._pending -= len(batch)
+        self.sent += 1
+        self.coalesced += len(batch) - 1
+
+    async def _resolve(self, route):
+        kind, target_id = route
+        if kind == "user":
+            if self._users is not None:
+                return await self._users.fetch(target_id)
+            return self._bot.get_user(target_id) or await self._bot.fetch_user(target_id)
+        return self._bot.get_channel(target_id) or await self._bot.fetch_channel(target_id)
+
+    @staticmethod
+    def _retriable(error):
+        status = getattr(error, "status", None)
+        if status is not None:
+            return status == 429 or status >= 500
+        return isinstance(error, (OSError, asyncio.TimeoutError))
+
+
+dispatcher = OutboundDispatcher()
@@ -0,0 +1,25 @@
+"""Расчет ELO (без зависимостей от discord)."""
+
+# Начальный рейтинг режима (как DEFAULT 1000 в схеме players)
+DEFAULT_RATING = 1000
+
+# Суффиксы колонок статистики для режимов (elo_*, wins_*, losses_*, ties_*);
+# ключи - MODES из config.py. У режима Any своего рейтинга нет
+MODE_COLUMN_SUFFIXES = {
+    1: "station5f",
+    2: "mots",
+    3: "12min",
+}
+
+
+def calculate_elo(player1_rating, player2_rating, result, K=40, C=400, max_rating=4000):
+    expected_1 = 1 / (1 + 10 ** ((player2_rating - player1_rating) / C))
+    expected_2 = 1 - expected_1
+
+    weight_1 = max_rating / (max_rating + player1_rating)
+    weight_2 = max_rating / (max_rating + player2_rating)
+
+    new_rating_1 = player1_rating + K * (result - expected_1) * weight_1
+    new_rating_2 = player2_rating + K * ((1 - result) - expected_2) * weight_2
+
+    return round(new_rating_1), round(new_rating_2)
@@ -0,0 +1,136 @@
+"""Пересчет рейтингов по истории матчей на NumPy.
+
+Использование: python elo_batch.py [--apply] [K=40] [C=400] [max_rating=4000]
+
+То же, что elo_replay.py, но для больших историй и подбора параметров
+calculate_elo: матчи режима раскладываются на "волны" - в одной волне нет
+двух матчей с общим игроком, - и каждая волна считается векторно. Порядок
+матчей каждого игрока (порядок подтверждения, см. elo_replay) сохраняется, поэтому результат совпадает с
+последовательным calculate_elo. NumPy нужен только для этого модуля.
+"""
+
+import sys
+
+from db_manager import db_manager
+from elo import calculate_elo, DEFAULT_RATING, MODE_COLUMN_SUFFIXES
+from elo_replay import load_history, apply_ratings, diff_ratings
+
+try:
+    import numpy as np
+except ImportError:  # NumPy - необязательная зависимость
+    np = None
+
+# Дробная часть в пределах этого от .5 - округление перепроверяется через
+# calculate_elo (pow в NumPy может отличаться от math на последний бит)
+ROUNDING_EPSILON = 1e-7
+
+
+def load_matches(manager=db_manager):
+    """Матчи истории в виде массивов: индексы игроков, режим, исход"""
+    if np is None:
+        raise RuntimeError("Для elo_batch нужен NumPy: pip install numpy")
+    rows = load_history(manager)
+    index = {}
+    names = []
+
+    def player_index(name):
+        player = index.get(name)
+        if player is None:
+            player = index[name] = len(names)
+            names.append(name)
+        return player
+
+    player1 = np.fromiter((player_index(row[0]) for row in rows), np.int64, len(rows))
+    player2 = np.fromiter((player_index(row[1]) for row in rows), np.int64, len(rows))
+    mode = np.fromiter((row[2] for row in rows), np.int64, len(rows))
+    score1 = np.fromiter((row[3] for row in rows), np.int64, len(rows))
+    score2 = np.fromiter((row[4] for row in rows), np.int64, len(rows))
+    result = np.where(score1 > score2, 1.0, np.where(score1 < score2, 0.0, 0.5))
+    return names, player1, player2, mode, result
+
+
+def assign_waves(player1, player2, players):
+    """Номер волны каждого матча: на 1 больше последней волны его игроков"""
+    last = [0] * players
+    waves = []
+    append = waves.append
+    for p1, p2 in zip(player1.tolist(), player2.tolist()):
+        wave = max(last[p1], last[p2]) + 1
+        last[p1] = last[p2] = wave
+        append(wave)
+    return np.array(waves, dtype=np.int64)
+
+
+def _rate_wave(r1, r2, result, K, C, max_rating):
+    # Те же операции и в том же порядке, что в calculate_elo
+    expected_1 = 1 / (1 + 10 ** ((r2 - r1) / C))
+    expected_2 = 1 - expected_1
+    weight_1 = max_rating / (max_rating + r1)
+    weight_2 = max_rating / (max_rating + r2)
+    new_1 = r1 + K * (result - expected_1) * weight_1
+    new_2 = r2 + K * ((1 - result) - expected_2) * weight_2
+    return new_1, new_2
+
+
+def replay_mode(player1, player2, result, players, initial=DEFAULT_RATING, K=40, C=400, max_rating=4000):
+    """Рейтинги всех players игроков после матчей одного режима"""
+    ratings = np.full(players, initial, dtype=np.int64)
+    if not len(player1):
+        return ratings
+    waves = assign_waves(player1, player2, players)
+    order = np.argsort(waves, kind="stable")
+    bounds = np.flatnonzero(np.diff(waves[order])) + 1
+    for batch in np.split(order, bounds):
+        p1 = player1[batch]
+        p2 = player2[batch]
+        res = result[batch]
+        r1 = ratings[p1]
+        r2 = ratings[p2]
+        new_1, new_2 = _rate_wave(r1, r2, res, K, C, max_rating)
+        rounded_1 = np.rint(new_1).astype(np.int64)
+        rounded_2 = np.rint(new_2).astype(np.int64)
+        # round() в Python - банковское, как np.rint; спорные .5 пересчитываем
+        doubtful = np.flatnonzero(
+            (np.abs(np.abs(new_1 - np.trunc(new_1)) - 0.5) < ROUNDING_EPSILON)
+            | (np.abs(np.abs(new_2 - np.trunc(new_2)) - 0.5) < ROUNDING_EPSILON)
+        )
+        for i in doubtful.tolist():
+            rounded_1[i], rounded_2[i] = calculate_elo(
+                int(r1[i]), int(r2[i]), float(res[i]), K, C, max_rating
+            )
+        ratings[p1] = rounded_1
+        ratings[p2] = rounded_2
+    return ratings
+
+
+def replay_all(names, player1, player2, mode, result, initial=DEFAULT_RATING, **elo_params):
+    """{(ник, режим): рейтинг} для игроков, сыгравших в режиме (как replay_ratings)"""
+    ratings = {}
+    for mode_id in MODE_COLUMN_SUFFIXES:
+        selected = mode == mode_id
+        p1 = player1[selected]
+        p2 = player2[selected]
+        mode_ratings = replay_mode(
+            p1, p2, result[selected], len(names), initial, **elo_params
+        )
+        for player in np.unique(np.concatenate((p1, p2))).tolist():
+            ratings[(names[player], mode_id)] = int(mode_ratings[player])
+    return ratings
+
+
+def replay_from_db(manager=db_manager, **elo_params):
+    return replay_all(*load_matches(manager), **elo_params)
+
+
+if __name__ == "__main__":
+    params = {}
+    for arg in sys.argv[1:]:
+        if "=" in arg:
+            key, value = arg.split("=", 1)
+            params[key] = float(value)
+    ratings = replay_from_db(**params)
+    if "--apply" in sys.argv[1:]:
+        changed = apply_ratings(ratings)
+        print(f"Рейтинги пересчитаны, изменено значений: {changed}")
+    else:
+        print(f"Расхождений с историей матчей: {len(diff_ratings(ratings))}")
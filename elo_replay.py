@@ -0,0 +1,135 @@
+"""Пересчет рейтингов по истории матчей.
+
+Использование: python elo_replay.py [--apply]
+
+Без --apply только сравнивает пересчитанные рейтинги с текущими и выводит
+расхождения. С --apply записывает пересчитанные рейтинги в players (и
+события replay в rating_events) одной транзакцией - бот при этом должен
+быть остановлен, иначе его кеш игроков разойдется с базой.
+
+Матчи проигрываются в порядке подтверждения - по первому событию матча в
+rating_events (рейтинг зависит от порядка матчей, а подтверждают их не в
+порядке создания), начиная с DEFAULT_RATING у каждого игрока в каждом
+режиме. Матчи без событий (подтвержденные до появления rating_events) идут
+первыми в порядке matchid. Учитываются завершенные и подтвержденные обычные
+матчи со счетом; равный счет - ничья. Режим Any рейтинг не меняет.
+"""
+
+import sys
+
+from db_manager import db_manager
+from elo import calculate_elo, DEFAULT_RATING, MODE_COLUMN_SUFFIXES
+
+REPLAY_QUERY = """
+    SELECT matchid, player1, player2, mode, player1score, player2score
+    FROM matches
+    WHERE matchtype = 1 AND isover = 1 AND isverified = 1
+      AND player1score IS NOT NULL AND player2score IS NOT NULL
+    ORDER BY matchid
+"""
+
+# Порядок подтверждения матчей (rating_events лежит в базе players)
+CONFIRMATION_ORDER_QUERY = """
+    SELECT match_id, MIN(eventid) FROM rating_events
+    WHERE match_id IS NOT NULL
+    GROUP BY match_id
+"""
+
+
+def load_history(manager=db_manager):
+    """Матчи истории (player1, player2, mode, score1, score2) в порядке подтверждения"""
+    order = dict(manager.fetchall("players", CONFIRMATION_ORDER_QUERY))
+    rows = manager.fetchall("matches", REPLAY_QUERY)
+    # Матчи без событий старше истории рейтингов - они идут первыми
+    rows.sort(
+        key=lambda row: (0, row[0]) if row[0] not in order else (1, order[row[0]])
+    )
+    return [row[1:] for row in rows]
+
+
+def replay_ratings(matches, initial=DEFAULT_RATING):
+    """Проигрывает матчи (player1, player2, mode, score1, score2) за один проход.
+
+    Возвращает {(ник, режим): рейтинг} для игроков, сыгравших в режиме.
+    Рейтинги - целые в узком диапазоне, поэтому результаты calculate_elo
+    запоминаются по (рейтинг1, рейтинг2, исход) и почти не пересчитываются.
+    """
+    ratings = {}
+    get = ratings.get
+    computed = {}
+    for player1, player2, mode, score1, score2 in matches:
+        if mode not in MODE_COLUMN_SUFFIXES:
+            continue
+        key1 = (player1, mode)
+        key2 = (player2, mode)
+        result = 1 if score1 > score2 else 0 if score1 < score2 else 0.5
+        args = (get(key1, initial), get(key2, initial), result)
+        new_ratings = computed.get(args)
+        if new_ratings is None:
+            new_ratings = computed[args] = calculate_elo(*args)
+        ratings[key1], ratings[key2] = new_ratings
+    return ratings
+
+
+def replay_from_db(manager=db_manager):
+    """Пересчитывает рейтинги по таблице matches в порядке подтверждения"""
+    return replay_ratings(load_history(manager))
+
+
+def _player_ratings(manager):
+    columns = [f"elo_{suffix}" for suffix in MODE_COLUMN_SUFFIXES.values()]
+    rows = manager.fetchall(
+        "players", f"SELECT playername, {', '.join(columns)} FROM players"
+    )
+    return {row[0]: dict(zip(MODE_COLUMN_SUFFIXES, row[1:])) for row in rows}
+
+
+def diff_ratings(ratings, manager=db_manager, initial=DEFAULT_RATING):
+    """Расхождения (ник, режим, в базе, по истории) для игроков из players"""
+    diffs = []
+    for name, stored in _player_ratings(manager).items():
+        for mode, value in stored.items():
+            replayed = ratings.get((name, mode), initial)
+            if value != replayed:
+                diffs.append((name, mode, value, replayed))
+    return diffs
+
+
+def apply_ratings(ratings, manager=db_manager, initial=DEFAULT_RATING):
+    """Записывает пересчитанные рейтинги; возвращает число измененных значений"""
+    diffs = diff_ratings(ratings, manager, initial)
+    with manager.transaction("players"):
+        for mode, suffix in MODE_COLUMN_SUFFIXES.items():
+            manager.executemany(
+                "players",
+                f"UPDATE players SET elo_{suffix} = ? WHERE playername = ?",
+                [(replayed, name) for name, m, _, replayed in diffs if m == mode],
+            )
+        manager.execute(
+            "players",
+            f"""
+            UPDATE players
+            SET currentelo = {' + '.join(f'elo_{s}' for s in MODE_COLUMN_SUFFIXES.values())}
+            """,
+        )
+        manager.executemany(
+            "players",
+            """
+            INSERT INTO rating_events (playername, mode, old_rating, new_rating, match_id, reason)
+            VALUES (?, ?, ?, ?, NULL, 'replay')
+            """,
+            diffs,
+        )
+    return len(diffs)
+
+
+if __name__ == "__main__":
+    ratings = replay_from_db()
+    if "--apply" in sys.argv[1:]:
+        changed = apply_ratings(ratings)
+        print(f"Рейтинги пересчитаны, изменено значений: {changed}")
+    else:
+        diffs = diff_ratings(ratings)
+        print(f"Расхождений с историей матчей: {len(diffs)}")
+        for name, mode, stored, replayed in diffs:
+            print(f"  {name} (режим {mode}): в базе {stored}, по истории {replayed}")
@@ -0,0 +1,55 @@
+"""Внутренняя шина событий бота (без зависимостей от discord)."""
+
+import asyncio
+import logging
+
+logger = logging.getLogger("events")
+
+# Матч завершен (isover = 1): match_id, player1_score, player2_score
+# (счет None, если матч закрыт без результата - например, по репорту)
+MATCH_FINISHED = "match_finished"
+
+
+class EventBus:
+    """Подписчики событий по имени.
+
+    publish() вызывает обработчики по очереди и ждет их; ошибка одного
+    обработчика логируется и не мешает остальным. emit() - то же из
+    синхронного кода: публикация запускается задачей и выполнится, когда
+    вызывающий код отдаст управление (то есть после его транзакции).
+    """
+
+    def __init__(self):
+        self._handlers = {}  # событие -> [async-обработчик]
+        self._tasks = set()
+
+    def subscribe(self, event, handler):
+        self._handlers.setdefault(event, []).append(handler)
+
+    def unsubscribe(self, event, handler):
+        handlers = self._handlers.get(event, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    async def publish(self, event, **payload):
+        for handler in list(self._handlers.get(event, ())):
+            try:
+                await handler(**payload)
+            except Exception as e:
+                logger.error(f"Handler {handler.__qualname__} failed on {event}: {e}")
+
+    def emit(self, event, **payload):
+        if not self._handlers.get(event):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне event loop (скрипты обслуживания) подписчиков-ботов нет
+            logger.debug(f"No running loop, {event} dropped")
+            return
+        task = loop.create_task(self.publish(event, **payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+events = EventBus()
@@ -0,0 +1,203 @@
+"""Лидерборд в памяти: места игроков по режимам (без зависимостей от discord)."""
+
+import logging
+from bisect import bisect_left, insort
+
+from db_manager import db_manager
+
+logger = logging.getLogger("leaderboard")
+
+# Режимы лидерборда -> колонка рейтинга (ключи - LEADERBOARD_MODES из config.py)
+LEADERBOARD_COLUMNS = {
+    "overall": "currentelo",
+    "station5flags": "elo_station5f",
+    "mots": "elo_mots",
+    "12min": "elo_12min",
+}
+
+
+class RankedList:
+    """Игроки одного режима, отсортированные по убыванию рейтинга.
+
+    Хранятся ключи (-рейтинг, ник): место игрока и страница находятся
+    бинарным поиском, при равном рейтинге выше тот, чей ник меньше.
+    """
+
+    __slots__ = ("_keys", "_ratings")
+
+    def __init__(self):
+        self._keys = []
+        self._ratings = {}  # ник -> рейтинг
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, name):
+        return name in self._ratings
+
+    def load(self, ratings):
+        """Заполняет список парами (ник, рейтинг) с одной сортировкой"""
+        self._ratings = dict(ratings)
+        self._keys = sorted((-rating, name) for name, rating in self._ratings.items())
+
+    def set(self, name, rating):
+        old = self._ratings.get(name)
+        if old == rating:
+            return
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, name))]
+        self._ratings[name] = rating
+        insort(self._keys, (-rating, name))
+
+    def remove(self, name):
+        old = self._ratings.pop(name, None)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (-old, name))]
+
+    def rank(self, name):
+        """Место игрока (с 1) или None"""
+        rating = self._ratings.get(name)
+        if rating is None:
+            return None
+        return bisect_left(self._keys, (-rating, name)) + 1
+
+    def slice(self, start, stop):
+        """[(место, ник, рейтинг)] для мест start+1..stop"""
+        start = max(start, 0)
+        return [
+            (place, name, -rating)
+            for place, (rating, name) in enumerate(self._keys[start:stop], start + 1)
+        ]
+
+
+class Leaderboard:
+    """Места игроков по каждому режиму лидерборда.
+
+    Загружается из players одним запросом, дальше обновляется через
+    update()/remove() там же, где меняются рейтинги. После отката транзакции
+    players перечитывается при следующем обращении. version растет при
+    каждой записи рейтинга (и bump() - при изменении статистики побед),
+    по нему сбрасываются отрисованные таблицы.
+    """
+
+    def __init__(self, manager, columns):
+        self._db = manager
+        self._columns = columns
+        self._lists = {}  # режим -> RankedList
+        self._by_column = {}  # колонка рейтинга -> RankedList
+        self._loaded = False
+        self.version = 0
+        manager.add_rollback_listener(lambda db_type: self._reset())
+
+    def _reset(self):
+        self._loaded = False
+        self.bump()
+
+    def bump(self):
+        """Отмечает, что данные лидерборда изменились"""
+        self.version += 1
+
+    def load_all(self):
+        rows = self._db.fetchall(
+            "players", f"SELECT playername, {', '.join(self._columns.values())} FROM players"
+        )
+        self._lists = {mode: RankedList() for mode in self._columns}
+        self._by_column = {
+            column: self._lists[mode] for mode, column in self._columns.items()
+        }
+        for i, ranked in enumerate(self._lists.values(), 1):
+            ranked.load((row[0], row[i]) for row in rows)
+        self._loaded = True
+        self.bump()
+        logger.info(f"Leaderboard loaded with {len(rows)} players")
+
+    def _ranked(self, mode):
+        if not self._loaded:
+            self.load_all()
+        return self._lists[mode]
+
+    def update(self, playername, **columns):
+        """Применяет уже записанные в базу рейтинги (колонка=значение)"""
+        self.bump()
+        if not self._loaded:
+            return
+        for column, rating in columns.items():
+            ranked = self._by_column.get(column)
+            if ranked is not None:
+                ranked.set(playername, rating)
+
+    def remove(self, playername):
+        self.bump()
+        for ranked in self._lists.values():
+            ranked.remove(playername)
+
+    def size(self, mode):
+        return len(self._ranked(mode))
+
+    def pages(self, mode, per_page=10):
+        return max(1, -(-self.size(mode) // per_page))
+
+    def rank(self, mode, playername):
+        """Место игрока в режиме (с 1) или None"""
+        return self._ranked(mode).rank(playername)
+
+    def page(self, mode, page, per_page=10):
+        """[(место, ник, рейтинг)] на странице page (с 0)"""
+        return self._ranked(mode).slice(page * per_page, (page + 1) * per_page)
+
+    def page_of(self, mode, playername, per_page=10):
+        """Номер страницы (с 0), на которой игрок, или None"""
+        place = self.rank(mode, playername)
+        return None if place is None else (place - 1) // per_page
+
+    def around(self, mode, playername, radius=2):
+        """Игрок и до radius соседей выше и ниже него"""
+        place = self.rank(mode, playername)
+        if place is None:
+            return []
+        return self._ranked(mode).slice(place - 1 - radius, place + radius)
+
+
+class RenderCache:
+    """Отрисованные страницы лидерборда, пока не изменилась его версия.
+
+    get(key, render) возвращает запомненный результат render() для key;
+    как только source.version меняется, все запомненное сбрасывается.
+    """
+
+    def __init__(self, source):
+        self._source = source
+        self._version = None
+        self._items = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        if self._version != self._source.version:
+            self._items.clear()
+            self._version = self._source.version
+        item = self._items.get(key)
+        if item is not None:
+            self.hits += 1
+            return item
+        self.misses += 1
+        item = render()
+        if self._version != self._source.version:
+            # render() мог сам перечитать лидерборд
+            self._items.clear()
+            self._version = self._source.version
+        self._items[key] = item
+        return item
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "cached": len(self._items),
+        }
+
+
+leaderboard = Leaderboard(db_manager, LEADERBOARD_COLUMNS)
+leaderboard_embeds = RenderCache(leaderboard)
@@ -22,11 +22,18 @@ from verification import (
 )
 from ban import setup as setup_ban
 from queueing import setup as setup_queueing, ConfirmMatchView, find_match
-from queueing import check_expired_matches
+from queueing import check_expired_matches, update_match_stats, restore_queues
+from queueing import confirmation_deadlines
 import re
 from discord.ui import View, Button, Select
 import discord
-from db_manager import db_manager
+from db_manager import db_manager, async_db
+from player_cache import player_cache
+from leaderboard import leaderboard, leaderboard_embeds
+from dispatcher import dispatcher
+from user_cache import user_resolver
+from channel_registry import channel_registry
+from startup import startup
 
 load_dotenv()
 token = os.getenv("DISCORD_TOKEN")
@@ -35,11 +42,12 @@ handler = logging.FileHandler(filename="discord.log", encoding="utf-8", mode="w"
 
 
 class LeaderboardView(discord.ui.View):
-    """View с кнопками для переключения режимов лидерборда"""
+    """View с кнопками режимов и страниц лидерборда"""
 
-    def __init__(self, current_mode):
+    def __init__(self, current_mode, page=0, pages=1):
         super().__init__(timeout=180)
         self.current_mode = current_mode
+        self.page = page
 
         # Создаем кнопки для всех режимов
         modes = [
@@ -58,12 +66,50 @@ class LeaderboardView(discord.ui.View):
             button.callback = lambda i, m=mode: self.button_callback(i, m)
             self.add_item(button)
 
-    async def button_callback(self, interaction: discord.Interaction, mode: str):
+        # Вторая строка - листание страниц и переход к своему месту
+        navigation = [
+            ("◀", "lb_prev", page - 1, page <= 0),
+            ("▶", "lb_next", page + 1, page >= pages - 1),
+        ]
+        for label, custom_id, target, disabled in navigation:
+            button = discord.ui.Button(
+                label=label,
+                style=discord.ButtonStyle.grey,
+                custom_id=custom_id,
+                disabled=disabled,
+                row=1,
+            )
+            button.callback = lambda i, p=target: self.button_callback(
+                i, self.current_mode, p
+            )
+            self.add_item(button)
+
+        me_button = discord.ui.Button(
+            label="📍 Моё место",
+            style=discord.ButtonStyle.grey,
+            custom_id="lb_me",
+            row=1,
+        )
+        me_button.callback = self.me_callback
+        self.add_item(me_button)
+
+    async def button_callback(self, interaction: discord.Interaction, mode: str, page=0):
         """Обработчик нажатия кнопки"""
-        # Обновляем лидерборд для выбранного режима
-        await send_leaderboard(interaction, mode)
+        # Обновляем лидерборд для выбранного режима и страницы
+        await send_leaderboard(interaction, mode, page)
         await interaction.response.defer()
 
+    async def me_callback(self, interaction: discord.Interaction):
+        """Открывает страницу с игроком, нажавшим кнопку"""
+        player = player_cache.by_discordid(interaction.user.id)
+        page = player and leaderboard.page_of(self.current_mode, player.playername)
+        if page is None:
+            await interaction.response.send_message(
+                "❌ Вы не зарегистрированы в рейтинге", ephemeral=True
+            )
+            return
+        await self.button_callback(interaction, self.current_mode, page)
+
     async def on_timeout(self):
         """Делаем все кнопки неактивными после таймаута"""
         for item in self.children:
@@ -79,24 +125,6 @@ class LeaderboardView(discord.ui.View):
 async def on_ready():
     print(f"Бот {bot.user.name} запущен!")
 
-    # Сбрасываем флаги в очереди в БД
-    try:
-        db_manager.execute("players", "UPDATE players SET in_queue = 0")
-        print("[INIT] Сброшены флаги in_queue для всех игроков")
-    except Exception as e:
-        print(f"[INIT] Ошибка сброса флагов: {e}")
-
-    # Восстанавливаем очереди из БД
-    try:
-        players_in_queue = db_manager.fetchall(
-            "players", "SELECT playername, discordid FROM players WHERE in_queue = 1"
-        )
-    except Exception as e:
-        print(f"[INIT] Ошибка восстановления очереди: {e}")
-
-    # Создаем фоновую задачу
-    bot.loop.create_task(check_expired_matches(bot))
-
     # Проверяем и создаём необходимые роли/каналы
     for guild in bot.guilds:
         queue_channel = discord.utils.get(guild.text_channels, name="elobot-queue")
@@ -146,7 +174,8 @@ async def help(ctx):
         name="📊 Статистика и информация",
         value=(
             "`.playerinfo <ник>` - Полная статистика игрока\n"
-            "`.leaderboard` - Топ игроков с фильтрами по режимам\n"
+            "`.leaderboard` - Таблица лидеров по режимам со страницами\n"
+            "`.rank [ник]` - Места игрока во всех режимах\n"
             "`.matchinfo <ID>` - Информация о конкретном матче"
         ),
         inline=False,
@@ -203,27 +232,54 @@ async def help(ctx):
         discord.ui.Button(
             label="Канал очереди",
             style=discord.ButtonStyle.link,
-            url=f"https://discord.com/channels/{ctx.guild.id}/{discord.utils.get(ctx.guild.channels, name='elobot-queue').id}",
+            url=f"https://discord.com/channels/{ctx.guild.id}/{channel_registry.get('queue', ctx.guild).id}",
         )
     )
     view.add_item(
         discord.ui.Button(
             label="Канал верификации",
             style=discord.ButtonStyle.link,
-            url=f"https://discord.com/channels/{ctx.guild.id}/{discord.utils.get(ctx.guild.channels, name='elobot-verify').id}",
+            url=f"https://discord.com/channels/{ctx.guild.id}/{channel_registry.get('verify', ctx.guild).id}",
         )
     )
     view.add_item(
         discord.ui.Button(
             label="Канал результатов",
             style=discord.ButtonStyle.link,
-            url=f"https://discord.com/channels/{ctx.guild.id}/{discord.utils.get(ctx.guild.channels, name='elobot-results').id}",
+            url=f"https://discord.com/channels/{ctx.guild.id}/{channel_registry.get('results', ctx.guild).id}",
         )
     )
 
     await ctx.send(embed=embed, view=view)
 
 
+@bot.command()
+async def cachestats(ctx):
+    """Статистика кешей игроков, пользователей Discord и лидерборда (только для модератора)"""
+    if ctx.author.id != MODERATOR_ID:
+        return await ctx.send("❌ Только модератор может использовать эту команду")
+
+    stats = player_cache.stats()
+    await ctx.send(
+        f"Кеш игроков: {stats['players']} игроков, "
+        f"попаданий {stats['hits']}, промахов {stats['misses']} "
+        f"({stats['hit_rate']:.1%}), отсутствующих {stats['missing']}"
+    )
+    users = user_resolver.stats()
+    await ctx.send(
+        f"Кеш пользователей Discord: {users['cached']} в кеше, "
+        f"gateway {users['gateway_hits']}, попаданий {users['hits']}, "
+        f"запросов к API {users['misses']}, склеено {users['deduplicated']} "
+        f"({users['hit_rate']:.1%} без API)"
+    )
+    embeds = leaderboard_embeds.stats()
+    await ctx.send(
+        f"Кеш лидерборда: {embeds['cached']} страниц, "
+        f"попаданий {embeds['hits']}, отрисовок {embeds['misses']} "
+        f"({embeds['hit_rate']:.1%})"
+    )
+
+
 @bot.command()
 async def playerinfo(ctx, nickname: str):
     """Показывает информацию об игроке"""
@@ -282,38 +338,50 @@ async def leaderboard(ctx):
     await send_leaderboard(ctx, "overall")
 
 
-async def send_leaderboard(source, mode_key):
-    """Универсальная функция отправки/обновления лидерборда"""
-    elo_col, wins_col, losses_col, ties_col = LEADERBOARD_MODES[mode_key]
+LEADERBOARD_PAGE_SIZE = 10
 
-    leaders = db_manager.fetchall(
+LEADERBOARD_TITLES = {
+    "overall": "Общий рейтинг",
+    "station5flags": "Station 5 Flags",
+    "mots": "MotS Solo",
+    "12min": "12 Minute",
+}
+
+
+def leaderboard_stats(mode_key, names):
+    """{ник: (победы, поражения, ничьи)} в режиме одним запросом"""
+    if not names:
+        return {}
+    _, wins_col, losses_col, ties_col = LEADERBOARD_MODES[mode_key]
+    rows = db_manager.fetchall(
         "players",
         f"""
-        SELECT playername, {elo_col}, {wins_col}, {losses_col}, {ties_col}
-        FROM players 
-        ORDER BY {elo_col} DESC 
-        LIMIT 10
+        SELECT playername, {wins_col}, {losses_col}, {ties_col}
+        FROM players
+        WHERE playername IN ({', '.join('?' * len(names))})
         """,
+        tuple(names),
     )
+    return {row[0]: row[1:] for row in rows}
 
-    mode_names = {
-        "overall": "Общий рейтинг",
-        "station5flags": "Station 5 Flags",
-        "mots": "MotS Solo",
-        "12min": "12 Minute",
-    }
+
+def render_leaderboard(mode_key, page, pages):
+    """Embed страницы лидерборда (кешируется в leaderboard_embeds)"""
+    leaders = leaderboard.page(mode_key, page, LEADERBOARD_PAGE_SIZE)
+    stats = leaderboard_stats(mode_key, [name for _, name, _ in leaders])
 
     embed = discord.Embed(
-        title=f"🏆 Топ-10 игроков: {mode_names[mode_key]}",
+        title=f"🏆 Лидеры: {LEADERBOARD_TITLES[mode_key]}",
         color=discord.Color.gold(),
     )
 
-    for i, (name, elo, wins, losses, ties) in enumerate(leaders, 1):
+    for place, name, elo in leaders:
+        wins, losses, ties = stats.get(name, (0, 0, 0))
         total = wins + losses + ties
         winrate = (wins / total * 100) if total > 0 else 0
 
         embed.add_field(
-            name=f"{i}. {name}",
+            name=f"{place}. {name}",
             value=(
                 f"ELO: {elo}\n"
                 f"Победы: {wins} | Поражения: {losses} | Ничьи: {ties}\n"
@@ -322,15 +390,60 @@ async def send_leaderboard(source, mode_key):
             inline=False,
         )
 
-    embed.set_footer(text=f"Обновлено: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    embed.set_footer(
+        text=(
+            f"Страница {page + 1}/{pages} • Игроков: {leaderboard.size(mode_key)} • "
+            f"Обновлено: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        )
+    )
+    return embed
+
 
-    view = LeaderboardView(mode_key)
+async def send_leaderboard(source, mode_key, page=0):
+    """Универсальная функция отправки/обновления лидерборда"""
+    pages = leaderboard.pages(mode_key, LEADERBOARD_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    # Пока рейтинги не менялись, повторные нажатия не идут в базу
+    embed = leaderboard_embeds.get(
+        (mode_key, page), lambda: render_leaderboard(mode_key, page, pages)
+    )
+    view = LeaderboardView(mode_key, page, pages)
 
     if isinstance(source, discord.Interaction):
         view.message = source.message
         await source.message.edit(embed=embed, view=view)
     else:
-        source.leaderboard_message = await source.send(embed=embed, view=view)
+        view.message = await source.send(embed=embed, view=view)
+        source.leaderboard_message = view.message
+
+
+@bot.command()
+async def rank(ctx, nickname: str = None):
+    """Показывает места игрока во всех режимах и соседей в общем рейтинге"""
+    if nickname is None:
+        player = player_cache.by_discordid(ctx.author.id)
+        if not player:
+            return await ctx.send("❌ Вы не зарегистрированы в рейтинге")
+        nickname = player.playername
+
+    if leaderboard.rank("overall", nickname) is None:
+        return await ctx.send(f"Игрок с ником '{nickname}' не найден")
+
+    embed = discord.Embed(title=f"📍 Места игрока {nickname}", color=discord.Color.gold())
+    for mode_key, title in LEADERBOARD_TITLES.items():
+        embed.add_field(
+            name=title,
+            value=f"#{leaderboard.rank(mode_key, nickname)} из {leaderboard.size(mode_key)}",
+            inline=True,
+        )
+    neighbors = []
+    for place, name, elo in leaderboard.around("overall", nickname):
+        line = f"{place}. {name} - {elo}"
+        neighbors.append(f"**{line}**" if name == nickname else line)
+    embed.add_field(
+        name="Рядом в общем рейтинге", value="\n".join(neighbors), inline=False
+    )
+    await ctx.send(embed=embed)
 
 
 @bot.event
@@ -372,24 +485,19 @@ async def on_message(message):
         loser_score = min(score1, score2)
         is_player1_winner = score1 > score2
 
-        player_data = db_manager.fetchone(
-            "players",
-            "SELECT playername FROM players WHERE discordid = ?",
-            (str(message.author.id),),
-        )
+        player_data = player_cache.by_discordid(message.author.id)
         if not player_data:
             await message.channel.send("❌ Вы не зарегистрированы в системе")
             return
 
-        nickname = player_data[0]
+        nickname = player_data.playername
 
         match_data = db_manager.fetchone(
             "matches",
             """
             SELECT matchid, player1, player2, mode 
             FROM matches 
-            WHERE (player1 = ? OR player2 = ?) 
-            AND isover = 0
+            WHERE ((player1 = ? AND isover = 0) OR (player2 = ? AND isover = 0))
             """,
             (nickname, nickname),
         )
@@ -428,125 +536,16 @@ async def on_message(message):
             (player1_score, player2_score, match_id),
         )
 
-        # Обновляем статистику
-        if player1_score > player2_score:
-            db_manager.execute(
-                "players",
-                "UPDATE players SET wins = wins + 1 WHERE playername = ?",
-                (winner,),
-            )
-            db_manager.execute(
-                "players",
-                "UPDATE players SET losses = losses + 1 WHERE playername = ?",
-                (loser,),
-            )
-
-            if mode == MODES["station5f"]:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_station5f = wins_station5f + 1 WHERE playername = ?",
-                    (winner,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_station5f = losses_station5f + 1 WHERE playername = ?",
-                    (loser,),
-                )
-            elif mode == MODES["mots"]:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_mots = wins_mots + 1 WHERE playername = ?",
-                    (winner,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_mots = losses_mots + 1 WHERE playername = ?",
-                    (loser,),
-                )
-            elif mode == MODES["12min"]:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_12min = wins_12min + 1 WHERE playername = ?",
-                    (winner,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_12min = losses_12min + 1 WHERE playername = ?",
-                    (loser,),
-                )
-
-        elif player1_score < player2_score:
-            db_manager.execute(
-                "players",
-                "UPDATE players SET wins = wins + 1 WHERE playername = ?",
-                (winner,),
-            )
-            db_manager.execute(
-                "players",
-                "UPDATE players SET losses = losses + 1 WHERE playername = ?",
-                (loser,),
-            )
-
-            if mode == MODES["station5f"]:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_station5f = wins_station5f + 1 WHERE playername = ?",
-                    (winner,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_station5f = losses_station5f + 1 WHERE playername = ?",
-                    (loser,),
-                )
-            elif mode == MODES["mots"]:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_mots = wins_mots + 1 WHERE playername = ?",
-                    (winner,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_mots = losses_mots + 1 WHERE playername = ?",
-                    (loser,),
-                )
-            elif mode == MODES["12min"]:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_12min = wins_12min + 1 WHERE playername = ?",
-                    (winner,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_12min = losses_12min + 1 WHERE playername = ?",
-                    (loser,),
-                )
+        # Обновляем статистику (общую и по режиму) одной транзакцией
+        if player1_score != player2_score:
+            stats = [("wins", winner), ("losses", loser)]
         else:
-            db_manager.execute(
-                "players",
-                "UPDATE players SET ties = ties + 1 WHERE playername IN (?, ?)",
-                (player1, player2),
-            )
+            stats = [("ties", player1), ("ties", player2)]
 
-            if mode == MODES["station5f"]:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET ties_station5f = ties_station5f + 1 WHERE playername IN (?, ?)",
-                    (player1, player2),
-                )
-            elif mode == MODES["mots"]:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET ties_mots = ties_mots + 1 WHERE playername IN (?, ?)",
-                    (player1, player2),
-                )
-            elif mode == MODES["12min"]:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET ties_12min = ties_12min + 1 WHERE playername IN (?, ?)",
-                    (player1, player2),
-                )
+        with db_manager.transaction("players"):
+            update_match_stats(stats, mode)
 
-        moderator = await bot.fetch_user(MODERATOR_ID)
+        moderator = await user_resolver.fetch(MODERATOR_ID)
         embed = discord.Embed(
             title="⚠️ Требуется подтверждение матча",
             description=(
@@ -578,6 +577,8 @@ async def on_message(message):
 
 @bot.event
 async def on_disconnect():
+    # on_disconnect бывает и при переподключении к gateway - соединения
+    # потоков async_db не трогаем, они закрываются при остановке бота
     db_manager.close_all()
     print("Соединения с БД закрыты")
 
@@ -601,13 +602,9 @@ async def globally_check_ban(ctx):
     if ctx.author.id == MODERATOR_ID:
         return True
 
-    player = db_manager.fetchone(
-        "players",
-        "SELECT isbanned FROM players WHERE discordid = ?",
-        (str(ctx.author.id),),
-    )
+    player = player_cache.by_discordid(ctx.author.id)
 
-    if player and player[0] == 1:  # Если isbanned == 1
+    if player and player.isbanned == 1:
         await ctx.send("⛔ Вы забанены и не можете использовать команды бота.")
         return False
     return True
@@ -619,9 +616,26 @@ async def load_extensions():
 
 @bot.event
 async def setup_hook():
+    player_cache.load_all()
+    leaderboard.load_all()
+    user_resolver.attach(bot)
+    channel_registry.attach(bot)
+    startup.attach(bot)
+    # on_ready переопределяется модулями ролей и ников, поэтому очереди
+    # восстанавливаются здесь - до запуска матчмейкера
+    try:
+        restored = restore_queues()
+        print(f"[INIT] Восстановлено игроков в очередях: {restored}")
+    except Exception as e:
+        print(f"[INIT] Ошибка восстановления очереди: {e}")
     bot.loop.create_task(find_match())
     bot.loop.create_task(check_expired_matches(bot))
+    bot.loop.create_task(confirmation_deadlines.run())
+    dispatcher.start(bot, users=user_resolver)
     await load_extensions()
 
 
-bot.run(token, log_handler=handler, log_level=logging.DEBUG)
+try:
+    bot.run(token, log_handler=handler, log_level=logging.DEBUG)
+finally:
+    async_db.shutdown()
@@ -0,0 +1,323 @@
+"""Структуры данных матчмейкера (без зависимостей от discord)."""
+
+import itertools
+import time
+from bisect import bisect_left, bisect_right
+
+
+class ModeQueue:
+    """Очередь режима с двумя порядками.
+
+    Игроки (словари с discord_id, nickname, rating, join_time, ...) хранятся
+    в отсортированном по рейтингу списке - ближайший соперник ищется бинарным
+    поиском - и в словаре по discord_id, порядок которого совпадает с
+    порядком входа в очередь (FIFO). Удаление не перестраивает очередь.
+    """
+
+    def __init__(self, players=()):
+        self._keys = []  # (rating, seq), отсортированы
+        self._players = []  # игроки в том же порядке, что и _keys
+        self._fifo = {}  # discord_id -> (key, player) в порядке join_time
+        self._seq = itertools.count()
+        for player in players:
+            self.append(player)
+
+    def __len__(self):
+        return len(self._fifo)
+
+    def __iter__(self):
+        """Игроки в порядке входа в очередь"""
+        return iter([player for _, player in self._fifo.values()])
+
+    def __contains__(self, discord_id):
+        return discord_id in self._fifo
+
+    def __repr__(self):
+        return f"ModeQueue({len(self)} players)"
+
+    def append(self, player):
+        """Добавляет игрока (повторное добавление заменяет старую запись)"""
+        self.discard(player["discord_id"])
+        key = (player["rating"], next(self._seq))
+        index = bisect_left(self._keys, key)
+        self._keys.insert(index, key)
+        self._players.insert(index, player)
+
+        # Игрок, вернувшийся в очередь (например, после ошибки создания матча),
+        # встает на место по времени входа, а не в конец
+        last = next(reversed(self._fifo.values()), None)
+        self._fifo[player["discord_id"]] = (key, player)
+        if last is not None and player["join_time"] < last[1]["join_time"]:
+            self._fifo = dict(
+                sorted(self._fifo.items(), key=lambda item: item[1][1]["join_time"])
+            )
+
+    def discard(self, discord_id):
+        """Удаляет игрока по discord_id, возвращает его запись или None"""
+        item = self._fifo.pop(discord_id, None)
+        if item is None:
+            return None
+        key, player = item
+        index = bisect_left(self._keys, key)
+        del self._keys[index]
+        del self._players[index]
+        return player
+
+    def remove(self, player):
+        if self.discard(player["discord_id"]) is None:
+            raise ValueError(f"{player['nickname']} is not in queue")
+
+    def get(self, discord_id):
+        item = self._fifo.get(discord_id)
+        return item[1] if item else None
+
+    def oldest(self, skip=None):
+        """Игрок, дольше всех ждущий в очереди (skip(player) -> пропустить)"""
+        for _, player in self._fifo.values():
+            if skip is None or not skip(player):
+                return player
+        return None
+
+    def in_range(self, low, high):
+        """Игроки с рейтингом в [low, high], по возрастанию рейтинга"""
+        return self._players[self._range(low, high)]
+
+    def count_in_range(self, low, high):
+        """Число игроков с рейтингом в [low, high] (без копирования)"""
+        window = self._range(low, high)
+        return window.stop - window.start
+
+    def _range(self, low, high):
+        start = bisect_left(self._keys, (low,))
+        stop = bisect_right(self._keys, (high, float("inf")))
+        return slice(start, max(start, stop))
+
+    def nearest(self, rating, skip=None):
+        """Игрок с ближайшим к rating рейтингом (при равенстве - с меньшим)"""
+        right = bisect_left(self._keys, (rating,))
+        left = right - 1
+        players = self._players
+        while left >= 0 or right < len(players):
+            if right >= len(players) or (
+                left >= 0 and rating - players[left]["rating"]
+                <= players[right]["rating"] - rating
+            ):
+                candidate = players[left]
+                left -= 1
+            else:
+                candidate = players[right]
+                right += 1
+            if skip is None or not skip(candidate):
+                return candidate
+        return None
+
+
+class RatingWindow:
+    """Допустимая разница рейтингов, растущая со временем ожидания.
+
+    Ширина окна игрока: start + per_second * секунды в очереди, но не
+    больше limit (None - без ограничения). Пара допустима, если разница
+    рейтингов помещается в окно дольше ждущего из двух игроков.
+    """
+
+    __slots__ = ("start", "per_second", "limit")
+
+    def __init__(self, start, per_second, limit=None):
+        self.start = start
+        self.per_second = per_second
+        self.limit = limit
+
+    def width(self, player, now):
+        waited = max(0.0, (now - player["join_time"]).total_seconds())
+        width = self.start + self.per_second * waited
+        return width if self.limit is None else min(width, self.limit)
+
+    def allows(self, player1, player2, now):
+        gap = abs(player1["rating"] - player2["rating"])
+        return gap <= max(self.width(player1, now), self.width(player2, now))
+
+
+def nearest_in_queues(player, ratings, queues, windows, now, skip=None):
+    """Ближайший в окне соперник для игрока, ждущего сразу в нескольких режимах.
+
+    ratings - режим -> рейтинг игрока в этом режиме: у игрока очереди "Any"
+    в player["rating"] суммарный ELO, с рейтингами режимов он не сравним.
+    Возвращает (режим, соперник, игрок с рейтингом режима) или None.
+    """
+    best = None
+    for mode, rating in ratings.items():
+        probe = {**player, "rating": rating}
+        closest = queues[mode].nearest(rating, skip)
+        if (
+            closest
+            and windows[mode].allows(probe, closest, now)
+            and (
+                best is None
+                or abs(rating - closest["rating"])
+                < abs(best[2]["rating"] - best[1]["rating"])
+            )
+        ):
+            best = (mode, closest, probe)
+    return best
+
+
+def take_greedy_pairs(queue, skip=None, window=None, now=None):
+    """Жадный подбор: забирает из ModeQueue пары "дольше всех ждущий +
+    ближайший по рейтингу". skip(player) -> не подбирать; с RatingWindow
+    игрок, для которого нет соперника в окне, остается ждать.
+    """
+    pairs = []
+    for player1 in queue:
+        if player1["discord_id"] not in queue or (skip is not None and skip(player1)):
+            continue
+        player2 = queue.nearest(
+            player1["rating"], lambda p: p is player1 or (skip is not None and skip(p))
+        )
+        if player2 is None:
+            break
+        if window is not None and not window.allows(player1, player2, now):
+            continue
+        queue.remove(player1)
+        queue.remove(player2)
+        pairs.append((player1, player2))
+    return pairs
+
+
+def pair_batch(
+    players,
+    now,
+    unpaired_cost=300,
+    wait_weight=5.0,
+    neighbors=8,
+    time_budget=0.05,
+    window=None,
+):
+    """Пары с минимальной суммарной стоимостью по всей очереди.
+
+    Стоимость пары - разница рейтингов, стоимость оставить игрока ждать -
+    unpaired_cost + wait_weight * секунды ожидания. В оптимальном решении
+    пары на отсортированной по рейтингу очереди не пересекаются, поэтому
+    достаточно ДП по префиксам: игрок i либо ждет, либо в паре с одним из
+    neighbors предыдущих (все между ними ждут). С RatingWindow пары вне
+    окна не рассматриваются; окна у игроков разные, и оптимум иногда требует
+    пересекающихся пар - тогда результат лучший среди непересекающихся.
+
+    Возвращает список пар (дольше ждущий первым) или None, если расчет
+    не уложился в time_budget секунд - тогда нужен жадный подбор.
+    """
+    deadline = time.perf_counter() + time_budget
+    players = sorted(players, key=lambda p: p["rating"])
+    count = len(players)
+    # Самое широкое окно - у дольше всех ждущего
+    oldest = min(players, key=lambda p: p["join_time"], default=None)
+    ratings = [p["rating"] for p in players]
+    waiting = [
+        unpaired_cost + wait_weight * (now - p["join_time"]).total_seconds()
+        for p in players
+    ]
+    # waited[k] - суммарная стоимость ожидания первых k игроков
+    waited = [0.0]
+    for cost in waiting:
+        waited.append(waited[-1] + cost)
+
+    best = [0.0] * (count + 1)
+    partner = [None] * (count + 1)
+    for i in range(1, count + 1):
+        if i % 256 == 0 and time.perf_counter() > deadline:
+            return None
+        last = i - 1
+        best[i] = best[i - 1] + waiting[last]
+        first = max(0, last - neighbors)
+        if window is not None:
+            # Соседи ниже по рейтингу, до которых дотягивается окно
+            widest = max(
+                window.width(players[last], now), window.width(oldest, now)
+            )
+            first = max(first, bisect_left(ratings, ratings[last] - widest, 0, last))
+        for j in range(first, last):
+            if window is not None and not window.allows(players[j], players[last], now):
+                continue
+            cost = (
+                best[j]
+                + ratings[last]
+                - ratings[j]
+                + waited[last]
+                - waited[j + 1]
+            )
+            if cost < best[i]:
+                best[i] = cost
+                partner[i] = j
+
+    pairs = []
+    i = count
+    while i > 0:
+        j = partner[i]
+        if j is None:
+            i -= 1
+            continue
+        pair = sorted((players[j], players[i - 1]), key=lambda p: p["join_time"])
+        pairs.append(tuple(pair))
+        i = j
+    pairs.reverse()
+    return pairs
+
+
+class MatchmakingStats:
+    """Качество подбора: разница рейтингов в зависимости от времени ожидания"""
+
+    # Границы интервалов ожидания в секундах
+    WAIT_BUCKETS = (30, 60, 120, 300, 600)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.modes = {}
+
+    def record(self, mode, player1, player2, now):
+        gap = abs(player1["rating"] - player2["rating"])
+        waits = [(now - p["join_time"]).total_seconds() for p in (player1, player2)]
+        stats = self.modes.setdefault(
+            mode,
+            {
+                "matches": 0,
+                "gap_sum": 0,
+                "gap_max": 0,
+                "wait_sum": 0.0,
+                "wait_max": 0.0,
+                # индекс интервала -> [матчей, сумма разниц рейтингов]
+                "by_wait": [[0, 0] for _ in range(len(self.WAIT_BUCKETS) + 1)],
+            },
+        )
+        stats["matches"] += 1
+        stats["gap_sum"] += gap
+        stats["gap_max"] = max(stats["gap_max"], gap)
+        stats["wait_sum"] += sum(waits) / 2
+        stats["wait_max"] = max(stats["wait_max"], *waits)
+        bucket = bisect_right(self.WAIT_BUCKETS, max(waits))
+        stats["by_wait"][bucket][0] += 1
+        stats["by_wait"][bucket][1] += gap
+
+    def summary(self, mode):
+        """Средние значения по режиму и средняя разница рейтингов по интервалам ожидания"""
+        stats = self.modes.get(mode)
+        if not stats:
+            return None
+        bounds = (0,) + self.WAIT_BUCKETS
+        by_wait = []
+        for index, (matches, gap_sum) in enumerate(stats["by_wait"]):
+            if matches:
+                label = (
+                    f"{bounds[index]}-{bounds[index + 1]} с"
+                    if index + 1 < len(bounds)
+                    else f"{bounds[index]}+ с"
+                )
+                by_wait.append((label, matches, gap_sum / matches))
+        return {
+            "matches": stats["matches"],
+            "gap_mean": stats["gap_sum"] / stats["matches"],
+            "gap_max": stats["gap_max"],
+            "wait_mean": stats["wait_sum"] / stats["matches"],
+            "wait_max": stats["wait_max"],
+            "by_wait": by_wait,
+        }
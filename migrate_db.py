@@ -0,0 +1,24 @@
+"""Перенос данных из трех файлов баз в одну общую базу.
+
+Использование: python migrate_db.py [целевой_файл]
+
+Перенос только читает старые файлы, его можно запускать на работающем боте.
+Повторный запуск синхронизирует общую базу со старыми файлами: обновляет
+измененные строки и удаляет исчезнувшие. Для переключения остановите бота,
+запустите перенос еще раз (он перенесет только изменения) и запустите
+бота с переменной окружения ELOBOT_DB_MODE=single (и ELOBOT_DB_FILE, если
+целевой файл отличается от elobot.db).
+"""
+
+import sys
+
+from db_manager import SINGLE_DB_FILE, migrate_to_single_file
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else SINGLE_DB_FILE
+    copied = migrate_to_single_file(target)
+
+    print(f"Данные перенесены в {target}:")
+    for table, count in copied.items():
+        print(f"  {table}: {count}")
@@ -1,36 +1,48 @@
+import asyncio
 import discord
 from discord.ext import tasks
 from db_manager import db_manager  # Заменяем прямой импорт db
+from player_cache import player_cache
+from dispatcher import TokenBucket
+from startup import startup
 import logging
 
 # Настройка логирования
 logger = logging.getLogger("nickname_updater")
 
+# Максимальная длина ника на сервере
+NICKNAME_LIMIT = 32
+
+
+def nickname_for(playername, elo):
+    """Ник участника для игрока: "ник [ELO]", не длиннее лимита Discord"""
+    new_nickname = f"{playername} [{int(elo)}]"
+    if len(new_nickname) > NICKNAME_LIMIT:
+        new_nickname = new_nickname[: NICKNAME_LIMIT - 3] + "..."
+    return new_nickname
+
+
+def can_rename(member):
+    """Владельца сервера и ботов не переименовываем"""
+    return not member.bot and member != member.guild.owner
+
+
 async def update_nickname(member, new_nickname):
-    """Обновляет никнейм участника с обработкой ошибок"""
+    """Обновляет никнейм участника с обработкой ошибок; True - ник изменен"""
     try:
         # Проверяем, есть ли права на изменение
         if member.guild.me.guild_permissions.manage_nicknames:
             # Проверяем, не пытаемся ли изменить ник бота или владельца
-            if member == member.guild.owner:
-                logger.info(f"Пропуск владельца сервера: {member.display_name}")
-                return
-
-            if member.bot:
-                logger.info(f"Пропуск бота: {member.display_name}")
-                return
-
-            # Проверяем, не превышает ли ник лимит длины
-            if len(new_nickname) > 32:
-                new_nickname = new_nickname[:29] + "..."
-                logger.warning(f"Укорочен ник для {member.display_name}")
+            if not can_rename(member):
+                logger.debug(f"Пропуск владельца или бота: {member.display_name}")
+                return False
 
             # Обновляем ник, если он изменился
             if member.display_name != new_nickname:
                 await member.edit(nick=new_nickname)
                 logger.info(f"Обновлен ник: {member.display_name} -> {new_nickname}")
-            else:
-                logger.info(f"Ник не изменился: {new_nickname}")
+                return True
+            logger.debug(f"Ник не изменился: {new_nickname}")
         else:
             logger.warning(
                 f"Нет прав на изменение ников на сервере {member.guild.name}"
@@ -43,60 +55,128 @@ async def update_nickname(member, new_nickname):
         logger.error(f"Ошибка HTTP при обновлении ника: {e}")
     except Exception as e:
         logger.error(f"Неизвестная ошибка: {e}")
-
-def setup_nickname_updater(bot):
-    """Инициализирует систему обновления ников"""
-
-    @tasks.loop(minutes=10)
-    async def update_all_nicknames():
-        """Обновляет ники на всех серверах"""
-        logger.info("Запуск периодического обновления ников")
-
-        # Получаем всех игроков из БД через db_manager
+    return False
+
+
+class NicknameSync:
+    """Синхронизирует ники участников с рейтингом по изменениям.
+
+    Запись ELO вызывает mark(discordid): игрок попадает в множество
+    ожидающих (повторные отметки до обработки склеиваются), а воркер
+    применяет ники не чаще лимита rate. Выставленные ники запоминаются в
+    _applied по (сервер, участник), поэтому редкая полная сверка reconcile()
+    сравнивает нужный ник с этой картой и не обходит участников серверов.
+    Если участник сменил ник сам, on_member_update снова ставит его в очередь.
+    """
+
+    def __init__(self, rate=(5, 5.0)):
+        self._bucket = TokenBucket(*rate)
+        self._pending = set()  # discordid игроков, чей ник нужно проверить
+        self._applied = {}  # (guild_id, member_id) -> последний выставленный ник
+        self._bot = None
+        # Создаются в start(), когда event loop уже запущен
+        self._wakeup = None
+        self._task = None
+        self.edits = 0
+
+    def attach(self, bot):
+        self._bot = bot
+        bot.add_listener(self.on_member_join, "on_member_join")
+        bot.add_listener(self.on_member_update, "on_member_update")
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            if self._pending:
+                self._wakeup.set()
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def mark(self, discordid):
+        """Ставит игрока в очередь проверки ника (после записи ELO)"""
+        self._pending.add(str(discordid))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending(self):
+        return len(self._pending)
+
+    def reconcile(self):
+        """Ставит в очередь игроков, чей нужный ник не совпадает с выставленным"""
         players = db_manager.fetchall(
-            'players',
-            "SELECT discordid, playername, currentelo FROM players"
+            "players", "SELECT discordid, playername, currentelo FROM players"
         )
-
-        # Создаем словарь {discordid: (nickname, elo)}
-        player_data = {
-            discord_id: (nickname, elo) for discord_id, nickname, elo in players
-        }
-
-        # Обходим все серверы, где есть бот
-        for guild in bot.guilds:
-            logger.info(f"Проверка сервера: {guild.name}")
-
-            # Обходим всех участников сервера
-            for member in guild.members:
-                discord_id = str(member.id)
-
-                # Если участник есть в базе игроков
-                if discord_id in player_data:
-                    nickname, elo = player_data[discord_id]
-                    new_nick = f"{nickname} [{int(elo)}]"
-                    await update_nickname(member, new_nick)
-
-    @bot.event
-    async def on_ready():
-        """Запускаем задачу при старте бота"""
-        if not update_all_nicknames.is_running():
-            update_all_nicknames.start()
-            logger.info("Задача обновления ников запущена")
-
-    @bot.event
-    async def on_member_join(member):
+        queued = 0
+        for discordid, playername, elo in players:
+            desired = nickname_for(playername, elo)
+            for guild in self._bot.guilds:
+                # get_member - поиск в кеше участников, без запросов к API
+                if guild.get_member(int(discordid)) is None:
+                    continue
+                if self._applied.get((guild.id, int(discordid))) != desired:
+                    self.mark(discordid)
+                    queued += 1
+                    break
+        logger.info(f"Сверка ников: в очереди {queued} из {len(players)} игроков")
+        return queued
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                discordid = self._pending.pop()
+                try:
+                    await self._apply(discordid)
+                except Exception as e:
+                    logger.error(f"Ошибка синхронизации ника {discordid}: {e}")
+
+    async def _apply(self, discordid):
+        player = player_cache.by_discordid(discordid)
+        if player is None:
+            return
+        desired = nickname_for(player.playername, player.currentelo)
+        for guild in self._bot.guilds:
+            member = guild.get_member(int(discordid))
+            if member is None:
+                continue
+            key = (guild.id, member.id)
+            if member.display_name == desired or not can_rename(member):
+                self._applied[key] = desired
+                continue
+            await self._bucket.acquire()
+            if await update_nickname(member, desired):
+                self._applied[key] = desired
+                self.edits += 1
+
+    async def on_member_join(self, member):
         """Обновляем ник при присоединении к серверу"""
-        discord_id = str(member.id)
+        if player_cache.by_discordid(member.id):
+            self.mark(member.id)
 
-        # Получаем данные игрока из БД через db_manager
-        player = db_manager.fetchone(
-            'players',
-            "SELECT playername, currentelo FROM players WHERE discordid = ?",
-            (discord_id,)
-        )
+    async def on_member_update(self, before, after):
+        applied = self._applied.get((after.guild.id, after.id))
+        if applied is not None and after.display_name != applied:
+            self.mark(after.id)
 
-        if player:
-            nickname, elo = player
-            new_nick = f"{nickname} [{int(elo)}]"
-            await update_nickname(member, new_nick)
\ No newline at end of file
+
+nickname_sync = NicknameSync()
+
+
+def setup_nickname_updater(bot):
+    """Инициализирует систему обновления ников"""
+    nickname_sync.attach(bot)
+
+    @tasks.loop(hours=6)
+    async def reconcile_nicknames():
+        """Редкая полная сверка ников с рейтингами"""
+        nickname_sync.reconcile()
+
+    async def start_nickname_sync():
+        """Запускаем синхронизацию при старте бота"""
+        nickname_sync.start()
+        if not reconcile_nicknames.is_running():
+            reconcile_nicknames.start()
+            logger.info("Синхронизация ников запущена")
+
+    # Сверке нужны участники-игроки, их подгружает startup
+    startup.add("nicknames", start_nickname_sync, members=True)
@@ -0,0 +1,149 @@
+import logging
+
+from db_manager import db_manager
+
+logger = logging.getLogger("player_cache")
+
+# Колонки игрока, которые держим в памяти (статистика побед/поражений не кешируется)
+PLAYER_FIELDS = (
+    "playerid",
+    "playername",
+    "discordid",
+    "currentelo",
+    "elo_station5f",
+    "elo_mots",
+    "elo_12min",
+    "isbanned",
+    "isblacklisted",
+)
+
+_SELECT_PLAYER = f"SELECT {', '.join(PLAYER_FIELDS)} FROM players"
+
+
+class PlayerRecord:
+    """Строка игрока из таблицы players"""
+
+    __slots__ = PLAYER_FIELDS
+
+    def __init__(self, row):
+        for field, value in zip(PLAYER_FIELDS, row):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        return f"PlayerRecord({self.playername!r}, discordid={self.discordid!r})"
+
+
+class PlayerCache:
+    """Кеш игроков в памяти с доступом по discordid и по нику.
+
+    Чтения идут из памяти, при промахе запись подгружается из базы.
+    Код, который меняет кешируемые колонки, после записи в базу вызывает
+    update() (или invalidate()), так что кеш не расходится с таблицей.
+    Отсутствующие игроки тоже запоминаются, пока их не добавит верификация.
+    """
+
+    def __init__(self, manager):
+        self._db = manager
+        self._by_discordid = {}
+        self._by_name = {}
+        self._missing_ids = set()
+        self._missing_names = set()
+        self.hits = 0
+        self.misses = 0
+        # Откат мог отменить значения, уже записанные в кеш через update()
+        manager.add_rollback_listener(lambda db_type: self.clear())
+
+    def by_discordid(self, discordid):
+        """Возвращает PlayerRecord по Discord ID или None"""
+        discordid = str(discordid)
+        record = self._by_discordid.get(discordid)
+        if record is not None or discordid in self._missing_ids:
+            self.hits += 1
+            return record
+
+        self.misses += 1
+        row = self._db.fetchone(
+            "players", f"{_SELECT_PLAYER} WHERE discordid = ?", (discordid,)
+        )
+        if row is None:
+            self._missing_ids.add(discordid)
+            return None
+        return self._store(row)
+
+    def by_name(self, playername):
+        """Возвращает PlayerRecord по нику или None"""
+        record = self._by_name.get(playername)
+        if record is not None or playername in self._missing_names:
+            self.hits += 1
+            return record
+
+        self.misses += 1
+        row = self._db.fetchone(
+            "players", f"{_SELECT_PLAYER} WHERE playername = ?", (playername,)
+        )
+        if row is None:
+            self._missing_names.add(playername)
+            return None
+        return self._store(row)
+
+    def _store(self, row):
+        record = PlayerRecord(row)
+        record.discordid = str(record.discordid)
+        self._by_discordid[record.discordid] = record
+        self._by_name[record.playername] = record
+        self._missing_ids.discard(record.discordid)
+        self._missing_names.discard(record.playername)
+        return record
+
+    def load_all(self):
+        """Загружает всех игроков одним запросом (прогрев при старте)"""
+        rows = self._db.fetchall("players", _SELECT_PLAYER)
+        self.clear()
+        for row in rows:
+            self._store(row)
+        logger.info(f"Player cache warmed with {len(rows)} players")
+
+    def update(self, playername=None, discordid=None, **fields):
+        """Применяет к закешированной записи уже записанные в базу значения"""
+        if discordid is not None:
+            record = self._by_discordid.get(str(discordid))
+        else:
+            record = self._by_name.get(playername)
+        if record is None:
+            return
+        for field, value in fields.items():
+            setattr(record, field, value)
+
+    def invalidate(self, playername=None, discordid=None):
+        """Забывает игрока (и отметку об его отсутствии) - следующее чтение пойдет в базу"""
+        record = None
+        if discordid is not None:
+            discordid = str(discordid)
+            record = self._by_discordid.get(discordid)
+            self._missing_ids.discard(discordid)
+        if playername is not None:
+            record = record or self._by_name.get(playername)
+            self._missing_names.discard(playername)
+        if record is not None:
+            self._by_discordid.pop(record.discordid, None)
+            self._by_name.pop(record.playername, None)
+
+    def clear(self):
+        self._by_discordid.clear()
+        self._by_name.clear()
+        self._missing_ids.clear()
+        self._missing_names.clear()
+
+    def stats(self):
+        """Счетчики попаданий/промахов и размер кеша"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "players": len(self._by_discordid),
+            "missing": len(self._missing_ids) + len(self._missing_names),
+        }
+
+
+player_cache = PlayerCache(db_manager)
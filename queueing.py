@@ -6,8 +6,31 @@ from config import (
     MODE_NAMES,
     MAPS,
     MODERATOR_ID,
+    MATCHMAKING_TICK,
+    MATCHMAKING_MODE,
+    MATCHMAKING_BATCH,
+    RATING_WINDOWS,
+    MATCH_TIMEOUT,
+    RESULT_CONFIRMATION_TIMEOUT,
 )
-from db_manager import db_manager
+from db_manager import db_manager, async_db
+from player_cache import player_cache
+from leaderboard import leaderboard
+from nickname_updater import nickname_sync
+from events import events, MATCH_FINISHED
+from elo import calculate_elo, MODE_COLUMN_SUFFIXES
+from matchmaker import (
+    ModeQueue,
+    RatingWindow,
+    MatchmakingStats,
+    take_greedy_pairs,
+    pair_batch,
+    nearest_in_queues,
+)
+from scheduler import DeadlineScheduler
+from dispatcher import dispatcher
+from user_cache import user_resolver
+from channel_registry import channel_registry
 import asyncio
 import sqlite3
 from datetime import datetime, timedelta
@@ -99,7 +122,7 @@ class ModeratorResolutionView(View):
 
             # Уведомляем отправителя
             try:
-                submitter_user = await global_bot.fetch_user(submitter_id)
+                submitter_user = await user_resolver.fetch(submitter_id)
                 await submitter_user.send(
                     f"❌ Результат матча #{self.match_id} отклонен модератором."
                 )
@@ -177,28 +200,32 @@ class ModeratorResolutionView(View):
                 rating_winner, rating_loser, 1
             )
 
-            # Обновляем статистику
-            db_manager.execute(
-                "players",
-                "UPDATE players SET wins = wins + 1 WHERE playername = ?",
-                (winner,),
-            )
-            db_manager.execute(
-                "players",
-                "UPDATE players SET losses = losses + 1 WHERE playername = ?",
-                (loser,),
-            )
-
-            # Обновляем ELO
-            update_player_rating(winner, new_rating_winner, mode)
-            update_player_rating(loser, new_rating_loser, mode)
+            # Обновляем статистику и ELO одной транзакцией
+            with db_manager.transaction("players"):
+                db_manager.execute(
+                    "players",
+                    "UPDATE players SET wins = wins + 1 WHERE playername = ?",
+                    (winner,),
+                )
+                db_manager.execute(
+                    "players",
+                    "UPDATE players SET losses = losses + 1 WHERE playername = ?",
+                    (loser,),
+                )
+                update_player_rating(
+                    winner, new_rating_winner, mode, match_id=self.match_id, reason="result"
+                )
+                update_player_rating(
+                    loser, new_rating_loser, mode, match_id=self.match_id, reason="result"
+                )
+                # Запись матча (в режиме одной базы - в той же транзакции)
+                db_manager.execute(
+                    "matches",
+                    "UPDATE matches SET player1score = ?, player2score = ?, isover = 1, isverified = 1 WHERE matchid = ?",
+                    (score1, score2, self.match_id),
+                )
+                match_closed(self.match_id, score1, score2)
 
-            # Обновляем запись матча
-            db_manager.execute(
-                "matches",
-                "UPDATE matches SET player1score = ?, player2score = ?, isover = 1, isverified = 1 WHERE matchid = ?",
-                (score1, score2, self.match_id),
-            )
             # Отправляем результат в канал
             mode_name = MODE_NAMES.get(mode, "Unknown")
             embed = discord.Embed(
@@ -216,14 +243,7 @@ class ModeratorResolutionView(View):
             )
 
             # Ищем канал результатов
-            results_channel = None
-            for guild in global_bot.guilds:
-                for channel in guild.text_channels:
-                    if channel.name == "elobot-results":
-                        results_channel = channel
-                        break
-                if results_channel:
-                    break
+            results_channel = channel_registry.get("results")
 
             if results_channel:
                 await results_channel.send(embed=embed)
@@ -233,16 +253,8 @@ class ModeratorResolutionView(View):
             # Отправляем результат игрокам в ЛС
             try:
                 # Получаем discord_id игроков
-                player1_data = db_manager.execute(
-                    "players",
-                    "SELECT discordid FROM players WHERE playername = ?",
-                    (player1,),
-                ).fetchone()
-                player2_data = db_manager.execute(
-                    "players",
-                    "SELECT discordid FROM players WHERE playername = ?",
-                    (player2,),
-                ).fetchone()
+                player1_data = player_cache.by_name(player1)
+                player2_data = player_cache.by_name(player2)
             except Exception as e:
                 print(f"Ошибка отправки результата игрокам: {e}")
 
@@ -250,7 +262,7 @@ class ModeratorResolutionView(View):
             print(f"Ошибка обработки результата: {e}")
             # Уведомляем модератора об ошибке
             try:
-                moderator = await global_bot.fetch_user(MODERATOR_ID)
+                moderator = await user_resolver.fetch(MODERATOR_ID)
                 await moderator.send(
                     f"❌ Ошибка обработки результата матча #{self.match_id}: {str(e)}"
                 )
@@ -269,35 +281,38 @@ class ModeratorResolutionView(View):
                 rating_winner, rating_loser, 1
             )
 
-            # Обновляем статистику
-            db_manager.execute(
-                "players",
-                "UPDATE players SET wins = wins + 1 WHERE playername = ?",
-                (winner,),
-            )
-            db_manager.execute(
-                "players",
-                "UPDATE players SET losses = losses + 1 WHERE playername = ?",
-                (loser,),
-            )
-
-            # Обновляем ELO
-            update_player_rating(winner, new_rating_winner, mode)
-            update_player_rating(loser, new_rating_loser, mode)
-
-            # Обновляем запись матча
-            if winner == player1:
+            # Обновляем статистику и ELO одной транзакцией
+            with db_manager.transaction("players"):
                 db_manager.execute(
-                    "matches",
-                    "UPDATE matches SET player1score = 1, player2score = 0, isover = 1, isverified = 1 WHERE matchid = ?",
-                    (self.match_id,),
+                    "players",
+                    "UPDATE players SET wins = wins + 1 WHERE playername = ?",
+                    (winner,),
                 )
-            else:
                 db_manager.execute(
-                    "matches",
-                    "UPDATE matches SET player1score = 0, player2score = 1, isover = 1, isverified = 1 WHERE matchid = ?",
-                    (self.match_id,),
+                    "players",
+                    "UPDATE players SET losses = losses + 1 WHERE playername = ?",
+                    (loser,),
+                )
+                update_player_rating(
+                    winner, new_rating_winner, mode, match_id=self.match_id, reason="tech_loss"
                 )
+                update_player_rating(
+                    loser, new_rating_loser, mode, match_id=self.match_id, reason="tech_loss"
+                )
+                # Запись матча (в режиме одной базы - в той же транзакции)
+                if winner == player1:
+                    db_manager.execute(
+                        "matches",
+                        "UPDATE matches SET player1score = 1, player2score = 0, isover = 1, isverified = 1 WHERE matchid = ?",
+                        (self.match_id,),
+                    )
+                else:
+                    db_manager.execute(
+                        "matches",
+                        "UPDATE matches SET player1score = 0, player2score = 1, isover = 1, isverified = 1 WHERE matchid = ?",
+                        (self.match_id,),
+                    )
+                match_closed(self.match_id, *((1, 0) if winner == player1 else (0, 1)))
 
             # Отправляем результат в канал
             mode_name = MODE_NAMES.get(mode, "Unknown")
@@ -315,14 +330,7 @@ class ModeratorResolutionView(View):
             )
 
             # Ищем канал результатов
-            results_channel = None
-            for guild in global_bot.guilds:
-                for channel in guild.text_channels:
-                    if channel.name == "elobot-results":
-                        results_channel = channel
-                        break
-                if results_channel:
-                    break
+            results_channel = channel_registry.get("results")
 
             if results_channel:
                 await results_channel.send(embed=embed)
@@ -332,26 +340,18 @@ class ModeratorResolutionView(View):
             # Отправляем результат игрокам в ЛС
             try:
                 # Получаем discord_id игроков
-                player1_data = db_manager.execute(
-                    "players",
-                    "SELECT discordid FROM players WHERE playername = ?",
-                    (player1,),
-                ).fetchone()
-                player2_data = db_manager.execute(
-                    "players",
-                    "SELECT discordid FROM players WHERE playername = ?",
-                    (player2,),
-                ).fetchone()
+                player1_data = player_cache.by_name(player1)
+                player2_data = player_cache.by_name(player2)
 
                 if player1_data:
-                    user1 = await global_bot.fetch_user(int(player1_data[0]))
+                    user1 = await user_resolver.fetch(int(player1_data.discordid))
                     await user1.send(
                         f"ℹ️ Ваш матч #{self.match_id} завершен техническим поражением"
                     )
                     await user1.send(embed=embed)
 
                 if player2_data:
-                    user2 = await global_bot.fetch_user(int(player2_data[0]))
+                    user2 = await user_resolver.fetch(int(player2_data.discordid))
                     await user2.send(
                         f"ℹ️ Ваш матч #{self.match_id} завершен техническим поражением"
                     )
@@ -363,7 +363,7 @@ class ModeratorResolutionView(View):
             print(f"Ошибка применения тех. поражения: {e}")
             # Уведомляем модератора об ошибке
             try:
-                moderator = await global_bot.fetch_user(MODERATOR_ID)
+                moderator = await user_resolver.fetch(MODERATOR_ID)
                 await moderator.send(
                     f"❌ Ошибка применения тех. поражения для матча #{self.match_id}: {str(e)}"
                 )
@@ -385,21 +385,17 @@ class ModeratorResolutionView(View):
         player1, player2 = match_data
 
         # Получаем discord_id игроков
-        player1_data = db_manager.execute(
-            "players", "SELECT discordid FROM players WHERE playername = ?", (player1,)
-        ).fetchone()
-        player2_data = db_manager.execute(
-            "players", "SELECT discordid FROM players WHERE playername = ?", (player2,)
-        ).fetchone()
+        player1_data = player_cache.by_name(player1)
+        player2_data = player_cache.by_name(player2)
 
         # Отправляем уведомления
         try:
             if player1_data:
-                user1 = await global_bot.fetch_user(int(player1_data[0]))
+                user1 = await user_resolver.fetch(int(player1_data.discordid))
                 await user1.send(f"ℹ️ Результат матча #{self.match_id} {action}.")
 
             if player2_data:
-                user2 = await global_bot.fetch_user(int(player2_data[0]))
+                user2 = await user_resolver.fetch(int(player2_data.discordid))
                 await user2.send(f"ℹ️ Результат матча #{self.match_id} {action}.")
         except Exception as e:
             print(f"Ошибка уведомления игроков: {e}")
@@ -407,10 +403,19 @@ class ModeratorResolutionView(View):
 
 class PlayerConfirmationView(View):
     def __init__(self, match_id, submitter_id, opponent_id):
-        super().__init__(timeout=3600)  # Таймаут 1 час (3600 секунд)
+        # Таймаут (1 час) отслеживает confirmation_deadlines, а не discord
+        super().__init__(timeout=None)
         self.match_id = match_id
         self.submitter_id = submitter_id
         self.opponent_id = opponent_id
+        confirmation_deadlines.schedule(
+            self,
+            datetime.now() + timedelta(seconds=RESULT_CONFIRMATION_TIMEOUT),
+        )
+
+    def stop(self):
+        confirmation_deadlines.cancel(self)
+        super().stop()
 
     @discord.ui.button(label="Подтвердить", style=discord.ButtonStyle.green)
     async def confirm(
@@ -439,6 +444,7 @@ class PlayerConfirmationView(View):
         await interaction.response.send_message(
             "✅ Результат подтвержден!", ephemeral=True
         )
+        self.stop()
         await interaction.message.delete()
 
     @discord.ui.button(label="Оспорить", style=discord.ButtonStyle.red)
@@ -465,6 +471,7 @@ class PlayerConfirmationView(View):
         await interaction.response.send_message(
             "✅ Результат оспорен! Модератор рассмотрит спор.", ephemeral=True
         )
+        self.stop()
         await interaction.message.delete()
 
     async def process_match_result(self, result_data):
@@ -476,18 +483,6 @@ class PlayerConfirmationView(View):
             player2 = result_data["player2"]
             mode = result_data["mode"]
 
-            tournament_id = db_manager.fetchone(
-                "matches",
-                "SELECT tournament_id FROM matches WHERE matchid = ?",
-                (match_id,),
-            )[0]
-            if tournament_id:
-                tournaments_cog = global_bot.get_cog("Tournaments")
-                if tournaments_cog and tournament_id in tournaments_cog.active_tours:
-                    await tournaments_cog.active_tours[
-                        tournament_id
-                    ].check_round_completion()
-
             # Получаем тип матча
             matchtype = db_manager.fetchone(
                 "matches",
@@ -514,37 +509,44 @@ class PlayerConfirmationView(View):
                 rating_winner, rating_loser, 1
             )
 
-            # Обновляем статистику
-            db_manager.execute(
-                "players",
-                "UPDATE players SET wins = wins + 1 WHERE playername = ?",
-                (winner,),
-            )
-            db_manager.execute(
-                "players",
-                "UPDATE players SET losses = losses + 1 WHERE playername = ?",
-                (loser,),
-            )
-
-            # Обновляем ELO только для обычных матчей
-            if matchtype == 1:
-                rating_winner = get_player_rating(winner, mode)
-                rating_loser = get_player_rating(loser, mode)
-                new_rating_winner, new_rating_loser = calculate_elo(
-                    rating_winner, rating_loser, 1
+            # Статистика и ELO обновляются одной транзакцией
+            with db_manager.transaction("players"):
+                db_manager.execute(
+                    "players",
+                    "UPDATE players SET wins = wins + 1 WHERE playername = ?",
+                    (winner,),
                 )
-                update_player_rating(winner, new_rating_winner, mode)
-                update_player_rating(loser, new_rating_loser, mode)
-                elo_change = f"\n\n**Изменения ELO:**\n{winner}: {rating_winner} → **{new_rating_winner}**\n{loser}: {rating_loser} → **{new_rating_loser}**"
-            else:
-                elo_change = ""
-
-            # Обновляем запись матча
-            db_manager.execute(
-                "matches",
-                "UPDATE matches SET player1score = ?, player2score = ?, isover = 1, isverified = 1 WHERE matchid = ?",
-                (score1, score2, match_id),
-            )
+                db_manager.execute(
+                    "players",
+                    "UPDATE players SET losses = losses + 1 WHERE playername = ?",
+                    (loser,),
+                )
+                # ELO меняется только для обычных матчей
+                if matchtype == 1:
+                    rating_winner = get_player_rating(winner, mode)
+                    rating_loser = get_player_rating(loser, mode)
+                    new_rating_winner, new_rating_loser = calculate_elo(
+                        rating_winner, rating_loser, 1
+                    )
+                    update_player_rating(
+                        winner, new_rating_winner, mode, match_id=match_id, reason="result"
+                    )
+                    update_player_rating(
+                        loser, new_rating_loser, mode, match_id=match_id, reason="result"
+                    )
+                    elo_change = f"\n\n**Изменения ELO:**\n{winner}: {rating_winner} → **{new_rating_winner}**\n{loser}: {rating_loser} → **{new_rating_loser}**"
+                else:
+                    elo_change = ""
+                # Запись матча (в режиме одной базы - в той же транзакции)
+                db_manager.execute(
+                    "matches",
+                    "UPDATE matches SET player1score = ?, player2score = ?, isover = 1, isverified = 1 WHERE matchid = ?",
+                    (score1, score2, match_id),
+                )
+                match_closed(match_id, score1, score2)
+            # Турнирный матч меняет только победы/поражения - без
+            # update_player_rating версия лидерборда сама не изменится
+            leaderboard.bump()
 
             # Отправляем результат в канал
             mode_name = MODE_NAMES.get(mode, "Unknown")
@@ -561,45 +563,30 @@ class PlayerConfirmationView(View):
             )
 
             # Ищем канал результатов
-            results_channel = None
-            for guild in global_bot.guilds:
-                for channel in guild.text_channels:
-                    if channel.name == "elobot-results":
-                        results_channel = channel
-                        break
-                if results_channel:
-                    break
+            results_channel = channel_registry.get("results")
 
             if results_channel:
-                await results_channel.send(embed=embed)
+                dispatcher.send_channel(results_channel, embed=embed)
             else:
                 print("⚠ Канал elobot-results не найден")
 
             # Отправляем результат игрокам в ЛС
-            try:
-                submitter_user = await global_bot.fetch_user(
-                    result_data["submitter_id"]
-                )
-                opponent_user = await global_bot.fetch_user(result_data["opponent_id"])
-
-                # Создаем персонализированные сообщения
-                await submitter_user.send(
-                    f"✅ Ваш оппонент подтвердил результат матча #{match_id}"
-                )
-                await submitter_user.send(embed=embed)
-
-                await opponent_user.send(
-                    f"✅ Вы подтвердили результат матча #{match_id}"
-                )
-                await opponent_user.send(embed=embed)
-            except Exception as e:
-                print(f"Ошибка отправки результата игрокам: {e}")
+            dispatcher.send_user(
+                result_data["submitter_id"],
+                f"✅ Ваш оппонент подтвердил результат матча #{match_id}",
+                embed=embed,
+            )
+            dispatcher.send_user(
+                result_data["opponent_id"],
+                f"✅ Вы подтвердили результат матча #{match_id}",
+                embed=embed,
+            )
 
         except Exception as e:
             print(f"Ошибка обработки результата: {e}")
             # Уведомляем модератора об ошибке
             try:
-                moderator = await global_bot.fetch_user(MODERATOR_ID)
+                moderator = await user_resolver.fetch(MODERATOR_ID)
                 await moderator.send(
                     f"❌ Ошибка обработки результата матча #{match_id}: {str(e)}"
                 )
@@ -609,7 +596,7 @@ class PlayerConfirmationView(View):
     async def send_to_moderator(self, result_data):
         """Отправка оспоренного результата модератору"""
         try:
-            moderator = await global_bot.fetch_user(MODERATOR_ID)
+            moderator = await user_resolver.fetch(MODERATOR_ID)
 
             embed = discord.Embed(
                 title="⚠️ Оспоренный результат матча",
@@ -638,10 +625,10 @@ class PlayerConfirmationView(View):
         if result_data:
             # Уведомляем игроков о таймауте
             try:
-                submitter_user = await global_bot.fetch_user(
+                submitter_user = await user_resolver.fetch(
                     result_data["submitter_id"]
                 )
-                opponent_user = await global_bot.fetch_user(result_data["opponent_id"])
+                opponent_user = await user_resolver.fetch(result_data["opponent_id"])
 
                 await submitter_user.send(
                     f"⌛ Ваш оппонент не подтвердил результат матча #{self.match_id} в течение часа. "
@@ -663,22 +650,68 @@ class PlayerConfirmationView(View):
             pass
 
 
-def save_queues_to_db():
-    """Сохраняет текущее состояние очередей в БД"""
+def persist_queue_entry(mode, player):
+    """Записывает игрока в queue_entries (вход в очередь или возврат в нее)"""
     try:
-        # Сначала сбрасываем все флаги
-        db_manager.execute("players", "UPDATE players SET in_queue = 0")
+        db_manager.execute(
+            "players",
+            """
+            INSERT OR REPLACE INTO queue_entries
+                (discordid, mode, playername, rating, channel_id, join_time)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                str(player["discord_id"]),
+                mode,
+                player["nickname"],
+                player["rating"],
+                player["channel_id"],
+                player["join_time"].isoformat(),
+            ),
+        )
+    except Exception as e:
+        print(f"Ошибка сохранения очереди в БД: {e}")
 
-        # Устанавливаем флаги для игроков в очередях
-        for mode, queue in queues.items():
-            for player in queue:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET in_queue = 1 WHERE discordid = ?",
-                    (str(player["discord_id"]),),
-                )
+
+def delete_queue_entries(players):
+    """Удаляет из queue_entries вышедших из очереди игроков одним запросом"""
+    discord_ids = [str(player["discord_id"]) for player in players]
+    if not discord_ids:
+        return
+    try:
+        db_manager.execute(
+            "players",
+            f"DELETE FROM queue_entries WHERE discordid IN ({', '.join('?' * len(discord_ids))})",
+            discord_ids,
+        )
     except Exception as e:
-        print(f"Ошибка сохранения очередей в БД: {e}")
+        print(f"Ошибка сохранения очереди в БД: {e}")
+
+
+def restore_queues():
+    """Восстанавливает очереди из queue_entries после перезапуска"""
+    rows = db_manager.fetchall(
+        "players",
+        """
+        SELECT discordid, mode, playername, rating, channel_id, join_time
+        FROM queue_entries
+        ORDER BY join_time
+        """,
+    )
+    for discord_id, mode, nickname, rating, channel_id, join_time in rows:
+        if mode not in queues:
+            continue
+        queues[mode].append(
+            {
+                "discord_id": int(discord_id),
+                "nickname": nickname,
+                "rating": rating,
+                "channel_id": channel_id,
+                "join_time": datetime.fromisoformat(join_time),
+            }
+        )
+    notify_queue_changed()
+    return len(rows)
 
 
 class ReportView(View):
@@ -756,32 +789,35 @@ class ReportView(View):
             winner_rating, loser_rating, 1
         )
 
-        # Обновляем статистику
-        db_manager.execute(
-            "players",
-            "UPDATE players SET wins = wins + 1 WHERE playername = ?",
-            (winner,),
-        )
-        db_manager.execute(
-            "players",
-            "UPDATE players SET losses = losses + 1 WHERE playername = ?",
-            (loser,),
-        )
-
-        # Обновляем ELO
-        update_player_rating(winner, new_winner_rating, mode)
-        update_player_rating(loser, new_loser_rating, mode)
-
-        # Обновляем матч
-        db_manager.execute(
-            "matches",
-            """
-            UPDATE matches 
-            SET player1score = ?, player2score = ?, isover = 1, isverified = 1 
-            WHERE matchid = ?
-            """,
-            (new_p1_score, new_p2_score, self.match_id),
-        )
+        # Обновляем статистику и ELO одной транзакцией
+        with db_manager.transaction("players"):
+            db_manager.execute(
+                "players",
+                "UPDATE players SET wins = wins + 1 WHERE playername = ?",
+                (winner,),
+            )
+            db_manager.execute(
+                "players",
+                "UPDATE players SET losses = losses + 1 WHERE playername = ?",
+                (loser,),
+            )
+            update_player_rating(
+                winner, new_winner_rating, mode, match_id=self.match_id, reason="report"
+            )
+            update_player_rating(
+                loser, new_loser_rating, mode, match_id=self.match_id, reason="report"
+            )
+            # Запись матча (в режиме одной базы - в той же транзакции)
+            db_manager.execute(
+                "matches",
+                """
+                UPDATE matches 
+                SET player1score = ?, player2score = ?, isover = 1, isverified = 1 
+                WHERE matchid = ?
+                """,
+                (new_p1_score, new_p2_score, self.match_id),
+            )
+            match_closed(self.match_id, new_p1_score, new_p2_score)
 
         # Отправляем результат в канал
         moderator_name = f"{interaction.user.name}#{interaction.user.discriminator}"
@@ -799,27 +835,19 @@ class ReportView(View):
         # Уведомляем игроков
         try:
             # Получаем discord_id игроков
-            winner_row = db_manager.execute(
-                "players",
-                "SELECT discordid FROM players WHERE playername = ?",
-                (winner,),
-            ).fetchone()
+            winner_row = player_cache.by_name(winner)
             if winner_row:
-                winner_id = int(winner_row[0])
-                winner_user = await global_bot.fetch_user(winner_id)
+                winner_id = int(winner_row.discordid)
+                winner_user = await user_resolver.fetch(winner_id)
                 await winner_user.send(
                     f"✅ Ваш репорт на матч #{self.match_id} принят. "
                     f"Противнику назначено техническое поражение."
                 )
 
-            loser_row = db_manager.execute(
-                "players",
-                "SELECT discordid FROM players WHERE playername = ?",
-                (loser,),
-            ).fetchone()
+            loser_row = player_cache.by_name(loser)
             if loser_row:
-                loser_id = int(loser_row[0])
-                loser_user = await global_bot.fetch_user(loser_id)
+                loser_id = int(loser_row.discordid)
+                loser_user = await user_resolver.fetch(loser_id)
                 await loser_user.send(
                     f"⚠️ Вам назначено техническое поражение по матчу #{self.match_id} "
                     f"из-за принятого репорта."
@@ -846,11 +874,19 @@ class ReportView(View):
             "UPDATE matches SET isover = 0 WHERE matchid = ?",
             (self.match_id,),
         )
+        # Репорт закрыл матч и снял его дедлайн - ставим дедлайн заново
+        match_data = db_manager.fetchone(
+            "matches",
+            "SELECT start_time, matchtype FROM matches WHERE matchid = ?",
+            (self.match_id,),
+        )
+        if match_data and match_data[1] == 1:
+            schedule_match_deadline(self.match_id, match_data[0])
 
         # Уведомляем репортера
         try:
             reporter_id = pending_reports[self.match_id]["reporter_id"]
-            reporter_user = await global_bot.fetch_user(reporter_id)
+            reporter_user = await user_resolver.fetch(reporter_id)
             await reporter_user.send(
                 f"❌ Ваш репорт на матч #{self.match_id} отклонен."
             )
@@ -901,14 +937,7 @@ class ReportView(View):
             embed.set_footer(text=f"Техническое поражение по репорту")
 
             # Ищем канал результатов
-            results_channel = None
-            for guild in global_bot.guilds:
-                for channel in guild.text_channels:
-                    if channel.name == "elobot-results":
-                        results_channel = channel
-                        break
-                if results_channel:
-                    break
+            results_channel = channel_registry.get("results")
 
             if results_channel:
                 await results_channel.send(embed=embed)
@@ -920,7 +949,7 @@ class ReportView(View):
 
 global_bot = None
 # Очереди для каждого режима
-queues = {mode: [] for mode in MODES.values()}
+queues = {mode: ModeQueue() for mode in MODES.values()}
 
 # Глобальные переменные для отслеживания процессов
 map_voting = (
@@ -932,13 +961,14 @@ pending_results = (
 )  # {message_id: {"match_id": int, "player1": str, "player2": str, "scores": str, "screenshot": str}}
 
 
+def is_in_queue(discord_id):
+    """Проверяет по очередям в памяти, ищет ли игрок матч"""
+    return any(discord_id in queue for queue in queues.values())
+
+
 def get_discord_id_by_nickname(nickname):
-    result = db_manager.execute(
-        "players",
-        "SELECT discordid FROM players WHERE playername = ?",
-        (nickname,),
-    ).fetchone()
-    return int(result[0]) if result else None
+    result = player_cache.by_name(nickname)
+    return int(result.discordid) if result else None
 
 
 # Объявляем функцию send_map_selection перед использованием
@@ -1135,14 +1165,9 @@ class MapSelectionView(View):
             else:
                 # Если нет в словаре, попробуем получить из БД
                 try:
-                    # Исправленная строка: правильный синтаксис параметра
-                    player_data = db_manager.execute(
-                        "players",
-                        "SELECT playername FROM players WHERE discordid = ?",
-                        (str(opponent_id),),  # <-- Запятая внутри кортежа
-                    ).fetchone()
+                    player_data = player_cache.by_discordid(opponent_id)
                     opponent_nickname = (
-                        player_data[0] if player_data else "Неизвестный игрок"
+                        player_data.playername if player_data else "Неизвестный игрок"
                     )
                 except Exception as e:
                     print(f"Ошибка при получении никнейма из БД: {e}")
@@ -1150,7 +1175,7 @@ class MapSelectionView(View):
 
             try:
                 # Получаем информацию о сопернике
-                opponent_user = await global_bot.fetch_user(opponent_id)
+                opponent_user = await user_resolver.fetch(opponent_id)
                 discord_tag = f"{opponent_user.name}#{opponent_user.discriminator}"
             except:
                 discord_tag = "неизвестен"
@@ -1166,28 +1191,18 @@ class MapSelectionView(View):
             embed.add_field(name="Discord противника", value=discord_tag, inline=False)
             embed.set_footer(text=f"Match ID: {self.match_id}")
 
-            try:
-                await global_bot.get_user(player_id).send(embed=embed)
-            except Exception as e:
-                print(f"Ошибка при отправке сообщения игроку {player_id}: {e}")
+            dispatcher.send_user(player_id, embed=embed)
 
         # Отправляем инструкцию обоим игрокам
-        try:
-            player1 = await global_bot.fetch_user(voting["players"][0])
-            player2 = await global_bot.fetch_user(voting["players"][1])
-
-            instruction = (
-                "🔍 Найдите вашего противника в Discord и договоритесь о создании игры.\n"
-                "ℹ️ После завершения матча **победитель** должен отправить результат командой "
-                "`.result <ID_матча> <свой_счет>-<счет_соперника>` в личные сообщения боту, "
-                "приложив скриншот.\n"
-                "Пример: `.result 123 5-3`"
-            )
-
-            await player1.send(instruction)
-            await player2.send(instruction)
-        except Exception as e:
-            print(f"Ошибка при отправке инструкции: {e}")
+        instruction = (
+            "🔍 Найдите вашего противника в Discord и договоритесь о создании игры.\n"
+            "ℹ️ После завершения матча **победитель** должен отправить результат командой "
+            "`.result <ID_матча> <свой_счет>-<счет_соперника>` в личные сообщения боту, "
+            "приложив скриншот.\n"
+            "Пример: `.result 123 5-3`"
+        )
+        for player_id in voting["players"]:
+            dispatcher.send_user(player_id, instruction)
 
         # Удаляем данные о голосовании
         if self.match_id in map_voting:
@@ -1223,200 +1238,260 @@ class ModeSelectView(View):
         self.stop()
 
 
-def calculate_elo(player1_rating, player2_rating, result, K=40, C=400, max_rating=4000):
-    expected_1 = 1 / (1 + 10 ** ((player2_rating - player1_rating) / C))
-    expected_2 = 1 - expected_1
-
-    weight_1 = max_rating / (max_rating + player1_rating)
-    weight_2 = max_rating / (max_rating + player2_rating)
-
-    new_rating_1 = player1_rating + K * (result - expected_1) * weight_1
-    new_rating_2 = player2_rating + K * ((1 - result) - expected_2) * weight_2
-
-    return round(new_rating_1), round(new_rating_2)
+# Строка журнала изменений ELO (rating_events, только добавление)
+RATING_EVENT_INSERT = """
+    INSERT INTO rating_events (playername, mode, old_rating, new_rating, match_id, reason)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
 
 
 def get_player_rating(nickname, mode):
-    if mode == MODES["station5f"]:
-        rating = db_manager.execute(
-            "players",
-            "SELECT elo_station5f FROM players WHERE playername = ?",
-            (nickname,),
-        ).fetchone()
-    elif mode == MODES["mots"]:
-        rating = db_manager.execute(
-            "players", "SELECT elo_mots FROM players WHERE playername = ?", (nickname,)
-        ).fetchone()
-    elif mode == MODES["12min"]:
-        rating = db_manager.execute(
-            "players", "SELECT elo_12min FROM players WHERE playername = ?", (nickname,)
-        ).fetchone()
-    else:
-        rating = db_manager.execute(
-            "players",
-            "SELECT currentelo FROM players WHERE playername = ?",
-            (nickname,),
-        ).fetchone()
+    suffix = MODE_COLUMN_SUFFIXES.get(mode)
+    elo_col = f"elo_{suffix}" if suffix else "currentelo"
+    player = player_cache.by_name(nickname)
+
+    return getattr(player, elo_col) if player else 1000
 
-    return rating[0] if rating else 1000
 
+def update_player_rating(nickname, new_rating, mode, match_id=None, reason="manual"):
+    """Записывает новый ELO режима и событие в rating_events.
 
-def update_player_rating(nickname, new_rating, mode):
-    # Обновляем ELO для конкретного режима
-    if mode == MODES["station5f"]:
+    reason - причина изменения: result, tech_loss, report, giveup, expiry.
+    Для режима Any только пересчитывается суммарный ELO, событие не пишется.
+    """
+    suffix = MODE_COLUMN_SUFFIXES.get(mode)
+    if suffix:
+        player = player_cache.by_name(nickname)
+        if player:
+            db_manager.execute(
+                "players",
+                RATING_EVENT_INSERT,
+                (
+                    nickname,
+                    mode,
+                    getattr(player, f"elo_{suffix}"),
+                    new_rating,
+                    match_id,
+                    reason,
+                ),
+            )
+        # Обновляем ELO режима и суммарный ELO одним запросом
+        # (в SET справа используются старые значения колонок)
+        others = " + ".join(
+            f"elo_{s}" for s in MODE_COLUMN_SUFFIXES.values() if s != suffix
+        )
         db_manager.execute(
             "players",
-            "UPDATE players SET elo_station5f = ? WHERE playername = ?",
-            (new_rating, nickname),
+            f"""
+            UPDATE players 
+            SET elo_{suffix} = ?, currentelo = ? + {others}
+            WHERE playername = ?
+            """,
+            (new_rating, new_rating, nickname),
         )
-    elif mode == MODES["mots"]:
+        if player:
+            setattr(player, f"elo_{suffix}", new_rating)
+            player.currentelo = player.elo_station5f + player.elo_mots + player.elo_12min
+            leaderboard.update(
+                nickname,
+                **{f"elo_{suffix}": new_rating, "currentelo": player.currentelo},
+            )
+            nickname_sync.mark(player.discordid)
+    else:
+        # Обновляем суммарный ELO
         db_manager.execute(
             "players",
-            "UPDATE players SET elo_mots = ? WHERE playername = ?",
-            (new_rating, nickname),
+            """
+            UPDATE players 
+            SET currentelo = elo_station5f + elo_mots + elo_12min 
+            WHERE playername = ?
+            """,
+            (nickname,),
         )
-    elif mode == MODES["12min"]:
+        player = player_cache.by_name(nickname)
+        if player:
+            player.currentelo = player.elo_station5f + player.elo_mots + player.elo_12min
+            leaderboard.update(nickname, currentelo=player.currentelo)
+
+
+def update_match_stats(stats, mode):
+    """Увеличивает счетчики wins/losses/ties (общий и режима) для пар (колонка, ник)"""
+    suffix = MODE_COLUMN_SUFFIXES.get(mode)
+    leaderboard.bump()
+    for column, nickname in stats:
+        mode_column = f", {column}_{suffix} = {column}_{suffix} + 1" if suffix else ""
         db_manager.execute(
             "players",
-            "UPDATE players SET elo_12min = ? WHERE playername = ?",
-            (new_rating, nickname),
+            f"UPDATE players SET {column} = {column} + 1{mode_column} WHERE playername = ?",
+            (nickname,),
         )
 
-    # Обновляем суммарный ELO
-    db_manager.execute(
-        "players",
-        """
-        UPDATE players 
-        SET currentelo = elo_station5f + elo_mots + elo_12min 
-        WHERE playername = ?
-        """,
-        (nickname,),
+
+STANDARD_MODES = [MODES["station5f"], MODES["mots"], MODES["12min"]]
+
+rating_windows = {
+    mode: RatingWindow(**settings) for mode, settings in RATING_WINDOWS.items()
+}
+matchmaking_stats = MatchmakingStats()
+
+# Режимы, очереди которых изменились с последнего прохода матчмейкера
+_dirty_modes = set()
+# Будит find_match; создается внутри него, когда event loop уже запущен
+_matchmaker_wakeup = None
+
+
+def notify_queue_changed(mode=None):
+    """Сообщает матчмейкеру об изменении очереди режима (None - всех очередей)"""
+    if mode is None:
+        _dirty_modes.update(queues)
+    else:
+        _dirty_modes.add(mode)
+    if _matchmaker_wakeup is not None:
+        _matchmaker_wakeup.set()
+
+
+def _get_active_players():
+    """Ники игроков, у которых есть незавершенный обычный матч"""
+    matches = db_manager.fetchall(
+        "matches",
+        "SELECT player1, player2 FROM matches WHERE isover = 0 AND matchtype = 1",
     )
+    return {nickname for match in matches for nickname in match}
+
+
+def _is_busy(active_players):
+    """Фильтр для ModeQueue: пропускает игроков с активным матчем"""
+    return lambda player: player["nickname"] in active_players
+
+
+async def _match_mode(mode, active_players):
+    """Создает пары внутри очереди режима (жадно или пакетно, см. MATCHMAKING_MODE)"""
+    queue = queues[mode]
+    busy = _is_busy(active_players)
+    window = rating_windows[mode]
+    now = datetime.now()
+
+    pairs = None
+    if MATCHMAKING_MODE == "batch":
+        pairs = pair_batch(
+            [p for p in queue if not busy(p)],
+            now,
+            window=window,
+            **MATCHMAKING_BATCH,
+        )
+        if pairs is None:
+            print(
+                f"[MATCH] Пакетный подбор {MODE_NAMES[mode]} не уложился во время, "
+                "используем жадный"
+            )
+        else:
+            for player1, player2 in pairs:
+                queue.remove(player1)
+                queue.remove(player2)
+    if pairs is None:
+        pairs = take_greedy_pairs(queue, busy, window, now)
+
+    # Игроки уже убраны из очереди; при ошибке create_match вернет их обратно
+    delete_queue_entries([player for pair in pairs for player in pair])
+    for player1, player2 in pairs:
+        matchmaking_stats.record(mode, player1, player2, now)
+        await create_match(mode, player1, player2)
+
+
+async def _match_any(modes, active_players):
+    """Игроки режима "Any": соперник из очередей modes, иначе из самой очереди Any"""
+    queue_any = queues[MODES["any"]]
+    busy = _is_busy(active_players)
+    now = datetime.now()
+    for player_any in queue_any:
+        if player_any["discord_id"] not in queue_any or busy(player_any):
+            continue
+        rating = player_any["rating"]
+
+        # Соперник в окне режима, ближайший по рейтингу этого режима
+        found = nearest_in_queues(
+            player_any,
+            {mode: get_player_rating(player_any["nickname"], mode) for mode in modes},
+            queues,
+            rating_windows,
+            now,
+            busy,
+        )
+        if found:
+            candidate_mode, candidate, probe = found
+            queue_any.remove(player_any)
+            queues[candidate_mode].remove(candidate)
+            delete_queue_entries([player_any, candidate])
+            matchmaking_stats.record(candidate_mode, probe, candidate, now)
+            await create_match(candidate_mode, player_any, candidate)
+            continue
+
+        # Поиск внутри очереди "Any"
+        player2 = queue_any.nearest(rating, lambda p: p is player_any or busy(p))
+        if player2 is None or not rating_windows[MODES["any"]].allows(
+            player_any, player2, now
+        ):
+            continue
+        queue_any.remove(player_any)
+        queue_any.remove(player2)
+        delete_queue_entries([player_any, player2])
+        matchmaking_stats.record(MODES["any"], player_any, player2, now)
+        await create_match(random.choice(STANDARD_MODES), player_any, player2)
 
 
 async def find_match():
-    """Поиск подходящих матчей в очередях с учетом типа матча"""
+    """Матчмейкер: подбирает пары при изменении очередей.
+
+    Просыпается по notify_queue_changed() (play, leave, завершение матча) и
+    проверяет только затронутые режимы. Раз в MATCHMAKING_TICK секунд
+    проверяет все очереди - окна рейтинга расширяются со временем ожидания.
+    """
+    global _matchmaker_wakeup
+    _matchmaker_wakeup = asyncio.Event()
+    # Первый проход - по всем очередям (могли быть восстановлены из БД)
+    _dirty_modes.update(queues)
+
     while True:
-        await asyncio.sleep(15)
+        if not _dirty_modes:
+            try:
+                await asyncio.wait_for(_matchmaker_wakeup.wait(), MATCHMAKING_TICK)
+            except asyncio.TimeoutError:
+                _dirty_modes.update(queues)
+        _matchmaker_wakeup.clear()
+        dirty = set(_dirty_modes)
+        _dirty_modes.clear()
+
+        standard_modes = [mode for mode in STANDARD_MODES if mode in dirty]
+        any_modes = STANDARD_MODES if MODES["any"] in dirty else standard_modes
+        has_pairs = any(len(queues[mode]) >= 2 for mode in standard_modes)
+        has_any = queues[MODES["any"]] and (
+            MODES["any"] in dirty or standard_modes
+        )
+        if not has_pairs and not has_any:
+            continue
+
         print(
             f"[{datetime.now().strftime('%H:%M:%S')}] Проверка очередей: {[len(q) for q in queues.values()]}"
         )
 
         try:
-            # Получаем списки игроков в активных матчах по типам
-            active_players = {1: set(), 2: set()}  # Обычные матчи  # Турнирные матчи
+            # Игроки в активных обычных матчах не подбираются
+            active_players = _get_active_players()
 
-            # Заполняем множества активных игроков для каждого типа матча
-            for match_type in [1, 2]:
-                matches = db_manager.fetchall(
-                    "matches",
-                    "SELECT player1, player2 FROM matches WHERE isover = 0 AND matchtype = ?",
-                    (match_type,),
-                )
-                for player1, player2 in matches:
-                    active_players[match_type].add(player1)
-                    active_players[match_type].add(player2)
-
-            # Обработка стандартных режимов (1, 2, 3) - только обычные матчи (matchtype=1)
-            for mode in [MODES["station5f"], MODES["mots"], MODES["12min"]]:
-                # Фильтруем игроков, исключая тех, кто уже в обычном матче
-                queue = [
-                    p for p in queues[mode] if p["nickname"] not in active_players[1]
-                ]
-
-                if len(queue) >= 2:
-                    try:
-                        # Сортируем по времени в очереди
-                        queue.sort(key=lambda x: x["join_time"])
-
-                        # Берем первого игрока в очереди
-                        player1 = queue.pop(0)
-
-                        # Ищем наиболее подходящего соперника по рейтингу
-                        min_diff = float("inf")
-                        candidate = None
-                        candidate_idx = None
-
-                        for idx, p in enumerate(queue):
-                            diff = abs(player1["rating"] - p["rating"])
-                            if diff < min_diff:
-                                min_diff = diff
-                                candidate = p
-                                candidate_idx = idx
-
-                        if candidate_idx is not None:
-                            player2 = queue.pop(candidate_idx)
-                            await create_match(mode, player1, player2)
-                            save_queues_to_db()
-                    except Exception as e:
-                        print(f"Ошибка обработки очереди {MODE_NAMES[mode]}: {e}")
-                        continue
-
-            # Обработка режима "Any" (0)
-            queue_any = [
-                p
-                for p in queues[MODES["any"]]
-                if p["nickname"] not in active_players[1]
-            ]
-
-            if queue_any:
+            for mode in standard_modes:
                 try:
-                    # Поиск в других режимах (1, 2, 3)
-                    min_diff = float("inf")
-                    candidate = None
-                    candidate_mode = None
-                    candidate_idx = None
-
-                    for mode in [MODES["station5f"], MODES["mots"], MODES["12min"]]:
-                        queue = [
-                            p
-                            for p in queues[mode]
-                            if p["nickname"] not in active_players[1]
-                        ]
-
-                        for idx, p in enumerate(queue):
-                            diff = abs(queue_any[0]["rating"] - p["rating"])
-                            if diff < min_diff:
-                                min_diff = diff
-                                candidate = p
-                                candidate_mode = mode
-                                candidate_idx = idx
-
-                    if candidate:
-                        player_any = queue_any.pop(0)
-                        queues[candidate_mode].pop(candidate_idx)
-                        await create_match(candidate_mode, player_any, candidate)
-                        save_queues_to_db()
-                    else:
-                        # Поиск внутри очереди "Any"
-                        if len(queue_any) >= 2:
-                            player1 = queue_any.pop(0)
-                            min_diff = float("inf")
-                            candidate = None
-                            candidate_idx = None
-
-                            for idx, p in enumerate(queue_any):
-                                diff = abs(player1["rating"] - p["rating"])
-                                if diff < min_diff:
-                                    min_diff = diff
-                                    candidate = p
-                                    candidate_idx = idx
-
-                            if candidate_idx is not None:
-                                player2 = queue_any.pop(candidate_idx)
-                                random_mode = random.choice(
-                                    [MODES["station5f"], MODES["mots"], MODES["12min"]]
-                                )
-                                await create_match(random_mode, player1, player2)
-                                save_queues_to_db()
+                    await _match_mode(mode, active_players)
+                except Exception as e:
+                    print(f"Ошибка обработки очереди {MODE_NAMES[mode]}: {e}")
+
+            if has_any:
+                try:
+                    await _match_any(any_modes, active_players)
                 except Exception as e:
                     print(f"Ошибка обработки очереди Any: {e}")
-                    continue
 
         except Exception as e:
             print(f"Критическая ошибка в find_match: {e}")
-            # Сохраняем состояние даже при ошибке
-            save_queues_to_db()
 
 
 async def create_match(mode, player1, player2, matchtype=1, tournament_id=None):
@@ -1435,31 +1510,27 @@ async def create_match(mode, player1, player2, matchtype=1, tournament_id=None):
             print(f"[MATCH] Оба игрока — emptyslot, матч не создается")
             return None
 
-        # Обновляем статус в базе только для реальных игроков
-        if not is_player1_empty and not is_player2_empty:
-            db_manager.execute(
-                "players",
-                "UPDATE players SET in_queue = 0 WHERE playername IN (?, ?)",
-                (player1["nickname"], player2["nickname"]),
-            )
-
         # Создаем запись о матче и получаем ID
+        start_time = datetime.now()
         cursor = db_manager.execute(
             "matches",
             """
-            INSERT INTO matches (mode, player1, player2, start_time, matchtype, tournament_id)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO matches (mode, player1, player2, start_time, matchtype, tournament_id, channel_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 mode,
                 player1["nickname"],
                 player2["nickname"],
-                datetime.now(),
+                start_time,
                 matchtype,
                 tournament_id,
+                player1.get("channel_id"),
             ),
         )
         match_id = cursor.lastrowid
+        if matchtype == 1:
+            schedule_match_deadline(match_id, start_time)
 
         # Если один из игроков — "emptyslot", автоматически завершаем матч
         if matchtype == 2 and (is_player1_empty or is_player2_empty):
@@ -1473,6 +1544,9 @@ async def create_match(mode, player1, player2, matchtype=1, tournament_id=None):
                 """,
                 (0 if is_player1_empty else 1, 1 if is_player1_empty else 0, match_id),
             )
+            match_closed(
+                match_id, 0 if is_player1_empty else 1, 1 if is_player1_empty else 0
+            )
             print(f"[MATCH] Матч с emptyslot автоматически завершен в пользу {winner}")
             return match_id
 
@@ -1492,15 +1566,14 @@ async def create_match(mode, player1, player2, matchtype=1, tournament_id=None):
                 ),
                 color=discord.Color.green(),
             )
-            await channel.send(embed=embed)
+            dispatcher.send_channel(channel, embed=embed)
         except Exception as e:
             print(f"Ошибка уведомления в канале: {e}")
 
         # Личные сообщения игрокам
         for player_data, opponent_data in [(player1, player2), (player2, player1)]:
             try:
-                user = await global_bot.fetch_user(player_data["discord_id"])
-                opponent_user = await global_bot.fetch_user(opponent_data["discord_id"])
+                opponent_user = await user_resolver.fetch(opponent_data["discord_id"])
 
                 # Форматируем тэг соперника
                 discord_tag = f"{opponent_user.name}#{opponent_user.discriminator}"
@@ -1533,8 +1606,9 @@ async def create_match(mode, player1, player2, matchtype=1, tournament_id=None):
                     "Пример: `.result {match_id} 5-3`"
                 )
 
-                await user.send(embed=embed)
-                await user.send(instruction)
+                # Embed и инструкция уходят одним сообщением
+                dispatcher.send_user(player_data["discord_id"], embed=embed)
+                dispatcher.send_user(player_data["discord_id"], instruction)
             except Exception as e:
                 print(f"Ошибка отправки ЛС игроку: {e}")
 
@@ -1555,246 +1629,292 @@ async def create_match(mode, player1, player2, matchtype=1, tournament_id=None):
 
     except Exception as e:
         print(f"Ошибка создания матча: {e}")
-        # Возвращаем игроков в очередь при ошибке
-        queues[mode].append(player1)
-        queues[mode].append(player2)
-        save_queues_to_db()
-    finally:
-        # Всегда сохраняем состояние после попытки создания матча
-        save_queues_to_db()
-
-
-# Фоновая задача для периодического сохранения
-async def periodic_queue_saver():
-    """Периодически сохраняет состояние очередей"""
-    while True:
-        await asyncio.sleep(600)  # Каждые 10 минут
-        try:
-            save_queues_to_db()
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Автосохранение очередей")
-        except Exception as e:
-            print(f"Ошибка автосохранения: {e}")
+        # Возвращаем игроков обычного матча в очередь при ошибке
+        if matchtype == 1:
+            for player in (player1, player2):
+                queues[mode].append(player)
+                persist_queue_entry(mode, player)
+
+
+# Колонки рейтинга игрока (currentelo - сумма рейтингов режимов)
+ELO_COLUMNS = ("currentelo", "elo_station5f", "elo_mots", "elo_12min")
+
+
+def resolve_expired_ties(matches):
+    """Записывает ничьи по просроченным матчам одной транзакцией.
+
+    matches - строки (matchid, mode, player1, player2, channel_id). Рейтинги
+    всех игроков пачки читаются одним запросом и пересчитываются в памяти
+    (игрок может встретиться в пачке несколько раз), затем ELO, события
+    rating_events, счетчики ничьих и сами матчи записываются через executemany.
+    Возвращает данные для уведомлений игроков.
+    """
+    # Пачка прочитана через async_db: пока запрос ждал, результат матча могли
+    # подтвердить. Без await между этой проверкой и записью ее никто не опередит
+    match_ids = [match[0] for match in matches]
+    still_open = {
+        row[0]
+        for row in db_manager.fetchall(
+            "matches",
+            f"SELECT matchid FROM matches WHERE isover = 0 AND matchid IN ({', '.join('?' * len(match_ids))})",
+            match_ids,
+        )
+    }
+    matches = [match for match in matches if match[0] in still_open]
+    if not matches:
+        return []
 
+    names = sorted({name for match in matches for name in match[2:4]})
+    rows = db_manager.fetchall(
+        "players",
+        f"""
+        SELECT playername, discordid, {', '.join(ELO_COLUMNS)}
+        FROM players
+        WHERE playername IN ({', '.join('?' * len(names))})
+        """,
+        names,
+    )
+    players = {
+        row[0]: {"discordid": row[1], **dict(zip(ELO_COLUMNS, row[2:]))}
+        for row in rows
+    }
+
+    results = []
+    ties = {}  # суффикс режима -> [(ник,), ...]
+    rating_rows = []  # строки rating_events
+    for match_id, mode, player1_name, player2_name, channel_id in matches:
+        suffix = MODE_COLUMN_SUFFIXES.get(mode)
+        elo_col = f"elo_{suffix}" if suffix else "currentelo"
+        pair = (player1_name, player2_name)
+        ratings = [
+            players[name][elo_col] if name in players else 1000 for name in pair
+        ]
+        new_ratings = calculate_elo(ratings[0], ratings[1], 0.5)  # Ничья
+        for name, new_rating in zip(pair, new_ratings):
+            player = players.get(name)
+            if player is None:
+                continue
+            # Как в update_player_rating: для режима Any суммарный ELO
+            # просто пересчитывается из рейтингов режимов
+            if suffix:
+                rating_rows.append(
+                    (name, mode, player[elo_col], new_rating, match_id, "expiry")
+                )
+                player[elo_col] = new_rating
+            player["currentelo"] = (
+                player["elo_station5f"] + player["elo_mots"] + player["elo_12min"]
+            )
+            ties.setdefault(suffix, []).append((name,))
+        results.append(
+            {
+                "match_id": match_id,
+                "mode": mode,
+                "channel_id": channel_id,
+                "players": [
+                    (
+                        name,
+                        players[name]["discordid"] if name in players else None,
+                        rating,
+                        new_rating,
+                    )
+                    for name, rating, new_rating in zip(pair, ratings, new_ratings)
+                ],
+            }
+        )
 
-async def check_expired_matches(bot):
-    await bot.wait_until_ready()
-    print(
-        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Запущена задача проверки просроченных матчей"
+    touched = {name for tie_names in ties.values() for (name,) in tie_names}
+    with db_manager.transaction("players"):
+        db_manager.executemany(
+            "players",
+            f"UPDATE players SET {', '.join(f'{column} = ?' for column in ELO_COLUMNS)} WHERE playername = ?",
+            [
+                tuple(players[name][column] for column in ELO_COLUMNS) + (name,)
+                for name in touched
+            ],
+        )
+        db_manager.executemany("players", RATING_EVENT_INSERT, rating_rows)
+        for suffix, tie_names in ties.items():
+            mode_ties = f", ties_{suffix} = ties_{suffix} + 1" if suffix else ""
+            db_manager.executemany(
+                "players",
+                f"UPDATE players SET ties = ties + 1{mode_ties} WHERE playername = ?",
+                tie_names,
+            )
+        # Запись матчей последней: в режиме одной базы - в той же транзакции,
+        # при раздельных базах ошибка здесь откатит рейтинги
+        db_manager.executemany(
+            "matches",
+            "UPDATE matches SET player1score = 0, player2score = 0, isover = 1, isverified = 1 WHERE matchid = ? AND isover = 0",
+            [(result["match_id"],) for result in results],
+        )
+
+    for name in touched:
+        ratings = {column: players[name][column] for column in ELO_COLUMNS}
+        player_cache.update(name, **ratings)
+        leaderboard.update(name, **ratings)
+        nickname_sync.mark(players[name]["discordid"])
+    for result in results:
+        events.emit(
+            MATCH_FINISHED,
+            match_id=result["match_id"],
+            player1_score=0,
+            player2_score=0,
+        )
+    return results
+
+
+def _elo_changes(result):
+    return "\n".join(
+        f"{name}: {rating} → **{new_rating}** ({new_rating - rating:+})"
+        for name, _, rating, new_rating in result["players"]
     )
 
-    while not bot.is_closed():
-        try:
-            # Проверяем каждые 5 минут
-            await asyncio.sleep(300)
 
-            now = datetime.now()
-            one_hour_ago = now - timedelta(hours=1)
+def _notify_expired_match(result, results_channel):
+    """Уведомления о матче, завершенном ничьей по времени"""
+    match_id = result["match_id"]
+    mode_name = MODE_NAMES.get(result["mode"], "Unknown")
+    (player1_name, *_), (player2_name, *_) = result["players"]
+
+    # Уведомление игроков в ЛС
+    embed_dm = discord.Embed(
+        title="⏱ Матч завершен автоматически",
+        description=(
+            f"Матч #{match_id} между **{player1_name}** и **{player2_name}**\n"
+            f"Режим: **{mode_name}**\n"
+            f"Был автоматически завершен вничью, так как превышено время (1 час).\n\n"
+            f"**Изменения ELO:**\n"
+            f"{_elo_changes(result)}"
+        ),
+        color=discord.Color.orange(),
+    )
+    for _, discord_id, _, _ in result["players"]:
+        if discord_id:
+            dispatcher.send_user(discord_id, embed=embed_dm)
 
-            print(
-                f"[{now.strftime('%H:%M:%S')}] Проверка матчей старше {one_hour_ago.strftime('%H:%M:%S')}"
-            )
+    # Одно напоминание о результате в канал, где был создан матч
+    if result["channel_id"]:
+        dispatcher.send_channel(result["channel_id"], RESULT_REMINDER)
 
-            # Исключаем турнирные матчи (matchtype=2)
-            expired_matches = db_manager.execute(
-                "matches",
-                """
-                SELECT matchid, mode, player1, player2, start_time 
-                FROM matches 
-                WHERE isover = 0 AND start_time < ? AND matchtype = 1
-                """,
-                (one_hour_ago,),
-            ).fetchall()
+    if results_channel:
+        embed_channel = discord.Embed(
+            title="⏱ Матч завершен (время вышло)",
+            description=(
+                f"**Match ID:** {match_id}\n"
+                f"**Режим:** {mode_name}\n"
+                f"**Игроки:** {player1_name} vs {player2_name}\n"
+                f"**Результат:** Ничья 0:0\n\n"
+                f"**Причина:** Превышено максимальное время матча (1 час)\n\n"
+                f"**Изменения ELO:**\n"
+                f"{_elo_changes(result)}"
+            ),
+            color=discord.Color.gold(),  # Желтый цвет
+        )
+        embed_channel.set_footer(text="Матч завершен автоматически по истечении времени")
+        dispatcher.send_channel(results_channel, embed=embed_channel)
 
-            print(f"Найдено {len(expired_matches)} просроченных матчей")
 
-            for match in expired_matches:
-                match_id, mode, player1_name, player2_name, start_time = match
-                print(
-                    f"Обработка матча {match_id}: {player1_name} vs {player2_name} (начат в {start_time})"
-                )
+def send_expiry_notifications(results):
+    """Ставит в очередь уведомления по пачке просроченных матчей"""
+    results_channel = channel_registry.get("results")
+    if not results_channel:
+        print("⚠ Канал elobot-results не найден ни на одном сервере")
 
-                # Двойная проверка статуса матча
-                match_status = db_manager.execute(
-                    "matches",
-                    "SELECT isover FROM matches WHERE matchid = ?",
-                    (match_id,),
-                ).fetchone()
+    for result in results:
+        _notify_expired_match(result, results_channel)
 
-                if match_status and match_status[0] == 1:
-                    print(f"Матч {match_id} уже завершен, пропускаем")
-                    continue
 
-                print(f"Матч {match_id} просрочен, завершаем автоматически")
+async def expire_matches(match_ids):
+    """Завершает ничьей матчи, у которых наступил дедлайн (одна пачка)"""
+    # Матч мог завершиться без снятия дедлайна - берем только открытые
+    expired_matches = await async_db.fetchall(
+        "matches",
+        f"""
+        SELECT matchid, mode, player1, player2, channel_id
+        FROM matches
+        WHERE isover = 0 AND matchid IN ({', '.join('?' * len(match_ids))})
+        """,
+        match_ids,
+    )
+    if not expired_matches:
+        return
+    try:
+        results = resolve_expired_ties(expired_matches)
+    except Exception as e:
+        print(f"Критическая ошибка в check_expired_matches: {e}")
+        with open("bot_errors.log", "a") as f:
+            f.write(
+                f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR in check_expired_matches: {e}\n"
+            )
+        return
+    if not results:
+        return
+    notify_queue_changed()
+    print(
+        f"[{datetime.now().strftime('%H:%M:%S')}] Завершено вничью по времени: "
+        f"{', '.join(str(result['match_id']) for result in results)}"
+    )
+    send_expiry_notifications(results)
 
-                # Обновляем матч как ничью
-                db_manager.execute(
-                    "matches",
-                    "UPDATE matches SET player1score = 0, player2score = 0, isover = 1, isverified = 1 WHERE matchid = ?",
-                    (match_id,),
-                )
-                print(f"Матч {match_id} помечен как завершенный (ничья)")
 
-                # Обновляем статистику игроков
-                try:
-                    rating1 = get_player_rating(player1_name, mode)
-                    rating2 = get_player_rating(player2_name, mode)
-                    new_rating1, new_rating2 = calculate_elo(
-                        rating1, rating2, 0.5
-                    )  # Ничья
-
-                    update_player_rating(player1_name, new_rating1, mode)
-                    update_player_rating(player2_name, new_rating2, mode)
-
-                    # Обновляем счетчики ничьих
-                    if mode == MODES["station5f"]:
-                        db_manager.execute(
-                            "players",
-                            "UPDATE players SET ties_station5f = ties_station5f + 1 WHERE playername = ?",
-                            (player1_name,),
-                        )
-                        db_manager.execute(
-                            "players",
-                            "UPDATE players SET ties_station5f = ties_station5f + 1 WHERE playername = ?",
-                            (player2_name,),
-                        )
-                    elif mode == MODES["mots"]:
-                        db_manager.execute(
-                            "players",
-                            "UPDATE players SET ties_mots = ties_mots + 1 WHERE playername = ?",
-                            (player1_name,),
-                        )
-                        db_manager.execute(
-                            "players",
-                            "UPDATE players SET ties_mots = ties_mots + 1 WHERE playername = ?",
-                            (player2_name,),
-                        )
-                    elif mode == MODES["12min"]:
-                        db_manager.execute(
-                            "players",
-                            "UPDATE players SET ties_12min = ties_12min + 1 WHERE playername = ?",
-                            (player1_name,),
-                        )
-                        db_manager.execute(
-                            "players",
-                            "UPDATE players SET ties_12min = ties_12min + 1 WHERE playername = ?",
-                            (player2_name,),
-                        )
+async def _expire_confirmations(views):
+    """Таймаут PlayerConfirmationView: результат уходит модератору"""
+    for view in views:
+        view.stop()
+        try:
+            await view.on_timeout()
+        except Exception as e:
+            print(f"Ошибка таймаута подтверждения матча {view.match_id}: {e}")
 
-                    db_manager.execute(
-                        "players",
-                        "UPDATE players SET ties = ties + 1 WHERE playername IN (?, ?)",
-                        (player1_name, player2_name),
-                    )
-                    print("Статистика игроков обновлена")
-                except Exception as e:
-                    print(f"Ошибка при обновлении статистики: {e}")
 
-                # Уведомление игроков в ЛС
-                try:
-                    user1_id = get_discord_id_by_nickname(player1_name)
-                    user2_id = get_discord_id_by_nickname(player2_name)
-
-                    # Создаем embed один раз
-                    embed_dm = discord.Embed(
-                        title="⏱ Матч завершен автоматически",
-                        description=(
-                            f"Матч #{match_id} между **{player1_name}** и **{player2_name}**\n"
-                            f"Режим: **{MODE_NAMES.get(mode, 'Unknown')}**\n"
-                            f"Был автоматически завершен вничью, так как превышено время (1 час).\n\n"
-                            f"**Изменения ELO:**\n"
-                            f"{player1_name}: {rating1} → **{new_rating1}** ({new_rating1 - rating1:+})\n"
-                            f"{player2_name}: {rating2} → **{new_rating2}** ({new_rating2 - rating2:+})"
-                        ),
-                        color=discord.Color.orange(),
-                    )
+# Дедлайны обычных матчей (match_id) и запросов подтверждения результата (view)
+match_deadlines = DeadlineScheduler(expire_matches, name="match_deadlines")
+confirmation_deadlines = DeadlineScheduler(
+    _expire_confirmations, name="confirmation_deadlines"
+)
 
-                    # Отправляем уведомление игрокам
-                    if user1_id:
-                        user1 = await global_bot.fetch_user(user1_id)
-                        await user1.send(embed=embed_dm)
-                        print(f"Уведомление отправлено {player1_name} ({user1_id})")
-
-                    if user2_id:
-                        user2 = await global_bot.fetch_user(user2_id)
-                        await user2.send(embed=embed_dm)
-                        print(f"Уведомление отправлено {player2_name} ({user2_id})")
-
-                    # Отправляем ОДНО напоминание о результате (в общий чат матча)
-                    # Находим канал, где был создан матч
-                    try:
-                        # Получаем информацию о канале из первого игрока в очереди
-                        for queue in queues.values():
-                            for player in queue:
-                                if player["nickname"] in [
-                                    player1_name,
-                                    player2_name,
-                                ]:
-                                    channel_id = player["channel_id"]
-                                    channel = global_bot.get_channel(channel_id)
-                                    if channel:
-                                        await channel.send(RESULT_REMINDER)
-                                        print(
-                                            f"Напоминание отправлено в канал #{channel.name}"
-                                        )
-                                        break
-                            else:
-                                continue
-                            break
-                    except Exception as e:
-                        print(f"Ошибка при отправке напоминания в канал: {e}")
 
-                except Exception as e:
-                    print(f"Ошибка при отправке уведомления игрокам: {e}")
+def schedule_match_deadline(match_id, start_time):
+    if isinstance(start_time, str):
+        start_time = datetime.fromisoformat(start_time)
+    match_deadlines.schedule(match_id, start_time + timedelta(seconds=MATCH_TIMEOUT))
+
+
+def match_closed(match_id, player1_score=None, player2_score=None):
+    """Снимает дедлайн завершенного матча, будит матчмейкер и публикует match_finished"""
+    match_deadlines.cancel(match_id)
+    notify_queue_changed()
+    # Внутри транзакции событие уходит только после коммита записи матча
+    db_manager.after_commit(
+        "matches",
+        lambda: events.emit(
+            MATCH_FINISHED,
+            match_id=match_id,
+            player1_score=player1_score,
+            player2_score=player2_score,
+        ),
+    )
 
-                # Отправка в канал результатов
-                try:
-                    embed_channel = discord.Embed(
-                        title="⏱ Матч завершен (время вышло)",
-                        description=(
-                            f"**Match ID:** {match_id}\n"
-                            f"**Режим:** {MODE_NAMES.get(mode, 'Unknown')}\n"
-                            f"**Игроки:** {player1_name} vs {player2_name}\n"
-                            f"**Результат:** Ничья 0:0\n\n"
-                            f"**Причина:** Превышено максимальное время матча (1 час)\n\n"
-                            f"**Изменения ELO:**\n"
-                            f"{player1_name}: {rating1} → **{new_rating1}** ({new_rating1 - rating1:+})\n"
-                            f"{player2_name}: {rating2} → **{new_rating2}** ({new_rating2 - rating2:+})"
-                        ),
-                        color=discord.Color.gold(),  # Желтый цвет
-                    )
-                    embed_channel.set_footer(
-                        text="Матч завершен автоматически по истечении времени"
-                    )
 
-                    # Ищем канал elobot-results
-                    results_channel_found = None
-                    for guild in global_bot.guilds:
-                        for channel in guild.text_channels:
-                            if channel.name == "elobot-results":
-                                results_channel_found = channel
-                                print(
-                                    f"Найден канал результатов: {channel.name} ({channel.id}) на сервере {guild.name}"
-                                )
-                                break
-                        if results_channel_found:
-                            break
-
-                    if results_channel_found:
-                        await results_channel_found.send(embed=embed_channel)
-                        print(
-                            f"Сообщение о матче {match_id} отправлено в канал результатов"
-                        )
-                    else:
-                        print("⚠ Канал elobot-results не найден ни на одном сервере")
-                except Exception as e:
-                    print(f"Ошибка при отправке в канал: {e}")
+def load_match_deadlines():
+    """Загружает дедлайны всех открытых обычных матчей"""
+    rows = db_manager.fetchall(
+        "matches",
+        "SELECT matchid, start_time FROM matches WHERE isover = 0 AND matchtype = 1",
+    )
+    for match_id, start_time in rows:
+        schedule_match_deadline(match_id, start_time)
+    return len(rows)
 
-        except Exception as e:
-            print(f"Критическая ошибка в check_expired_matches: {e}")
-            with open("bot_errors.log", "a") as f:
-                f.write(
-                    f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ERROR in check_expired_matches: {e}\n"
-                )
+
+async def check_expired_matches(bot):
+    await bot.wait_until_ready()
+    loaded = load_match_deadlines()
+    print(
+        f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Запущена задача проверки просроченных матчей (открытых матчей: {loaded})"
+    )
+    # Просроченные за время простоя матчи завершатся сразу
+    await match_deadlines.run()
 
 
 def setup(bot):
@@ -1807,28 +1927,13 @@ def setup(bot):
         if ctx.channel.name != "elobot-queue":
             return
 
-        player_data = db_manager.execute(
-            "players",
-            "SELECT playername, in_queue FROM players WHERE discordid = ?",
-            (str(ctx.author.id),),
-        ).fetchone()
+        player_data = player_cache.by_discordid(ctx.author.id)
 
         if not player_data:
             await ctx.send("❌ Требуется верификация для поиска игры")
             return
 
-        # Получаем информацию об игроке
-        player_data = db_manager.execute(
-            "players",
-            "SELECT playername, in_queue FROM players WHERE discordid = ?",
-            (str(ctx.author.id),),
-        ).fetchone()
-
-        if not player_data:
-            await ctx.send("❌ Вы не зарегистрированы в системе")
-            return
-
-        nickname, in_queue = player_data
+        nickname = player_data.playername
 
         # +++ ПРОВЕРКА АКТИВНЫХ МАТЧЕЙ +++
         # Проверяем только обычные матчи (matchtype=1)
@@ -1837,8 +1942,7 @@ def setup(bot):
             """
             SELECT matchid 
             FROM matches 
-            WHERE (player1 = ? OR player2 = ?) 
-            AND isover = 0
+            WHERE ((player1 = ? AND isover = 0) OR (player2 = ? AND isover = 0))
             AND matchtype = 1
             """,
             (nickname, nickname),
@@ -1852,7 +1956,7 @@ def setup(bot):
             return
         # --- КОНЕЦ ПРОВЕРКИ АКТИВНЫХ МАТЧЕЙ ---
 
-        if in_queue == 1:
+        if is_in_queue(ctx.author.id):
             await ctx.send("❌ Вы уже в очереди")
             return
 
@@ -1869,22 +1973,16 @@ def setup(bot):
         # Добавление в очередь
         rating = get_player_rating(nickname, view.selected_mode)
 
-        queues[view.selected_mode].append(
-            {
-                "discord_id": ctx.author.id,
-                "nickname": nickname,
-                "rating": rating,
-                "channel_id": ctx.channel.id,
-                "join_time": datetime.now(),
-            }
-        )
-        save_queues_to_db()
-
-        db_manager.execute(
-            "players",
-            "UPDATE players SET in_queue = 1 WHERE discordid = ?",
-            (str(ctx.author.id),),
-        )
+        entry = {
+            "discord_id": ctx.author.id,
+            "nickname": nickname,
+            "rating": rating,
+            "channel_id": ctx.channel.id,
+            "join_time": datetime.now(),
+        }
+        queues[view.selected_mode].append(entry)
+        persist_queue_entry(view.selected_mode, entry)
+        notify_queue_changed(view.selected_mode)
 
         await msg.edit(
             content=f"🔍 Поиск игры в режиме {MODE_NAMES[view.selected_mode]}...",
@@ -1896,26 +1994,14 @@ def setup(bot):
         if ctx.channel.name != "elobot-queue":
             return
 
-        player_data = db_manager.execute(
-            "players",
-            "SELECT playername, in_queue FROM players WHERE discordid = ?",
-            (str(ctx.author.id),),
-        ).fetchone()
-
-        if not player_data or player_data[1] == 0:
+        if not is_in_queue(ctx.author.id):
             await ctx.send("❌ Вы не в очереди")
             return
 
         # Удаление из всех очередей
-        for mode, queue in queues.items():
-            queues[mode] = [p for p in queue if p["discord_id"] != ctx.author.id]
-        save_queues_to_db()
-
-        db_manager.execute(
-            "players",
-            "UPDATE players SET in_queue = 0 WHERE discordid = ?",
-            (str(ctx.author.id),),
-        )
+        removed = [queue.discard(ctx.author.id) for queue in queues.values()]
+        delete_queue_entries([player for player in removed if player])
+        notify_queue_changed()
         await ctx.send("✅ Вы вышли из очереди")
 
     @bot.command()
@@ -1946,13 +2032,7 @@ def setup(bot):
                 inline=True,
             )
 
-        # Получаем общее количество игроков в активных матчах
-        total_in_queue = (
-            db_manager.execute(
-                "players", "SELECT COUNT(*) FROM players WHERE in_queue = 1"
-            ).fetchone()[0]
-            or 0
-        )
+        total_in_queue = sum(len(queue) for queue in queues.values())
 
         # Получаем количество игроков в активных матчах
         total_in_matches = (
@@ -1987,6 +2067,49 @@ def setup(bot):
 
         await ctx.send(embed=embed)
 
+    @bot.command()
+    async def mmstats(ctx):
+        """Качество подбора: разница рейтингов и ожидание по режимам (модератор)"""
+        if ctx.author.id != MODERATOR_ID:
+            return await ctx.send("❌ Только модератор может использовать эту команду")
+
+        embed = discord.Embed(
+            title="📈 Статистика матчмейкинга", color=discord.Color.blue()
+        )
+        now = datetime.now()
+        for mode in [MODES["any"]] + STANDARD_MODES:
+            queue = queues[mode]
+            window = rating_windows[mode]
+            # Игроки, у которых уже есть соперник в окне (сам игрок тоже в диапазоне)
+            ready = sum(
+                1
+                for p in queue
+                if queue.count_in_range(
+                    p["rating"] - window.width(p, now),
+                    p["rating"] + window.width(p, now),
+                )
+                > 1
+            )
+            lines = [f"В очереди: `{len(queue)}`, с соперником в окне: `{ready}`"]
+
+            summary = matchmaking_stats.summary(mode)
+            if summary:
+                lines.append(
+                    f"Матчей: `{summary['matches']}`, разница ELO: "
+                    f"средн. `{summary['gap_mean']:.0f}`, макс. `{summary['gap_max']}`"
+                )
+                lines.append(
+                    f"Ожидание: средн. `{summary['wait_mean']:.0f} с`, "
+                    f"макс. `{summary['wait_max']:.0f} с`"
+                )
+                for label, matches, gap_mean in summary["by_wait"]:
+                    lines.append(f"• {label}: {matches} матчей, ELO ±{gap_mean:.0f}")
+            embed.add_field(
+                name=MODE_NAMES[mode], value="\n".join(lines), inline=False
+            )
+
+        await ctx.send(embed=embed)
+
     @bot.command()
     async def result(ctx, match_id: int, scores: str):
         """Отправка результата матча с приложенным скриншотом"""
@@ -2037,17 +2160,13 @@ def setup(bot):
             return
 
         # Проверяем, что игрок участвует в матче
-        player_data = db_manager.fetchone(
-            "players",
-            "SELECT playername FROM players WHERE discordid = ?",
-            (str(ctx.author.id),),
-        )
+        player_data = player_cache.by_discordid(ctx.author.id)
 
         if not player_data:
             await ctx.send("❌ Вы не зарегистрированы в системе.")
             return
 
-        submitter_name = player_data[0]
+        submitter_name = player_data.playername
 
         if submitter_name not in [player1, player2]:
             await ctx.send("❌ Вы не участвуете в этом матче.")
@@ -2177,21 +2296,17 @@ def setup(bot):
         opponent_name = player2 if submitter_name == player1 else player1
 
         # Получаем discord_id оппонента
-        opponent_data = db_manager.fetchone(
-            "players",
-            "SELECT discordid FROM players WHERE playername = ?",
-            (opponent_name,),
-        )
+        opponent_data = player_cache.by_name(opponent_name)
 
         if not opponent_data:
             await ctx.send("❌ Не удалось найти оппонента в системе")
             return
 
-        opponent_id = int(opponent_data[0])
+        opponent_id = int(opponent_data.discordid)
 
         # Отправляем запрос подтверждения оппоненту
         try:
-            opponent_user = await bot.fetch_user(opponent_id)
+            opponent_user = await user_resolver.fetch(opponent_id)
 
             embed = discord.Embed(
                 title="🔔 Требуется подтверждение результата",
@@ -2231,35 +2346,21 @@ def setup(bot):
         ):
             return
 
-        # ПРОВЕРКА ВЕРИФИКАЦИИ ЧЕРЕЗ БАЗУ ДАННЫХ
-        player_data = db_manager.execute(
-            "players",
-            "SELECT playername FROM players WHERE discordid = ?",
-            (str(ctx.author.id),),
-        ).fetchone()
+        # Проверка верификации
+        player_data = player_cache.by_discordid(ctx.author.id)
         if not player_data:
             await ctx.send("❌ Требуется верификация для использования этой команды")
             return
-        # Находим активный матч игрока
-        player_data = db_manager.execute(
-            "players",
-            "SELECT playername FROM players WHERE discordid = ?",
-            (str(ctx.author.id),),
-        ).fetchone()
-
-        if not player_data:
-            await ctx.send("❌ Вы не зарегистрированы в системе")
-            return
 
-        nickname = player_data[0]
+        # Находим активный матч игрока
+        nickname = player_data.playername
 
         match_data = db_manager.execute(
             "matches",
             """
             SELECT matchid, mode, player1, player2, matchtype
             FROM matches 
-            WHERE (player1 = ? OR player2 = ?) 
-            AND isover = 0
+            WHERE ((player1 = ? AND isover = 0) OR (player2 = ? AND isover = 0))
             """,
             (nickname, nickname),
         ).fetchone()
@@ -2292,20 +2393,9 @@ def setup(bot):
             """,
             (player1_score, player2_score, match_id),
         )
+        match_closed(match_id, player1_score, player2_score)
 
-        # Обновляем статистику игроков
-        db_manager.execute(
-            "players",
-            "UPDATE players SET wins = wins + 1 WHERE playername = ?",
-            (winner,),
-        )
-        db_manager.execute(
-            "players",
-            "UPDATE players SET losses = losses + 1 WHERE playername = ?",
-            (loser,),
-        )
-
-        # Обновляем ELO
+        # Считаем новый ELO
         winner_rating = get_player_rating(winner, mode)
         loser_rating = get_player_rating(loser, mode)
 
@@ -2314,9 +2404,24 @@ def setup(bot):
             winner_rating, loser_rating, 1
         )
 
-        update_player_rating(winner, new_winner_rating, mode)
-        update_player_rating(loser, new_loser_rating, mode)
-        # КОНЕЦ ИСПРАВЛЕНИЯ
+        # Обновляем статистику игроков и ELO одной транзакцией
+        with db_manager.transaction("players"):
+            db_manager.execute(
+                "players",
+                "UPDATE players SET wins = wins + 1 WHERE playername = ?",
+                (winner,),
+            )
+            db_manager.execute(
+                "players",
+                "UPDATE players SET losses = losses + 1 WHERE playername = ?",
+                (loser,),
+            )
+            update_player_rating(
+                winner, new_winner_rating, mode, match_id=match_id, reason="giveup"
+            )
+            update_player_rating(
+                loser, new_loser_rating, mode, match_id=match_id, reason="giveup"
+            )
 
         # Отправляем уведомление
         mode_name = MODE_NAMES.get(mode, "Unknown")
@@ -2350,14 +2455,7 @@ def setup(bot):
 
         # +++ ДОБАВЛЯЕМ ОТПРАВКУ В КАНАЛ РЕЗУЛЬТАТОВ +++
         # Ищем канал elobot-results
-        results_channel_found = None
-        for guild in global_bot.guilds:
-            results_channel = discord.utils.get(
-                guild.text_channels, name="elobot-results"
-            )
-            if results_channel:
-                results_channel_found = results_channel
-                break
+        results_channel_found = channel_registry.get("results")
 
         if results_channel_found:
             try:
@@ -2389,10 +2487,10 @@ def setup(bot):
 
         try:
             # Отправляем в ЛС обоим игрокам
-            winner_user = await global_bot.fetch_user(
+            winner_user = await user_resolver.fetch(
                 get_discord_id_by_nickname(winner)
             )
-            loser_user = await global_bot.fetch_user(get_discord_id_by_nickname(loser))
+            loser_user = await user_resolver.fetch(get_discord_id_by_nickname(loser))
 
             await winner_user.send(embed=embed)
             await loser_user.send(embed=embed)
@@ -2423,17 +2521,13 @@ def setup(bot):
         player1, player2 = match_data
 
         # Проверяем, что игрок участвует в матче
-        player_data = db_manager.execute(
-            "players",
-            "SELECT playername FROM players WHERE discordid = ?",
-            (str(ctx.author.id),),
-        ).fetchone()
+        player_data = player_cache.by_discordid(ctx.author.id)
 
         if not player_data:
             await ctx.send("❌ Вы не зарегистрированы в системе")
             return
 
-        reporter_name = player_data[0]
+        reporter_name = player_data.playername
 
         if reporter_name not in [player1, player2]:
             await ctx.send("❌ Вы не участвуете в этом матче.")
@@ -2446,6 +2540,7 @@ def setup(bot):
         db_manager.execute(
             "matches", "UPDATE matches SET isover = 1 WHERE matchid = ?", (match_id,)
         )
+        match_closed(match_id)
 
         # Сохраняем скриншот если есть
         screenshot_url = None
@@ -2463,7 +2558,7 @@ def setup(bot):
 
         # Отправляем модератору
         try:
-            moderator = await global_bot.fetch_user(MODERATOR_ID)
+            moderator = await user_resolver.fetch(MODERATOR_ID)
 
             embed = discord.Embed(
                 title="⚠️ Новый репорт",
@@ -2549,11 +2644,7 @@ class ConfirmMatchView(View):
             presumed_winner = player2
 
         # Проверяем, что результат отправил победитель
-        submitter_data = db_manager.execute(
-            "players",
-            "SELECT playername FROM players WHERE discordid = ?",
-            (str(result_data["submitted_by"]),),
-        ).fetchone()
+        submitter_data = player_cache.by_discordid(result_data["submitted_by"])
 
         if not submitter_data:
             await interaction.response.send_message(
@@ -2561,7 +2652,7 @@ class ConfirmMatchView(View):
             )
             return
 
-        submitter_name = submitter_data[0]
+        submitter_name = submitter_data.playername
 
         if submitter_name != presumed_winner:
             await interaction.response.send_message(
@@ -2585,143 +2676,23 @@ class ConfirmMatchView(View):
         # Рассчитываем новые рейтинги
         new_rating1, new_rating2 = calculate_elo(old_rating1, old_rating2, result)
 
-        # Обновляем рейтинги
-        update_player_rating(player1, new_rating1, mode)
-        update_player_rating(player2, new_rating2, mode)
-
-        # Обновляем статистику
+        # Обновляем рейтинги и статистику (общую и по режиму) одной транзакцией
         if result == 1:
-            db_manager.execute(
-                "players",
-                "UPDATE players SET wins = wins + 1 WHERE playername = ?",
-                (player1,),
-            )
-            db_manager.execute(
-                "players",
-                "UPDATE players SET losses = losses + 1 WHERE playername = ?",
-                (player2,),
-            )
+            stats = [("wins", player1), ("losses", player2)]
         elif result == 0:
-            db_manager.execute(
-                "players",
-                "UPDATE players SET wins = wins + 1 WHERE playername = ?",
-                (player2,),
-            )
-            db_manager.execute(
-                "players",
-                "UPDATE players SET losses = losses + 1 WHERE playername = ?",
-                (player1,),
-            )
+            stats = [("wins", player2), ("losses", player1)]
         else:  # Ничья
-            db_manager.execute(
-                "players",
-                "UPDATE players SET ties = ties + 1 WHERE playername IN (?, ?)",
-                (player1, player2),
+            stats = [("ties", player1), ("ties", player2)]
+
+        with db_manager.transaction("players"):
+            update_player_rating(
+                player1, new_rating1, mode, match_id=self.match_id, reason="result"
+            )
+            update_player_rating(
+                player2, new_rating2, mode, match_id=self.match_id, reason="result"
             )
 
-        # Обновляем счетчики для конкретного режима
-        if mode == MODES["station5f"]:
-            if result == 1:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_station5f = wins_station5f + 1 WHERE playername = ?",
-                    (player1,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_station5f = losses_station5f + 1 WHERE playername = ?",
-                    (player2,),
-                )
-            elif result == 0:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_station5f = wins_station5f + 1 WHERE playername = ?",
-                    (player2,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_station5f = losses_station5f + 1 WHERE playername = ?",
-                    (player1,),
-                )
-            else:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET ties_station5f = ties_station5f + 1 WHERE playername = ?",
-                    (player1,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET ties_station5f = ties_station5f + 1 WHERE playername = ?",
-                    (player2,),
-                )
-        elif mode == MODES["mots"]:
-            if result == 1:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_mots = wins_mots + 1 WHERE playername = ?",
-                    (player1,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_mots = losses_mots + 1 WHERE playername = ?",
-                    (player2,),
-                )
-            elif result == 0:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_mots = wins_mots + 1 WHERE playername = ?",
-                    (player2,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_mots = losses_mots + 1 WHERE playername = ?",
-                    (player1,),
-                )
-            else:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET ties_mots = ties_mots + 1 WHERE playername = ?",
-                    (player1,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET ties_mots = ties_mots + 1 WHERE playername = ?",
-                    (player2,),
-                )
-        elif mode == MODES["12min"]:
-            if result == 1:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_12min = wins_12min + 1 WHERE playername = ?",
-                    (player1,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_12min = losses_12min + 1 WHERE playername = ?",
-                    (player2,),
-                )
-            elif result == 0:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET wins_12min = wins_12min + 1 WHERE playername = ?",
-                    (player2,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET losses_12min = losses_12min + 1 WHERE playername = ?",
-                    (player1,),
-                )
-            else:
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET ties_12min = ties_12min + 1 WHERE playername = ?",
-                    (player1,),
-                )
-                db_manager.execute(
-                    "players",
-                    "UPDATE players SET ties_12min = ties_12min + 1 WHERE playername = ?",
-                    (player2,),
-                )
+            update_match_stats(stats, mode)
 
         # Обновляем запись матча с полученным счетом
         db_manager.execute(
@@ -2729,6 +2700,7 @@ class ConfirmMatchView(View):
             "UPDATE matches SET player1score = ?, player2score = ?, isover = 1, isverified = 1 WHERE matchid = ?",
             (score1, score2, self.match_id),
         )
+        match_closed(self.match_id, score1, score2)
 
         # Удаляем результат из ожидающих
         if self.result_message_id in pending_results:
@@ -2739,26 +2711,22 @@ class ConfirmMatchView(View):
         elo_change2 = new_rating2 - old_rating2
 
         # Отправляем отчёт в канал результатов
-        for guild in self.bot.guilds:
-            results_channel = discord.utils.get(
-                guild.text_channels, name="elobot-results"
+        results_channel = channel_registry.get("results")
+        if results_channel:
+            result_embed = discord.Embed(
+                title=f"✅ Матч завершен | ID: {self.match_id}",
+                description=(
+                    f"**Режим:** {mode_name}\n"
+                    f"**Карта:** {map_name if map_name else 'не выбрана'}\n"
+                    f"**Игроки:** {player1} vs {player2}\n"
+                    f"**Счёт:** {score1} - {score2}\n\n"
+                    f"**Изменения ELO ({mode_name}):**\n"
+                    f"{player1}: {old_rating1} → **{new_rating1}** ({'+' if elo_change1 >= 0 else ''}{elo_change1})\n"
+                    f"{player2}: {old_rating2} → **{new_rating2}** ({'+' if elo_change2 >= 0 else ''}{elo_change2})"
+                ),
+                color=discord.Color.green(),
             )
-            if results_channel:
-                result_embed = discord.Embed(
-                    title=f"✅ Матч завершен | ID: {self.match_id}",
-                    description=(
-                        f"**Режим:** {mode_name}\n"
-                        f"**Карта:** {map_name if map_name else 'не выбрана'}\n"
-                        f"**Игроки:** {player1} vs {player2}\n"
-                        f"**Счёт:** {score1} - {score2}\n\n"
-                        f"**Изменения ELO ({mode_name}):**\n"
-                        f"{player1}: {old_rating1} → **{new_rating1}** ({'+' if elo_change1 >= 0 else ''}{elo_change1})\n"
-                        f"{player2}: {old_rating2} → **{new_rating2}** ({'+' if elo_change2 >= 0 else ''}{elo_change2})"
-                    ),
-                    color=discord.Color.green(),
-                )
-                await results_channel.send(embed=result_embed)
-                break
+            await results_channel.send(embed=result_embed)
 
         # Уведомляем игроков
         try:
@@ -2766,13 +2734,13 @@ class ConfirmMatchView(View):
             player2_id = get_discord_id_by_nickname(player2)
 
             if player1_id:
-                user1 = await global_bot.fetch_user(player1_id)
+                user1 = await user_resolver.fetch(player1_id)
                 await user1.send(
                     f"✅ Результат вашего матча #{self.match_id} подтвержден!"
                 )
 
             if player2_id:
-                user2 = await global_bot.fetch_user(player2_id)
+                user2 = await user_resolver.fetch(player2_id)
                 await user2.send(
                     f"✅ Результат вашего матча #{self.match_id} подтвержден!"
                 )
@@ -2796,7 +2764,7 @@ class ConfirmMatchView(View):
 
         # Уведомляем отправителя
         try:
-            user = await global_bot.fetch_user(result_data["submitted_by"])
+            user = await user_resolver.fetch(result_data["submitted_by"])
             await user.send(
                 f"❌ Ваш результат для матча {self.match_id} был отклонен модератором."
             )
@@ -2817,7 +2785,7 @@ class ConfirmMatchView(View):
         # Логирование отклонения
         guild = interaction.guild
         if guild:
-            logs_channel = discord.utils.get(guild.text_channels, name="elobot-logs")
+            logs_channel = channel_registry.get("logs", guild)
             if logs_channel:
                 await logs_channel.send(
                     f"❌ Результат матча {self.match_id} отклонен модератором"
@@ -1,6 +1,11 @@
+import asyncio
+import time
 import discord
 from discord.ext import commands
 from db_manager import db_manager
+from player_cache import player_cache
+from dispatcher import TokenBucket
+from startup import startup
 import logging
 
 # Конфигурация ролей для серверов
@@ -49,6 +54,94 @@ async def assign_role(member):
         logger.error(f"Ошибка при выдаче роли: {e}")
 
 
+def role_delta(member_ids, role_holder_ids, verified_ids):
+    """(кому выдать, у кого снять) роль: ID участников сервера"""
+    should_have = member_ids & verified_ids
+    return should_have - role_holder_ids, role_holder_ids - should_have
+
+
+async def apply_role_delta(guild, role, to_add, to_remove, concurrency=4, bucket=None):
+    """Выдает и снимает роль параллельно, не больше concurrency запросов сразу.
+
+    bucket (TokenBucket) ограничивает частоту запросов; 429 от Discord
+    дополнительно обрабатывает сама библиотека. Возвращает число ошибок.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def change(member_id, add):
+        nonlocal errors
+        member = guild.get_member(member_id)
+        if member is None:
+            return
+        async with semaphore:
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                if add:
+                    await member.add_roles(role, reason="Верифицированный игрок")
+                else:
+                    await member.remove_roles(role, reason="Игрок не найден в базе")
+            except discord.Forbidden:
+                errors += 1
+                logger.error(
+                    f"Нет прав для изменения роли пользователю {member.display_name}"
+                )
+            except discord.HTTPException as e:
+                errors += 1
+                logger.error(f"Ошибка HTTP: {e}")
+
+    await asyncio.gather(
+        *(change(member_id, True) for member_id in to_add),
+        *(change(member_id, False) for member_id in to_remove),
+    )
+    return errors
+
+
+async def reconcile_roles(bot, concurrency=4, rate=(10, 10.0)):
+    """Приводит роль из ROLE_MAPPING в соответствие со списком игроков.
+
+    На каждом сервере разница считается множествами (участники, владельцы
+    роли, верифицированные discordid), затем применяется только она.
+    Возвращает {guild_id: (выдано, снято, ошибок, секунд)}.
+    """
+    logger.info("Проверка ролей для всех серверов")
+    verified_ids = {
+        int(row[0]) for row in db_manager.fetchall("players", "SELECT discordid FROM players")
+    }
+    bucket = TokenBucket(*rate)
+    report = {}
+
+    for guild in bot.guilds:
+        # Пропускаем серверы без конфигурации
+        if guild.id not in ROLE_MAPPING:
+            continue
+
+        role_id = ROLE_MAPPING[guild.id]
+        role = guild.get_role(role_id)
+        if not role:
+            logger.warning(f"Роль {role_id} не найдена на сервере {guild.name}")
+            continue
+
+        start = time.perf_counter()
+        member_ids = {member.id for member in guild.members if not member.bot}
+        to_add, to_remove = role_delta(
+            member_ids,
+            {member.id for member in role.members if not member.bot},
+            verified_ids,
+        )
+        errors = await apply_role_delta(
+            guild, role, to_add, to_remove, concurrency, bucket
+        )
+        elapsed = time.perf_counter() - start
+        report[guild.id] = (len(to_add), len(to_remove), errors, elapsed)
+        logger.info(
+            f"Роли на сервере {guild.name}: выдано {len(to_add)}, снято {len(to_remove)}, "
+            f"ошибок {errors}, участников {len(member_ids)}, {elapsed:.2f} с"
+        )
+    return report
+
+
 def setup_role_manager(bot):
     """Инициализирует систему управления ролями"""
 
@@ -56,57 +149,14 @@ def setup_role_manager(bot):
     async def on_member_join(member):
         """Выдает роль при присоединении к серверу"""
         # Проверяем, есть ли пользователь в системе
-        result = db_manager.execute(
-            "players", "SELECT 1 FROM players WHERE discordid = ?", (str(member.id),)
-        ).fetchone()
-
-        if result:
+        if player_cache.by_discordid(member.id):
             await assign_role(member)
 
-    @bot.event
-    async def on_ready():
+    async def reconcile_on_startup():
         """Выдает роли всем верифицированным пользователям при запуске"""
-        logger.info("Проверка ролей для всех серверов")
-
-        # Получаем всех верифицированных игроков
-        verified_users = [
-            row[0]
-            for row in db_manager.execute(
-                "players", "SELECT discordid FROM players"
-            ).fetchall()
-        ]
-
-        # Обходим все серверы
-        for guild in bot.guilds:
-            # Пропускаем серверы без конфигурации
-            if guild.id not in ROLE_MAPPING:
-                continue
-
-            # Получаем роль для сервера
-            role_id = ROLE_MAPPING[guild.id]
-            role = guild.get_role(role_id)
-
-            if not role:
-                logger.warning(f"Роль {role_id} не найдена на сервере {guild.name}")
-                continue
-
-            # Обходим всех участников сервера
-            for member in guild.members:
-                # Проверяем, верифицирован ли пользователь
-                if str(member.id) in verified_users:
-                    try:
-                        # Проверяем наличие роли
-                        if role not in member.roles:
-                            await member.add_roles(role)
-                            logger.info(
-                                f"Выдана роль {role.name} пользователю {member.display_name} на сервере {guild.name}"
-                            )
-                    except discord.Forbidden:
-                        logger.error(
-                            f"Нет прав для выдачи роли пользователю {member.display_name}"
-                        )
-                    except discord.HTTPException as e:
-                        logger.error(f"Ошибка HTTP: {e}")
+        await reconcile_roles(bot)
+
+    startup.add("roles", reconcile_on_startup, members=True)
 
     @bot.event
     async def on_verification_complete(user, guild):
@@ -0,0 +1,99 @@
+"""Планировщик дедлайнов на min-heap (без зависимостей от discord)."""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("scheduler")
+
+
+class DeadlineScheduler:
+    """Вызывает callback(keys), когда наступают дедлайны ключей.
+
+    Дедлайны (datetime) лежат в min-heap, задача run() спит ровно до
+    ближайшего из них. Все ключи, чьи дедлайны наступили (с допуском
+    batch_window секунд), передаются в callback одним списком.
+    Повторный schedule() переносит дедлайн, cancel() снимает его; старые
+    записи кучи не удаляются, а пропускаются при извлечении.
+    """
+
+    def __init__(self, callback, batch_window=0.0, name="scheduler"):
+        self._callback = callback
+        self._batch_window = timedelta(seconds=batch_window)
+        self._name = name
+        self._heap = []  # (deadline, seq, key)
+        self._deadlines = {}  # key -> актуальный дедлайн
+        self._seq = itertools.count()
+        # Создается внутри run(), когда event loop уже запущен
+        self._wakeup = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def deadline(self, key):
+        return self._deadlines.get(key)
+
+    def schedule(self, key, deadline):
+        """Назначает (или переносит) дедлайн ключа"""
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), key))
+        # Будим run() только если дедлайн стал ближайшим
+        if self._wakeup is not None and self._heap[0][2] == key:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        """Снимает дедлайн ключа, возвращает True, если он был"""
+        return self._deadlines.pop(key, None) is not None
+
+    def next_deadline(self):
+        """Ближайший актуальный дедлайн или None"""
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Снимает и возвращает ключи с дедлайном не позже now + batch_window"""
+        limit = now + self._batch_window
+        due = []
+        while self._heap and self._heap[0][0] <= limit:
+            deadline, _, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                due.append(key)
+        return due
+
+    def _drop_stale(self):
+        while self._heap:
+            deadline, _, key = self._heap[0]
+            if self._deadlines.get(key) == deadline:
+                return
+            heapq.heappop(self._heap)
+
+    async def run(self):
+        """Бесконечный цикл: ждет ближайший дедлайн и отдает пачку в callback"""
+        self._wakeup = asyncio.Event()
+        logger.info(f"{self._name}: запущен, дедлайнов: {len(self)}")
+        while True:
+            deadline = self.next_deadline()
+            timeout = (
+                None
+                if deadline is None
+                else max(0.0, (deadline - datetime.now()).total_seconds())
+            )
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            due = self.pop_due(datetime.now())
+            if not due:
+                continue
+            try:
+                await self._callback(due)
+            except Exception as e:
+                logger.error(f"{self._name}: ошибка обработки {len(due)} дедлайнов: {e}")
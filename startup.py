@@ -0,0 +1,113 @@
+"""Задачи старта бота: запуск по очереди и подгрузка нужных участников."""
+
+import asyncio
+import logging
+import time
+
+from db_manager import db_manager
+
+logger = logging.getLogger("startup")
+
+# Не больше 100 user_ids в одном запросе участников (query_members)
+QUERY_BATCH = 100
+# Серверы до стольких участников подгружаются целиком одним guild.chunk()
+SMALL_GUILD = 1000
+
+
+class StartupOrchestrator:
+    """Задачи, которым нужен подключенный бот.
+
+    Модули регистрируют задачи через add(); после первого on_ready они
+    выполняются по одной в порядке регистрации с паузой stagger, чтобы не
+    конкурировать за лимиты Discord. Бот запускается без загрузки всех
+    участников (chunk_guilds_at_startup=False): перед первой задачей с
+    members=True на каждом сервере подгружаются только игроки из players -
+    маленькие серверы через guild.chunk(), большие через query_members
+    пачками по QUERY_BATCH ID. Когда все задачи выполнены, ставится ready.
+    """
+
+    def __init__(self, stagger=1.0):
+        self.stagger = stagger
+        self._jobs = []  # (имя, async-функция без аргументов, нужны ли участники)
+        self._bot = None
+        self._task = None
+        self._loaded_guilds = set()  # серверы, где игроки уже подгружены
+        # Создается в attach(), когда event loop уже запущен
+        self.ready = None
+        self.timings = {}  # имя задачи -> секунд
+
+    def add(self, name, job, members=False):
+        self._jobs.append((name, job, members))
+
+    def attach(self, bot):
+        self._bot = bot
+        self.ready = asyncio.Event()
+        bot.add_listener(self.on_ready, "on_ready")
+        bot.add_listener(self.on_guild_join, "on_guild_join")
+
+    async def on_ready(self):
+        # on_ready повторяется после переподключений - задачи запускаем один раз
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def on_guild_join(self, guild):
+        if self._loaded_guilds:
+            await self.load_members(guild, self._player_ids())
+
+    async def run(self):
+        start = time.perf_counter()
+        for i, (name, job, members) in enumerate(self._jobs):
+            if i and self.stagger:
+                await asyncio.sleep(self.stagger)
+            job_start = time.perf_counter()
+            try:
+                if members:
+                    await self.load_all_members()
+                await job()
+            except Exception as e:
+                logger.error(f"Startup job {name} failed: {e}")
+            self.timings[name] = time.perf_counter() - job_start
+            logger.info(f"Startup job {name}: {self.timings[name]:.2f} s")
+        self.ready.set()
+        print(
+            f"[INIT] Бот готов: {len(self._jobs)} задач старта за "
+            f"{time.perf_counter() - start:.1f} с"
+        )
+
+    async def wait_until_ready(self):
+        await self.ready.wait()
+
+    def _player_ids(self):
+        rows = db_manager.fetchall("players", "SELECT discordid FROM players")
+        return [int(row[0]) for row in rows]
+
+    async def load_all_members(self):
+        """Подгружает игроков на всех серверах (один раз на сервер)"""
+        guilds = [g for g in self._bot.guilds if g.id not in self._loaded_guilds]
+        if not guilds:
+            return
+        player_ids = self._player_ids()
+        for guild in guilds:
+            await self.load_members(guild, player_ids)
+
+    async def load_members(self, guild, player_ids):
+        """Кладет в кеш участников сервера тех, кто есть в player_ids"""
+        start = time.perf_counter()
+        if guild.chunked:
+            pass  # Участники уже загружены целиком
+        elif (guild.member_count or 0) <= SMALL_GUILD:
+            await guild.chunk()
+        else:
+            missing = [i for i in player_ids if guild.get_member(i) is None]
+            for k in range(0, len(missing), QUERY_BATCH):
+                await guild.query_members(
+                    user_ids=missing[k : k + QUERY_BATCH], cache=True
+                )
+        self._loaded_guilds.add(guild.id)
+        logger.info(
+            f"Members loaded for {guild.name}: {len(guild.members)} cached "
+            f"of {guild.member_count} in {time.perf_counter() - start:.2f} s"
+        )
+
+
+startup = StartupOrchestrator()
@@ -1,18 +1,35 @@
 import discord
-import json
 import random
 from discord.ext import commands
 from datetime import datetime
 from db_manager import db_manager
+from player_cache import player_cache
+from dispatcher import dispatcher
+from user_cache import user_resolver
+from channel_registry import channel_registry
 from queueing import create_match
 from config import MODES
 import asyncio
 
 
+BRACKET_SLOT_INSERT = """
+    INSERT INTO bracket_slots (tournament_id, round, position, user_id, name, mention, bye)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+BRACKET_MATCH_INSERT = """
+    INSERT INTO bracket_matches
+    (match_id, tournament_id, round, player1_position, player2_position,
+     winner_position, is_finished)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
 class Tour:
-    def __init__(self, bot, tournament_name, participants, slots, cog):
+    def __init__(self, bot, tournament_name, participants, slots, cog, tournament_id=None):
         self.bot = bot
         self.name = tournament_name
+        self.tournament_id = tournament_id
         # Участники теперь просто список ников
         self.participants = participants
         self.slots = slots
@@ -21,57 +38,150 @@ class Tour:
         self.winners = []
         self.is_finished = False
         self.cog = cog
+        # Что еще не записано в bracket_*: тур целиком или отдельные матчи
+        self._round_dirty = False
+        self._dirty_matches = set()
 
-    async def save_state(self):
-        """Сохраняет текущее состояние турнира в БД"""
-        tour_data = {
-            "current_round": self.current_round,
-            "participants": json.dumps(self.participants),
-            "winners": json.dumps(self.winners),
-            "matches": json.dumps(
-                [
-                    {
-                        "id": m["id"],
-                        "player1": m["player1"],
-                        "player2": m["player2"],
-                        "winner": m["winner"],
-                        "is_finished": m["is_finished"],
-                    }
-                    for m in self.matches
-                ]
-            ),
-        }
-
-        # Получаем ID турнира если еще не знаем
+    def _get_tournament_id(self):
+        """ID турнира (ищется по названию, если не передан)"""
         if not self.tournament_id:
             tour = db_manager.fetchone(
                 "tournaments", "SELECT id FROM tournaments WHERE name = ?", (self.name,)
             )
             if tour:
                 self.tournament_id = tour[0]
+        return self.tournament_id
+
+    def _advance(self, player):
+        """Добавляет игрока в победители тура (один раз)"""
+        if player not in self.winners:
+            self.winners.append(player)
+
+    def _position(self, player):
+        return None if player is None else self.participants.index(player)
+
+    def _match_row(self, tournament_id, match):
+        return (
+            match["id"],
+            tournament_id,
+            self.current_round,
+            self._position(match["player1"]),
+            self._position(match["player2"]),
+            self._position(match["winner"]),
+            int(match["is_finished"]),
+        )
 
-        if self.tournament_id:
-            # Удаляем старую запись если есть
-            db_manager.execute(
-                "tournaments",
-                "DELETE FROM active_tours WHERE tournament_id = ?",
-                (self.tournament_id,),
-            )
+    async def save_state(self):
+        """Записывает изменения сетки турнира.
 
-            # Вставляем новую
-            db_manager.execute(
-                "tournaments",
-                """INSERT INTO active_tours 
-                (tournament_id, current_round, participants, winners, matches)
-                VALUES (?, ?, ?, ?, ?)""",
-                (
-                    self.tournament_id,
-                    tour_data["current_round"],
-                    tour_data["participants"],
-                    tour_data["winners"],
-                    tour_data["matches"],
-                ),
-            )
+        Новый тур записывается целиком (участники и матчи), дальше - только
+        изменившиеся матчи, по строке на матч. Без изменений в базу не пишет.
+        """
+        if not (self._round_dirty or self._dirty_matches):
+            return
+        tournament_id = self._get_tournament_id()
+        if not tournament_id:
+            return
+
+        with db_manager.transaction("tournaments"):
+            if self._round_dirty:
+                match_winners = [m["winner"] for m in self.matches if m["winner"]]
+                for table in ("bracket_slots", "bracket_matches"):
+                    db_manager.execute(
+                        "tournaments",
+                        f"DELETE FROM {table} WHERE tournament_id = ? AND round = ?",
+                        (tournament_id, self.current_round),
+                    )
+                db_manager.executemany(
+                    "tournaments",
+                    BRACKET_SLOT_INSERT,
+                    [
+                        (
+                            tournament_id,
+                            self.current_round,
+                            position,
+                            p["id"],
+                            p["name"],
+                            p.get("mention"),
+                            int(p in self.winners and p not in match_winners),
+                        )
+                        for position, p in enumerate(self.participants)
+                    ],
+                )
+                db_manager.executemany(
+                    "tournaments",
+                    BRACKET_MATCH_INSERT,
+                    [self._match_row(tournament_id, m) for m in self.matches],
+                )
+                db_manager.execute(
+                    "tournaments",
+                    "UPDATE tournaments SET current_round = ? WHERE id = ?",
+                    (self.current_round, tournament_id),
+                )
+            else:
+                db_manager.executemany(
+                    "tournaments",
+                    """
+                    UPDATE bracket_matches SET winner_position = ?, is_finished = ?
+                    WHERE match_id = ?
+                    """,
+                    [
+                        (self._position(m["winner"]), int(m["is_finished"]), m["id"])
+                        for m in self.matches
+                        if m["id"] in self._dirty_matches
+                    ],
+                )
+        self._round_dirty = False
+        self._dirty_matches.clear()
+
+    def load_state(self, current_round):
+        """Восстанавливает тур из bracket_*; False - сетки этого тура нет"""
+        tournament_id = self._get_tournament_id()
+        slots = db_manager.fetchall(
+            "tournaments",
+            """
+            SELECT user_id, name, mention, bye FROM bracket_slots
+            WHERE tournament_id = ? AND round = ?
+            ORDER BY position
+            """,
+            (tournament_id, current_round),
+        )
+        if not slots:
+            return False
+        matches = db_manager.fetchall(
+            "tournaments",
+            """
+            SELECT match_id, player1_position, player2_position, winner_position, is_finished
+            FROM bracket_matches
+            WHERE tournament_id = ? AND round = ?
+            ORDER BY match_id
+            """,
+            (tournament_id, current_round),
+        )
+
+        self.current_round = current_round
+        self.participants = [
+            {"id": user_id, "name": name, "mention": mention}
+            for user_id, name, mention, _ in slots
+        ]
+        self.matches = [
+            {
+                "id": match_id,
+                "player1": self.participants[player1],
+                "player2": self.participants[player2],
+                "winner": None if winner is None else self.participants[winner],
+                "is_finished": bool(is_finished),
+            }
+            for match_id, player1, player2, winner, is_finished in matches
+        ]
+        self.winners = []
+        for participant, slot in zip(self.participants, slots):
+            if slot[3]:
+                self._advance(participant)
+        for match in self.matches:
+            if match["winner"]:
+                self._advance(match["winner"])
+        return True
 
     async def start_round(self):
         """Начинает новый тур турнира"""
@@ -129,13 +239,15 @@ class Tour:
                 continue
 
             match_id = await self.create_tournament_match(player1, player2)
+            # Матч с пустым слотом завершается сразу (см. create_tournament_match)
+            bye = player1["id"] == 0 or player2["id"] == 0
             self.matches.append(
                 {
                     "id": match_id,
                     "player1": player1,
                     "player2": player2,
-                    "winner": None,
-                    "is_finished": False,
+                    "winner": (player2 if player1["id"] == 0 else player1) if bye else None,
+                    "is_finished": bye,
                 }
             )
 
@@ -144,22 +256,27 @@ class Tour:
             remaining = [p for p in self.participants if p["id"] not in used_ids]
             if remaining:
                 lucky_player = remaining[0]
-                self.winners.append(lucky_player)
+                self._advance(lucky_player)
 
                 # Уведомление о автоматическом прохождении
                 if lucky_player["id"] != 0:  # Если это не пустой слот
-                    try:
-                        user = await self.bot.fetch_user(lucky_player["id"])
-                        await user.send(
-                            f"🎉 В турнире {self.name} (тур {self.current_round}) "
-                            f"у вас не оказалось соперника, поэтому вы автоматически проходите в следующий тур!"
-                        )
-                    except Exception as e:
-                        print(f"Не удалось уведомить игрока: {e}")
+                    dispatcher.send_user(
+                        lucky_player["id"],
+                        f"🎉 В турнире {self.name} (тур {self.current_round}) "
+                        f"у вас не оказалось соперника, поэтому вы автоматически проходите в следующий тур!",
+                    )
+
+        # Новый тур записывается целиком
+        self._round_dirty = True
+        await self.save_state()
 
         # Отправляем информацию в канал
         await self.send_round_info()
-        await self.save.state()
+
+        # Тур из одних матчей с пустым слотом уже сыгран: событий
+        # match_finished по нему не будет, поэтому переходим дальше сразу
+        if self.winners and all(m["is_finished"] for m in self.matches):
+            await self._complete_round()
 
     async def create_tournament_match(self, player1, player2):
         """Создает турнирный матч и уведомляет реальных игроков"""
@@ -168,11 +285,7 @@ class Tour:
             "discord_id": player1["id"],
             "nickname": player1["name"],
             "rating": (
-                db_manager.fetchone(
-                    "players",
-                    "SELECT currentelo FROM players WHERE discordid = ?",
-                    (str(player1["id"]),),
-                )[0]
+                player_cache.by_discordid(player1["id"]).currentelo
                 if player1["id"] != 0
                 else 0
             ),
@@ -184,11 +297,7 @@ class Tour:
             "discord_id": player2["id"],
             "nickname": player2["name"],
             "rating": (
-                db_manager.fetchone(
-                    "players",
-                    "SELECT currentelo FROM players WHERE discordid = ?",
-                    (str(player2["id"]),),
-                )[0]
+                player_cache.by_discordid(player2["id"]).currentelo
                 if player2["id"] != 0
                 else 0
             ),
@@ -197,6 +306,7 @@ class Tour:
         }
 
         # Создаем обычный турнирный матч
+        tournament_id = self._get_tournament_id()
         cursor = db_manager.execute(
             "matches",
             """INSERT INTO matches 
@@ -208,7 +318,7 @@ class Tour:
                 player2["name"],
                 datetime.now(),
                 2,  # matchtype = 2 для турнирных матчей
-                self.name,  # Используем название турнира как ID
+                tournament_id,
             ),
         )
         match_id = cursor.lastrowid
@@ -232,32 +342,20 @@ class Tour:
             )
 
             # Добавляем победителя
-            self.winners.append(winner)
+            self._advance(winner)
             return match_id
 
-        # Отправляем уведомления только реальным игрокам
-        if player1["id"] != 0:
-            try:
-                user = await self.bot.fetch_user(player1["id"])
-                await self.send_match_notification(match_id, player1, player2, user)
-            except Exception as e:
-                print(f"Не удалось отправить уведомление игроку {player1['name']}: {e}")
-
-        if player2["id"] != 0:
-            try:
-                user = await self.bot.fetch_user(player2["id"])
-                await self.send_match_notification(match_id, player2, player1, user)
-            except Exception as e:
-                print(f"Не удалось отправить уведомление игроку {player2['name']}: {e}")
+        # Отправляем уведомления только реальным игрокам (через очередь
+        # отправки - старт тура не ждет десятков ЛС)
+        self.send_match_notification(match_id, player1, player2)
+        self.send_match_notification(match_id, player2, player1)
 
         return match_id
 
     async def send_round_info(self):
-        channel = discord.utils.get(
-            self.bot.get_all_channels(), name=f"{self.name}-matches"
-        )
+        channel = channel_registry.by_name(f"{self.name}✨﹒matches")
         if not channel:
-            print(f"⚠ Канал {self.name}-matches не найден")
+            print(f"⚠ Канал {self.name}✨﹒matches не найден")
             return
 
         # Получаем только актуальные матчи текущего тура
@@ -270,7 +368,7 @@ class Tour:
             ORDER BY matchid""".format(
                 ",".join("?" for _ in self.matches)
             ),
-            (self.name, *(m["id"] for m in self.matches)),
+            (self._get_tournament_id(), *(m["id"] for m in self.matches)),
         )
 
         embed = discord.Embed(
@@ -308,31 +406,54 @@ class Tour:
         embed.set_footer(text=f"Всего матчей: {len(matches)}")
         await channel.send(embed=embed)
 
-    async def check_round_completion(self):
-        """Проверяет завершение всех матчей тура"""
-        # Сначала обновляем информацию о завершенных матчах
-        for match in self.matches:
-            if not match["is_finished"]:
-                match_data = db_manager.fetchone(
-                    "matches",
-                    "SELECT isover, player1score, player2score FROM matches WHERE matchid = ?",
-                    (match["id"],),
-                )
+    def _apply_result(self, match_id, player1_score, player2_score):
+        """Отмечает матч тура завершенным; False - матча нет или он уже учтен"""
+        match = next((m for m in self.matches if m["id"] == match_id), None)
+        if not match or match["is_finished"]:
+            return False
+        match["is_finished"] = True
+
+        # Определяем победителя
+        if player1_score > player2_score:
+            winner = match["player1"]
+        else:
+            winner = match["player2"]
+
+        match["winner"] = winner
+        self._advance(winner)  # Добавляем победителя в следующий тур
+        self._dirty_matches.add(match_id)
+        return True
+
+    async def record_match_result(self, match_id, player1_score, player2_score):
+        """Учитывает результат матча сразу после записи в matches.
+
+        Возвращает False, если матч не из текущего тура (или уже учтен).
+        """
+        if not self._apply_result(match_id, player1_score, player2_score):
+            return False
+        await self._complete_round()
+        return True
 
-                if match_data and match_data[0] == 1:  # Если матч завершен
-                    match["is_finished"] = True
-                    isover, p1_score, p2_score = match_data
+    async def check_round_completion(self):
+        """Проверяет завершение всех матчей тура (одним запросом к matches)"""
+        pending = [m["id"] for m in self.matches if not m["is_finished"]]
+        if pending:
+            finished = db_manager.fetchall(
+                "matches",
+                f"""
+                SELECT matchid, player1score, player2score FROM matches
+                WHERE isover = 1 AND matchid IN ({', '.join('?' * len(pending))})
+                """,
+                pending,
+            )
+            for match_id, p1_score, p2_score in finished:
+                self._apply_result(match_id, p1_score, p2_score)
 
-                    # Определяем победителя
-                    if p1_score > p2_score:
-                        winner = match["player1"]
-                    else:
-                        winner = match["player2"]
+        await self._complete_round()
 
-                    match["winner"] = winner
-                    self.winners.append(
-                        winner
-                    )  # Добавляем победителя в следующий тур
+    async def _complete_round(self):
+        # Результаты тура записываются до перехода к следующему
+        await self.save_state()
 
         # Если все матчи завершены или их нет (принудительный переход)
         if all(m["is_finished"] for m in self.matches) or not self.matches:
@@ -345,19 +466,17 @@ class Tour:
                 self.matches = []  # Очищаем текущие матчи
                 await self.start_round()
 
-        await self.save_state()
-
     async def finish_tournament(self):
         """Завершает турнир и объявляет победителя"""
         self.is_finished = True
         winner = self.winners[0]
 
-        # Удаляем запись об активном турнире
-        if self.tournament_id:
+        # Турнир больше не активный; сетка остается в bracket_* как история
+        if self._get_tournament_id():
             db_manager.execute(
                 "tournaments",
-                "DELETE FROM active_tours WHERE tournament_id = ?",
-                (self.tournament_id,)
+                "UPDATE tournaments SET isover = 1 WHERE id = ?",
+                (self.tournament_id,),
             )
 
         # Создаем embed для объявления победителя
@@ -368,9 +487,7 @@ class Tour:
         )
 
         # Отправляем в канал результатов
-        results_channel = discord.utils.get(
-            self.bot.get_all_channels(), name=f"{self.name}-results"
-        )
+        results_channel = channel_registry.by_name(f"{self.name}✨﹒results")
 
         if results_channel:
             await results_channel.send(embed=embed)
@@ -378,7 +495,7 @@ class Tour:
         # Отправляем личное сообщение победителю
         if winner["id"] != 0:  # Если это не пустой слот
             try:
-                user = await self.bot.fetch_user(winner["id"])
+                user = await user_resolver.fetch(winner["id"])
                 winner_embed = discord.Embed(
                     title=f"🏆 Победа в турнире {self.name}!",
                     description="Поздравляем с победой!",
@@ -424,15 +541,12 @@ class Tour:
             (winner_score, loser_score, match_id),
         )
 
-        # Обновляем информацию о матче
-        match["winner"] = winner
-        match["is_finished"] = True
-        self.winners.append(winner)
-
-        return True
+        return await self.record_match_result(match_id, winner_score, loser_score)
 
-    async def send_match_notification(self, match_id, player, opponent, user):
-        """Отправляет уведомление о матче конкретному игроку"""
+    def send_match_notification(self, match_id, player, opponent):
+        """Ставит в очередь уведомление о матче конкретному игроку"""
+        if player["id"] == 0:
+            return
         embed = discord.Embed(
             title=f"🎮 Турнирный матч | Тур {self.current_round}",
             description=f"Турнир: **{self.name}**\nMatch ID: `{match_id}`",
@@ -446,4 +560,4 @@ class Tour:
             inline=False,
         )
 
-        await user.send(embed=embed)
+        dispatcher.send_user(player["id"], embed=embed)
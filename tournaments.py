@@ -3,10 +3,15 @@ from discord.ext import commands
 from discord.utils import get
 import asyncio
 from db_manager import db_manager
+from player_cache import player_cache
+from leaderboard import leaderboard
+from channel_registry import channel_registry
+from startup import startup
 from config import MODERATOR_ID, MODES, MODE_NAMES
 from queueing import create_match
 from datetime import datetime
 from tour import Tour
+from events import events, MATCH_FINISHED
 
 
 class Tournaments(commands.Cog):
@@ -15,54 +20,71 @@ class Tournaments(commands.Cog):
         self.tournaments = {}
         self.active_tours = {}
         self.load_tournaments()
+        # Каналы турниров не требуют участников серверов
+        startup.add("tournaments", self.start_tournaments)
+        # Туры продвигаются по событиям завершения матчей, без опроса базы
+        events.subscribe(MATCH_FINISHED, self.on_match_finished)
+
+    def cog_unload(self):
+        events.unsubscribe(MATCH_FINISHED, self.on_match_finished)
+
+    def find_tour(self, match_id):
+        """Активный тур, в текущем туре которого есть матч match_id"""
+        return next(
+            (
+                tour
+                for tour in self.active_tours.values()
+                if any(m["id"] == match_id for m in tour.matches)
+            ),
+            None,
+        )
+
+    async def on_match_finished(self, match_id, player1_score, player2_score):
+        """Передает результат матча его туру (тур завершается сразу)"""
+        if player1_score is None or player2_score is None:
+            return  # Матч закрыт без результата
+        tour = self.find_tour(match_id)
+        if tour:
+            await tour.record_match_result(match_id, player1_score, player2_score)
 
     async def load_active_tours(self):
-        """Загружает активные турниры из базы данных"""
+        """Загружает активные турниры из сетки в базе данных"""
         active_tours = db_manager.fetchall(
             "tournaments",
-            """SELECT t.name, t.slots, a.current_round, a.participants, a.winners, a.matches
-            FROM tournaments t
-            JOIN active_tours a ON t.id = a.tournament_id
-            WHERE t.started = 1""",
+            """SELECT id, name, slots, current_round FROM tournaments
+            WHERE started = 1 AND isover = 0""",
         )
 
-        for name, slots, current_round, participants, winners, matches in active_tours:
-            import json
-
+        for tournament_id, name, slots, current_round in active_tours:
             tour = Tour(
                 bot=self.bot,
                 tournament_name=name,
-                participants=json.loads(participants),
+                participants=[],
                 slots=slots,
                 cog=self,
+                tournament_id=tournament_id,
+            )
+            if not tour.load_state(current_round):
+                continue
+            # Матчи, созданные до перехода на числовой ID, хранят название турнира
+            db_manager.execute(
+                "matches",
+                "UPDATE matches SET tournament_id = ? WHERE tournament_id = ?",
+                (tournament_id, name),
             )
-
-            # Вручную устанавливаем состояние
-            tour.current_round = current_round
-            tour.winners = json.loads(winners)
-            tour.matches = []
-            for m in json.loads(matches):
-                tour.matches.append(
-                    {
-                        "id": m["id"],
-                        "player1": m["player1"],
-                        "player2": m["player2"],
-                        "winner": m["winner"],
-                        "is_finished": m["is_finished"],
-                    }
-                )
 
             self.active_tours[name] = tour
             print(f"Восстановлен активный турнир: {name} (тур {current_round})")
 
-    @commands.Cog.listener()
-    async def on_ready(self):
-        """При запуске бота загружаем активные турниры"""
+    async def start_tournaments(self):
+        """При запуске бота синхронизируем каналы и загружаем активные турниры"""
         for guild in self.bot.guilds:
             await self.sync_tournament_channels(guild)
 
         await self.load_active_tours()  # Восстанавливаем активные турниры
-        self.bot.loop.create_task(self.periodic_tournament_check())
+        # Матчи, завершенные, пока бот был выключен, событий не дали
+        for tour in list(self.active_tours.values()):
+            await tour.check_round_completion()
 
     def load_tournaments(self):
         """Загружает турниры из базы данных при старте"""
@@ -122,27 +144,10 @@ class Tournaments(commands.Cog):
                     elif "Черный список" in message.content:
                         self.tournaments[category.name]["blacklist_msg"] = message
 
-    @commands.Cog.listener()
-    async def on_ready(self):
-        """При запуске бота синхронизируем каналы"""
-        for guild in self.bot.guilds:
-            await self.sync_tournament_channels(guild)
-            self.bot.loop.create_task(self.periodic_tournament_check())
-
-    async def periodic_tournament_check(self):
-        while True:
-            await asyncio.sleep(60)  # Проверка каждую минуту
-            for tour in list(self.active_tours.values()):
-                await tour.check_round_completion()
-
     async def check_blacklist(self, user_id):
         """Проверяет, находится ли пользователь в черном списке"""
-        result = db_manager.fetchone(
-            "players",
-            "SELECT isblacklisted FROM players WHERE discordid = ?",
-            (str(user_id),),
-        )
-        return result and result[0] == 1
+        player = player_cache.by_discordid(user_id)
+        return bool(player and player.isblacklisted == 1)
 
     async def update_all_blacklists(self):
         """Обновляет сообщения с черным списком во всех турнирах"""
@@ -248,7 +253,7 @@ class Tournaments(commands.Cog):
             "matches",
             """SELECT matchid FROM matches 
             WHERE tournament_id = ? AND isover = 0""",
-            (tournament_name,),
+            (tour._get_tournament_id(),),
         )
 
         if unfinished_matches:
@@ -313,6 +318,7 @@ class Tournaments(commands.Cog):
             participants=tournament["participants"],  # Список ников
             slots=tournament["slots"],
             cog=self,
+            tournament_id=tournament["id"],
         )
 
         # Помечаем турнир как начатый в базе
@@ -384,16 +390,18 @@ class Tournaments(commands.Cog):
             )
 
             # Обновляем статистику (без ELO для турнирных матчей)
-            db_manager.execute(
-                "players",
-                "UPDATE players SET wins = wins + 1 WHERE playername = ?",
-                (winner_name,),
-            )
-            db_manager.execute(
-                "players",
-                "UPDATE players SET losses = losses + 1 WHERE playername = ?",
-                (loser_name,),
-            )
+            with db_manager.transaction("players"):
+                db_manager.execute(
+                    "players",
+                    "UPDATE players SET wins = wins + 1 WHERE playername = ?",
+                    (winner_name,),
+                )
+                db_manager.execute(
+                    "players",
+                    "UPDATE players SET losses = losses + 1 WHERE playername = ?",
+                    (loser_name,),
+                )
+            leaderboard.bump()
 
             # Отправляем подтверждение
             embed = discord.Embed(
@@ -406,19 +414,18 @@ class Tournaments(commands.Cog):
             embed.add_field(name="Счет", value=f"{score1}-{score2}", inline=False)
             await ctx.send(embed=embed)
 
-            # Обновляем турнирный прогресс
-            if tournament_name in self.active_tours:
-                await self.active_tours[tournament_name].check_round_completion()
-            else:
-                # Попробуем найти турнир по имени, если не нашли по ID
-                for tour_name, tour in self.active_tours.items():
-                    if any(m["id"] == match_id for m in tour.matches):
-                        await tour.check_round_completion()
-                        break
+            # Обновляем турнирный прогресс: тур получает результат через
+            # событие (await - сообщение в results уходит после продвижения)
+            await events.publish(
+                MATCH_FINISHED,
+                match_id=match_id,
+                player1_score=score1,
+                player2_score=score2,
+            )
 
             # Отправляем результат в канал результатов турнира
-            results_channel = discord.utils.get(
-                ctx.guild.channels, name=f"{tournament_name}✨﹒results"
+            results_channel = channel_registry.by_name(
+                f"{tournament_name}✨﹒results", ctx.guild
             )
             if results_channel:
                 result_embed = discord.Embed(
@@ -452,8 +459,7 @@ class Tournaments(commands.Cog):
                     "matches",
                     """
                     SELECT 1 FROM matches 
-                    WHERE (player1 = ? OR player2 = ?) 
-                    AND isover = 0 
+                    WHERE ((player1 = ? AND isover = 0) OR (player2 = ? AND isover = 0))
                     AND matchtype = 2
                     """,
                     (p["name"], p["name"]),
@@ -462,12 +468,8 @@ class Tournaments(commands.Cog):
                 if active_tournament_match:
                     continue  # Пропускаем игрока, если он уже в турнирном матче
 
-                rating = db_manager.fetchone(
-                    "players",
-                    "SELECT currentelo FROM players WHERE discordid = ?",
-                    (str(p["id"]),),
-                )
-                rating = rating[0] if rating else 1000
+                player = player_cache.by_discordid(p["id"])
+                rating = player.currentelo if player else 1000
 
             rated_participants.append((rating, p))
 
@@ -491,11 +493,7 @@ class Tournaments(commands.Cog):
                 "discord_id": player1["id"],
                 "nickname": player1["name"],
                 "rating": (
-                    db_manager.fetchone(
-                        "players",
-                        "SELECT currentelo FROM players WHERE discordid = ?",
-                        (str(player1["id"]),),
-                    )[0]
+                    player_cache.by_discordid(player1["id"]).currentelo
                     if player1["id"] != 0
                     else 0
                 ),
@@ -507,11 +505,7 @@ class Tournaments(commands.Cog):
                 "discord_id": player2["id"],
                 "nickname": player2["name"],
                 "rating": (
-                    db_manager.fetchone(
-                        "players",
-                        "SELECT currentelo FROM players WHERE discordid = ?",
-                        (str(player2["id"]),),
-                    )[0]
+                    player_cache.by_discordid(player2["id"]).currentelo
                     if player2["id"] != 0
                     else 0
                 ),
@@ -611,6 +605,7 @@ class Tournaments(commands.Cog):
             "UPDATE players SET isblacklisted = 1 WHERE discordid = ?",
             (str(member.id),),
         )
+        player_cache.update(discordid=member.id, isblacklisted=1)
 
         # Удаляем из всех текущих турниров
         for name, tournament in self.tournaments.items():
@@ -656,6 +651,7 @@ class Tournaments(commands.Cog):
             "UPDATE players SET isblacklisted = 0 WHERE discordid = ?",
             (str(member.id),),
         )
+        player_cache.update(discordid=member.id, isblacklisted=0)
 
         # Снимаем бан в текущем турнире
         if ctx.channel.category and ctx.channel.category.name in self.tournaments:
@@ -712,11 +708,7 @@ class Tournaments(commands.Cog):
         # Получаем ник игрока
         player_name = None
         if self.is_user_verified(user.id):
-            player_name = db_manager.fetchone(
-                "players",
-                "SELECT playername FROM players WHERE discordid = ?",
-                (str(user.id),),
-            )[0]
+            player_name = player_cache.by_discordid(user.id).playername
 
         if not player_name:
             return
@@ -846,11 +838,7 @@ class Tournaments(commands.Cog):
         # Проверка условий
         player_name = None
         if self.is_user_verified(user.id):
-            player_name = db_manager.fetchone(
-                "players",
-                "SELECT playername FROM players WHERE discordid = ?",
-                (str(user.id),),
-            )[0]
+            player_name = player_cache.by_discordid(user.id).playername
 
         checks = {
             "not_in_db": not player_name,
@@ -892,21 +880,12 @@ class Tournaments(commands.Cog):
 
     def is_user_verified(self, user_id):
         """Проверяет, есть ли игрок в базе (независимо от бана)"""
-        result = db_manager.fetchone(
-            "players",
-            "SELECT 1 FROM players WHERE discordid = ?",
-            (str(user_id),),
-        )
-        return result is not None
+        return player_cache.by_discordid(user_id) is not None
 
     def is_user_globally_banned(self, user_id):
         """Проверяет глобальный бан игрока"""
-        result = db_manager.fetchone(
-            "players",
-            "SELECT isbanned FROM players WHERE discordid = ?",
-            (str(user_id),),
-        )
-        return result and result[0] == 1
+        player = player_cache.by_discordid(user_id)
+        return bool(player and player.isbanned == 1)
 
     async def is_active_tournament_match(self, match_id):
         """Проверяет, принадлежит ли матч активному турниру"""
@@ -0,0 +1,99 @@
+"""Кеш объектов пользователей Discord вместо fetch_user на каждый вызов."""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("user_cache")
+
+
+class UserResolver:
+    """Получение пользователя по ID: кеш gateway -> свой TTL/LRU кеш -> API.
+
+    bot.get_user() знает только пользователей с общими серверами; остальных
+    (а без intents.members - почти всех) приходится запрашивать через
+    fetch_user. Ответы API хранятся не дольше ttl секунд, в кеше не больше
+    maxsize пользователей. Одновременные запросы одного ID ждут один
+    и тот же запрос к API. Ошибки fetch_user (NotFound и т.п.) пробрасываются.
+    """
+
+    def __init__(self, maxsize=2000, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._bot = None
+        self._users = OrderedDict()  # user_id -> (user, время загрузки)
+        self._inflight = {}  # user_id -> Future запроса к API
+        self.gateway_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+
+    def attach(self, bot):
+        self._bot = bot
+
+    async def fetch(self, user_id):
+        """Возвращает пользователя, обращаясь к API только при промахе"""
+        user_id = int(user_id)
+        user = self._bot.get_user(user_id)
+        if user is not None:
+            self.gateway_hits += 1
+            return user
+
+        cached = self._users.get(user_id)
+        if cached is not None:
+            user, loaded_at = cached
+            if time.monotonic() - loaded_at < self.ttl:
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return user
+            del self._users[user_id]
+
+        inflight = self._inflight.get(user_id)
+        if inflight is not None:
+            self.deduplicated += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            user = await self._bot.fetch_user(user_id)
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим, само future никто не читает
+            future.exception()
+            raise
+        else:
+            future.set_result(user)
+            self._store(user_id, user)
+            return user
+        finally:
+            del self._inflight[user_id]
+
+    def _store(self, user_id, user):
+        self._users[user_id] = (user, time.monotonic())
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.maxsize:
+            self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        self._users.pop(int(user_id), None)
+
+    def clear(self):
+        self._users.clear()
+
+    def stats(self):
+        """Счетчики: gateway, попадания в свой кеш, запросы к API, склеенные запросы"""
+        total = self.gateway_hits + self.hits + self.misses + self.deduplicated
+        return {
+            "gateway_hits": self.gateway_hits,
+            "hits": self.hits,
+            "misses": self.misses,
+            "deduplicated": self.deduplicated,
+            "hit_rate": (total - self.misses) / total if total else 0.0,
+            "cached": len(self._users),
+        }
+
+
+user_resolver = UserResolver()
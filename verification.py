@@ -1,6 +1,11 @@
 import discord
 from discord.ui import View, Button
 from db_manager import db_manager
+from player_cache import player_cache
+from leaderboard import leaderboard
+from nickname_updater import nickname_sync
+from user_cache import user_resolver
+from channel_registry import channel_registry
 import logging
 from role_manager import assign_role  # Импорт функции выдачи роли
 from config import MODERATOR_ID
@@ -54,6 +59,18 @@ class VerifyView(View):
                     0,  # isbanned
                 ),
             )
+            # Сбрасываем отметку "игрока нет", закешированную до верификации
+            player_cache.invalidate(
+                playername=self.player_nickname, discordid=discord_user.id
+            )
+            leaderboard.update(
+                self.player_nickname,
+                currentelo=1000,
+                elo_station5f=1000,
+                elo_mots=1000,
+                elo_12min=1000,
+            )
+            nickname_sync.mark(discord_user.id)
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления игрока: {e}")
@@ -62,7 +79,7 @@ class VerifyView(View):
     async def send_result(self, guild, user_to_verify, success: bool):
         """Отправляет результат верификации в канал логов"""
         try:
-            logs_channel = discord.utils.get(guild.text_channels, name="elobot-logs")
+            logs_channel = channel_registry.get("logs", guild)
             if not logs_channel:
                 logger.warning(f"Канал 'elobot-logs' не найден на сервере {guild.name}")
                 return
@@ -106,9 +123,7 @@ class VerifyView(View):
             return
 
         try:
-            verify_channel = discord.utils.get(
-                guild.text_channels, name="elobot-verify"
-            )
+            verify_channel = channel_registry.get("verify", guild)
             verify_message = await verify_channel.fetch_message(self.verify_message_id)
             user_to_verify = verify_message.author
 
@@ -142,9 +157,7 @@ class VerifyView(View):
             return
 
         try:
-            verify_channel = discord.utils.get(
-                guild.text_channels, name="elobot-verify"
-            )
+            verify_channel = channel_registry.get("verify", guild)
             verify_message = await verify_channel.fetch_message(self.verify_message_id)
             user_to_verify = verify_message.author
 
@@ -197,9 +210,7 @@ def setup(bot):
             try:
                 # Проверка 1: Наличие скриншота
                 if not message.attachments:
-                    logs_channel = discord.utils.get(
-                        message.guild.text_channels, name="elobot-logs"
-                    )
+                    logs_channel = channel_registry.get("logs", message.guild)
                     if logs_channel:
                         embed = discord.Embed(
                             title="❌ Верификация отклонена (автоматически)",
@@ -215,14 +226,8 @@ def setup(bot):
                     return
 
                 # Проверка 2: Существующий Discord ID
-                if db_manager.execute(
-                    "players",
-                    "SELECT 1 FROM players WHERE discordid = ?",
-                    (str(message.author.id),),
-                ).fetchone():
-                    logs_channel = discord.utils.get(
-                        message.guild.text_channels, name="elobot-logs"
-                    )
+                if player_cache.by_discordid(message.author.id):
+                    logs_channel = channel_registry.get("logs", message.guild)
                     if logs_channel:
                         embed = discord.Embed(
                             title="❌ Верификация отклонена (автоматически)",
@@ -238,14 +243,8 @@ def setup(bot):
                     return
 
                 # Проверка 3: Существующее имя игрока
-                if db_manager.execute(
-                    "players",
-                    "SELECT 1 FROM players WHERE playername = ?",
-                    (message.content.strip(),),
-                ).fetchone():
-                    logs_channel = discord.utils.get(
-                        message.guild.text_channels, name="elobot-logs"
-                    )
+                if player_cache.by_name(message.content.strip()):
+                    logs_channel = channel_registry.get("logs", message.guild)
                     if logs_channel:
                         embed = discord.Embed(
                             title="❌ Верификация отклонена (автоматически)",
@@ -261,7 +260,7 @@ def setup(bot):
                     return
 
                 # Если все проверки пройдены - отправляем модератору
-                moderator = await bot.fetch_user(
+                moderator = await user_resolver.fetch(
                     MODERATOR_ID
                 )  # Замените на ID модератора
                 embed = discord.Embed(
@@ -286,9 +285,7 @@ def setup(bot):
             except Exception as e:
                 logger.error(f"Ошибка обработки верификации: {e}")
                 try:
-                    logs_channel = discord.utils.get(
-                        message.guild.text_channels, name="elobot-logs"
-                    )
+                    logs_channel = channel_registry.get("logs", message.guild)
                     if logs_channel:
                         await logs_channel.send(
                             f"⚠️ Ошибка при обработке верификации: {str(e)}"